@@ -0,0 +1,113 @@
+"""Lazy, fork-safe MongoDB connection for MongoEngine.
+
+Settings only register the connection. MongoEngine creates the MongoClient
+on first use in each process, and a client inherited through fork (e.g.
+``gunicorn --preload``) is dropped in the child, so every worker opens its own
+pool instead of sharing sockets with its parent.
+
+The async views use a pymongo AsyncMongoClient built from the same settings,
+likewise created lazily and dropped after a fork.
+"""
+import asyncio
+import os
+
+from mongoengine import DEFAULT_CONNECTION_NAME, Document, register_connection
+from mongoengine import connection as mongo_connection
+from mongoengine.base.common import _document_registry
+from pymongo import AsyncMongoClient
+from pymongo.read_preferences import Nearest, Primary, PrimaryPreferred, Secondary, SecondaryPreferred
+
+# Read preference modes by their connection string names
+READ_PREFERENCES = {
+    'primary': Primary,
+    'primaryPreferred': PrimaryPreferred,
+    'secondary': Secondary,
+    'secondaryPreferred': SecondaryPreferred,
+    'nearest': Nearest,
+}
+
+# alias -> (db, host, options) for the async clients
+_async_settings = {}
+
+# alias -> (event loop, async database) of this process
+_async_dbs = {}
+
+
+def configure_mongodb(db, host, alias=DEFAULT_CONNECTION_NAME, **options):
+    """Register connection settings without opening a connection."""
+    options = {key: value for key, value in options.items() if value is not None}
+    register_connection(alias, db=db, host=host, connect=False, **options)
+    _async_settings[alias] = (db, host, options)
+
+
+def get_async_db(alias=DEFAULT_CONNECTION_NAME):
+    """Database of this process's AsyncMongoClient, created on first use.
+
+    An async client belongs to the event loop it is first used on. An ASGI
+    worker runs a single loop, so it gets one pool; a client of another loop
+    is replaced rather than shared.
+    """
+    loop = asyncio.get_running_loop()
+    cached = _async_dbs.get(alias)
+    if cached is None or cached[0] is not loop:
+        db, host, options = _async_settings[alias]
+        cached = _async_dbs[alias] = (loop, AsyncMongoClient(host, **options)[db])
+    return cached[1]
+
+
+def async_collection(document, read_preference=None):
+    """Async collection of a Document class, optionally read with another read preference.
+
+    Indexes are not ensured here; warm_up() creates them when a worker starts.
+    """
+    alias = document._meta.get('db_alias', DEFAULT_CONNECTION_NAME)
+    collection = get_async_db(alias)[document._get_collection_name()]
+    if read_preference is not None:
+        collection = collection.with_options(read_preference=read_preference)
+    return collection
+
+
+def read_preference(mode, max_staleness=None):
+    """pymongo read preference for a mode named as in connection strings.
+
+    ``max_staleness`` is maxStalenessSeconds; MongoDB requires at least 90,
+    and the primary mode takes none. Raises ValueError for a bad setting.
+    """
+    try:
+        preference = READ_PREFERENCES[mode]
+    except KeyError:
+        raise ValueError(f"Unknown read preference: {mode!r}")
+    if preference is Primary:
+        if max_staleness is not None:
+            raise ValueError("maxStalenessSeconds cannot be used with the primary read preference")
+        return Primary()
+    return preference(max_staleness=-1 if max_staleness is None else max_staleness)
+
+
+def _forget_inherited_clients():
+    # Unlike mongoengine.disconnect() this neither closes the parent's client
+    # nor forgets the settings; the child just builds a fresh client on demand
+    mongo_connection._connections.clear()
+    mongo_connection._dbs.clear()
+    _async_dbs.clear()
+    for document in _document_registry.values():
+        if issubclass(document, Document):
+            document._collection = None
+
+
+os.register_at_fork(after_in_child=_forget_inherited_clients)
+
+
+def warm_up(alias=DEFAULT_CONNECTION_NAME):
+    """Connect, check the server answers and create indexes before serving traffic.
+
+    Raises a pymongo error if the server cannot be reached.
+    """
+    db = mongo_connection.get_db(alias)
+    db.client.admin.command('ping')
+    for document in _document_registry.values():
+        if not issubclass(document, Document) or document._meta.get('abstract'):
+            continue
+        if document._meta.get('db_alias', DEFAULT_CONNECTION_NAME) == alias:
+            # The first collection access also ensures the declared indexes
+            document._get_collection()
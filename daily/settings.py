@@ -64,6 +64,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # First, so the session and auth queries of every request are counted
+    'logs.metrics.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware', 
     'whitenoise.middleware.WhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -78,7 +80,8 @@ ROOT_URLCONF = 'daily.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates, timing renders for logs.metrics
+        'BACKEND': 'logs.metrics.TimedDjangoTemplates',
         'DIRS': [],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -105,22 +108,74 @@ DATABASES = {
 }
 
 # MongoDB connection
-from mongoengine import connect
+from daily.mongo import configure_mongodb, read_preference
 
 MONGODB_NAME = config('MONGODB_NAME')
 MONGODB_HOST = config('MONGODB_URI')
 
 
-try:
-    connect(
-        db=MONGODB_NAME,
-        host=MONGODB_HOST,
-        retryWrites=True,
-        w='majority'
-    )
-    print("MongoDB connected successfully!")
-except Exception as e:
-    print(f"MongoDB connection error: {e}")
+def _write_concern(value):
+    # Either a node count or a tag such as 'majority'
+    return int(value) if value.isdigit() else value
+
+
+def _optional_int(value):
+    return int(value) if value not in (None, '') else None
+
+
+# MongoClient options. Unset values fall back to pymongo's defaults.
+MONGODB_OPTIONS = {
+    'maxPoolSize': config('MONGODB_MAX_POOL_SIZE', default=100, cast=int),
+    'minPoolSize': config('MONGODB_MIN_POOL_SIZE', default=0, cast=int),
+    'maxIdleTimeMS': config('MONGODB_MAX_IDLE_TIME_MS', default=None, cast=_optional_int),
+    'serverSelectionTimeoutMS': config('MONGODB_SERVER_SELECTION_TIMEOUT_MS', default=30000, cast=int),
+    'retryWrites': config('MONGODB_RETRY_WRITES', default=True, cast=bool),
+    'w': config('MONGODB_WRITE_CONCERN', default='majority', cast=_write_concern),
+    'wTimeoutMS': config('MONGODB_WRITE_TIMEOUT_MS', default=None, cast=_optional_int),
+}
+
+# The client is created lazily in each process, after any fork
+configure_mongodb(MONGODB_NAME, MONGODB_HOST, **MONGODB_OPTIONS)
+
+# Read preference of the admin dashboard and export scans, e.g. 'secondaryPreferred'
+# to keep them off the primary. Writes and a staff member's own day always read
+# from the primary. MONGODB_MAX_STALENESS_SECONDS (90 or more) skips secondaries
+# lagging further behind.
+REPORT_READ_PREFERENCE = read_preference(
+    config('MONGODB_REPORT_READ_PREFERENCE', default='primary'),
+    config('MONGODB_MAX_STALENESS_SECONDS', default=None, cast=_optional_int),
+)
+
+# Cache shared by every worker on the host, so an invalidation in one worker
+# is seen by the others
+CACHES = {
+    'default': {
+        'BACKEND': config('CACHE_BACKEND', default='django.core.cache.backends.filebased.FileBasedCache'),
+        'LOCATION': config('CACHE_LOCATION', default=os.path.join(BASE_DIR, '.cache')),
+    }
+}
+
+# Sessions and signed-in users, kept out of SQLite so a signed-in request
+# makes no SQLite query. The file cache is shared by the workers of a host;
+# local memory only suits a single worker. Culling evicts sessions, so the
+# entry limit is kept well above the number of staff
+CACHES['sessions'] = {
+    'BACKEND': config('SESSION_CACHE_BACKEND', default='django.core.cache.backends.filebased.FileBasedCache'),
+    'LOCATION': config('SESSION_CACHE_LOCATION', default=os.path.join(BASE_DIR, '.sessions')),
+    'OPTIONS': {'MAX_ENTRIES': config('SESSION_CACHE_MAX_ENTRIES', default=100000, cast=int)},
+}
+SESSION_CACHE_ALIAS = 'sessions'
+# 'logs.sessions' stores sessions in MongoDB instead, shared by every instance
+SESSION_ENGINE = config('SESSION_ENGINE', default='django.contrib.sessions.backends.cache')
+# Seconds a signed-in user is served from the sessions cache; saving or
+# deleting the user drops it sooner
+AUTH_USER_CACHE_TTL = config('AUTH_USER_CACHE_TTL', default=300, cast=int)
+
+# Seconds a user's day view stays cached; past days are read-only
+DAY_CACHE_TTL = config('DAY_CACHE_TTL', default=300, cast=int)
+DAY_CACHE_PAST_TTL = config('DAY_CACHE_PAST_TTL', default=7 * 24 * 3600, cast=int)
+# Seconds browsers may reuse a past day's page or export without revalidating
+PAST_DAY_MAX_AGE = config('PAST_DAY_MAX_AGE', default=24 * 3600, cast=int)
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -141,6 +196,26 @@ AUTH_PASSWORD_VALIDATORS = [
 ]
 
 
+AUTHENTICATION_BACKENDS = [
+    # Staff sign in with their ID card, checked directly against MongoDB
+    'logs.backends.MongoEmployeeBackend',
+    # ModelBackend, with the signed-in user cached like the staff backend's
+    'logs.backends.CachedModelBackend',
+]
+
+PASSWORD_HASHERS = [
+    'logs.hashers.TunablePBKDF2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'django.contrib.auth.hashers.Argon2PasswordHasher',
+    'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+    'django.contrib.auth.hashers.ScryptPasswordHasher',
+]
+
+# PBKDF2 cost of password hashes; 0 uses Django's default. Existing
+# hashes are upgraded or downgraded to it on the next successful login.
+PASSWORD_HASH_ITERATIONS = config('PASSWORD_HASH_ITERATIONS', default=0, cast=int)
+
+
 # Internationalization
 # https://docs.djangoproject.com/en/5.2/topics/i18n/
 
@@ -172,4 +247,40 @@ WHITENOISE_ROOT = STATIC_ROOT
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
-LOGIN_URL = '/logs/login/'
\ No newline at end of file
+LOGIN_URL = '/logs/login/'
+
+# Rows per page of the admin dashboard log table
+DASHBOARD_PAGE_SIZE = config('DASHBOARD_PAGE_SIZE', default=50, cast=int)
+DASHBOARD_MAX_PAGE_SIZE = config('DASHBOARD_MAX_PAGE_SIZE', default=500, cast=int)
+
+# Background export jobs
+EXPORT_JOBS_DIR = config('EXPORT_JOBS_DIR', default=os.path.join(BASE_DIR, 'export_jobs'))
+EXPORT_JOB_WORKERS = config('EXPORT_JOB_WORKERS', default=2, cast=int)
+# Seconds a finished export stays downloadable before it is deleted
+EXPORT_JOB_TTL = config('EXPORT_JOB_TTL', default=3600, cast=int)
+
+# Cold storage of old logs; see logs.archive
+ARCHIVE_DIR = config('ARCHIVE_DIR', default=os.path.join(BASE_DIR, 'archive'))
+# Whole months older than this many days are moved out of MongoDB by archive_logs
+ARCHIVE_AFTER_DAYS = config('ARCHIVE_AFTER_DAYS', default=365, cast=int)
+
+# 'wsgi' serves the sync views from gunicorn's sync workers; 'asgi' serves the
+# async views of logs.async_views from uvicorn workers. Read by gunicorn.conf.py too
+SERVER_MODE = config('SERVER_MODE', default='wsgi')
+
+# Per-request timings; see logs.metrics. SERVER_TIMING adds a Server-Timing
+# header to every response, which shows in the browser's network panel
+SERVER_TIMING = config('SERVER_TIMING', default=DEBUG, cast=bool)
+# Bearer token a Prometheus scraper sends to /metrics/; staff can always read it
+METRICS_TOKEN = config('METRICS_TOKEN', default='')
+
+# Mongo operations slower than this many milliseconds are recorded with their
+# query shape and plan; see logs.slowlog. 0 turns the capture off
+SLOW_QUERY_MS = config('SLOW_QUERY_MS', default=200, cast=int)
+SLOW_QUERY_EXPLAIN = config('SLOW_QUERY_EXPLAIN', default=True, cast=bool)
+# Seconds before the same query shape is explained again
+SLOW_QUERY_EXPLAIN_INTERVAL = config('SLOW_QUERY_EXPLAIN_INTERVAL', default=300, cast=int)
+# Records go to a capped collection of this size, or to a file shared by the
+# workers when SLOW_QUERY_LOG_FILE is set; rotate that file with logrotate
+SLOW_QUERY_CAPPED_BYTES = config('SLOW_QUERY_CAPPED_BYTES', default=16 * 1024 * 1024, cast=int)
+SLOW_QUERY_LOG_FILE = config('SLOW_QUERY_LOG_FILE', default='')
@@ -14,18 +14,31 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+from django.conf import settings
 from django.contrib import admin
 from django.urls import path
-from logs import views
+from logs import async_views, views
+
+# Under an ASGI server the Mongo-heavy pages run on the event loop
+pages = async_views if settings.SERVER_MODE == 'asgi' else views
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('', views.login_view, name='login'),
     path('logs/login/', views.login_view, name='login'),
     path('logout/', views.logout_view, name='logout'),
-    path('daily_log/', views.daily_log_view, name='daily_log'),
-    path('admin_dashboard/', views.admin_dashboard, name='admin_dashboard'),
-    path('export_logs_excel/', views.export_logs_excel, name='export_logs_excel'),
-    path('export_staff_logs/', views.export_staff_logs, name='export_staff_logs'),
+    path('daily_log/', pages.daily_log_view, name='daily_log'),
+    path('daily_log/bulk/', views.save_logs_view, name='save_logs'),
+    path('admin_dashboard/', pages.admin_dashboard, name='admin_dashboard'),
+    path('export_logs_excel/', pages.export_logs_excel, name='export_logs_excel'),
+    path('export_staff_logs/', pages.export_staff_logs, name='export_staff_logs'),
     path('add_staff/', views.add_staff, name='add_staff'),
+    path('ready/', views.readiness, name='readiness'),
+    path('cache_stats/', views.day_cache_stats_view, name='day_cache_stats'),
+    path('metrics/', views.metrics_view, name='metrics'),
+    path('daily_summary/', views.daily_summary_view, name='daily_summary'),
+    path('search/', views.search_view, name='search'),
+    path('export_jobs/', views.submit_export_job, name='submit_export_job'),
+    path('export_jobs/<str:job_id>/', views.export_job_status, name='export_job_status'),
+    path('export_jobs/<str:job_id>/download/', pages.download_export_job, name='download_export_job'),
 ]
@@ -0,0 +1,22 @@
+# Picked up automatically by gunicorn when started from the project root
+from decouple import config
+
+preload_app = config('GUNICORN_PRELOAD', default=False, cast=bool)
+
+# SERVER_MODE=asgi runs the async views (see logs.async_views) on uvicorn workers
+if config('SERVER_MODE', default='wsgi') == 'asgi':
+    wsgi_app = 'daily.asgi:application'
+    worker_class = 'uvicorn_worker.UvicornWorker'
+else:
+    wsgi_app = 'daily.wsgi:application'
+
+
+def post_worker_init(worker):
+    # Open this worker's MongoDB pool and create indexes before it accepts
+    # requests, so the first visitors don't pay for the connection
+    from daily.mongo import warm_up
+
+    try:
+        warm_up()
+    except Exception as e:
+        worker.log.warning("MongoDB warm-up failed: %s", e)
@@ -4,3 +4,22 @@ from django.apps import AppConfig
 class LogsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'logs'
+
+    def ready(self):
+        from django.conf import settings
+        from django.contrib.auth.models import User
+        from django.db.backends.signals import connection_created
+        from django.db.models.signals import post_delete, post_save
+        from pymongo import monitoring
+
+        from logs.backends import forget_user
+        from logs.metrics import MongoCommandTimer, instrument_connection
+        from logs.slowlog import SlowQueryListener
+
+        # Clients are created lazily, after this, so they all pick these up
+        monitoring.register(MongoCommandTimer())
+        if settings.SLOW_QUERY_MS:
+            monitoring.register(SlowQueryListener(settings.SLOW_QUERY_MS))
+        connection_created.connect(instrument_connection)
+        post_save.connect(forget_user, sender=User)
+        post_delete.connect(forget_user, sender=User)
@@ -0,0 +1,238 @@
+"""Cold storage for old logs.
+
+Logs of whole months older than ``settings.ARCHIVE_AFTER_DAYS`` are moved out
+of ``logs_dailylog`` into one gzipped NDJSON file per month under
+``settings.ARCHIVE_DIR``, described by ``manifest.json``. Past days cannot be
+edited, so the files never change once written, except when logs for an
+archived month turn up again (e.g. a late import) and are merged in by the
+next run. Days before the manifest's ``horizon`` are cold; readers take their
+logs from here as well as from the collection, and a month is made cold
+before its logs leave the collection, so nothing is lost while a run is in
+progress.
+
+Each day of a month file is its own gzip member, and the manifest records
+where each one starts, so a reader decompresses only the days it needs, a
+line at a time, in either order.
+"""
+import datetime
+import gzip
+import hashlib
+import itertools
+import json
+import os
+import zlib
+
+from bson import json_util
+from django.conf import settings
+
+from logs.days import day_key
+from logs.mongo_models import DailyLog
+
+MANIFEST_NAME = 'manifest.json'
+
+# Logs deleted from the collection per delete_many once their month is on disk
+DELETE_BATCH_SIZE = 1000
+
+# Compressed bytes read at a time from a month file
+READ_CHUNK_SIZE = 64 * 1024
+
+
+def _path(name, create=False):
+    if create:
+        os.makedirs(settings.ARCHIVE_DIR, exist_ok=True)
+    return os.path.join(settings.ARCHIVE_DIR, name)
+
+
+def month_of(day):
+    """'YYYY-MM' of a day key."""
+    return f"{day // 10000:04d}-{day // 100 % 100:02d}"
+
+
+def month_days(month):
+    """First and last possible day keys of a 'YYYY-MM' month."""
+    first = int(month.replace('-', '')) * 100 + 1
+    return first, first + 30
+
+
+def horizon_for(today, after_days):
+    """Day key before which whole months are old enough to archive."""
+    cutoff = today - datetime.timedelta(days=after_days)
+    return day_key(cutoff.replace(day=1))
+
+
+def read_manifest():
+    try:
+        with open(_path(MANIFEST_NAME)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {'horizon': None, 'months': {}}
+
+
+def _write_manifest(manifest):
+    tmp = _path(f"{MANIFEST_NAME}.tmp", create=True)
+    with open(tmp, 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, _path(MANIFEST_NAME))
+
+
+def is_cold(day, manifest=None):
+    horizon = (manifest or read_manifest())['horizon']
+    return horizon is not None and day < horizon
+
+
+def _sort_key(doc):
+    # Dashboard order, but oldest day first; a missing slot sorts first like null does
+    slot = doc.get('slot')
+    return doc.get('day') or 0, -1 if slot is None else slot, doc['_id']
+
+
+def _decoded(lines):
+    for line in lines:
+        if line.strip():
+            yield json_util.loads(line)
+
+
+def _member_lines(path, offset, length):
+    """Lines of the gzip member at ``offset``, decompressed a chunk at a time."""
+    decompressor = zlib.decompressobj(zlib.MAX_WBITS | 16)
+    pending = b''
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        while length > 0:
+            chunk = f.read(min(READ_CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            pending += decompressor.decompress(chunk)
+            *lines, pending = pending.split(b'\n')
+            yield from lines
+    pending += decompressor.flush()
+    if pending:
+        yield pending
+
+
+def month_rows(month, manifest=None, first_day=None, last_day=None, newest_first=False):
+    """Archived logs of a month between two day keys as raw dicts, streamed from its file.
+
+    Rows come in (day, slot, _id) order, or with the newest day first when
+    ``newest_first``; within a day they are always in (slot, _id) order.
+    """
+    entry = (manifest or read_manifest())['months'].get(month)
+    if not entry:
+        return
+    path = _path(entry['file'])
+    for day in sorted(entry['days'], key=int, reverse=newest_first):
+        if first_day and int(day) < first_day or last_day and int(day) > last_day:
+            continue
+        offset, length = entry['days'][day]
+        yield from _decoded(_member_lines(path, offset, length))
+
+
+def archived_rows(first_day=None, last_day=None, employee=None, newest_first=False):
+    """Raw archived logs between two day keys, inclusive, month by month."""
+    manifest = read_manifest()
+    months = sorted(manifest['months'], reverse=newest_first)
+    for month in months:
+        month_first, month_last = month_days(month)
+        if (first_day and month_last < first_day) or (last_day and month_first > last_day):
+            continue
+        for doc in month_rows(month, manifest, first_day, last_day, newest_first):
+            if employee is not None and doc.get('employee') != employee:
+                continue
+            yield doc
+
+
+def archive_version(first_day=None, last_day=None):
+    """Checksums of the archived months overlapping a day range; they change if a month is rewritten."""
+    versions = []
+    for month, entry in sorted(read_manifest()['months'].items()):
+        month_first, month_last = month_days(month)
+        if (first_day and month_last < first_day) or (last_day and month_first > last_day):
+            continue
+        versions.append(entry['sha256'])
+    return versions
+
+
+def archive_month(month, manifest):
+    """Move one month of logs from the collection into its file; returns the logs moved."""
+    first_day, last_day = month_days(month)
+    collection = DailyLog._get_collection()
+    hot = list(collection.find({'day': {'$gte': first_day, '$lte': last_day}}))
+    if not hot:
+        return 0
+
+    # Merge with what an earlier run archived; a log is kept once, by _id
+    rows = {doc['_id']: doc for doc in month_rows(month, manifest)}
+    rows.update((doc['_id'], doc) for doc in hot)
+    rows = sorted(rows.values(), key=_sort_key)
+
+    name = f"{month}.ndjson.gz"
+    sha256, days = write_month_file(name, rows)
+    manifest['months'][month] = {
+        'file': name,
+        'count': len(rows),
+        'first_day': rows[0]['day'],
+        'last_day': rows[-1]['day'],
+        'days': days,
+        'sha256': sha256,
+        'archived_at': datetime.datetime.utcnow().isoformat(),
+    }
+    # Readers must take the month from its file before it leaves the collection
+    cold_until = last_day + 1
+    if manifest['horizon'] is None or cold_until > manifest['horizon']:
+        manifest['horizon'] = cold_until
+    _write_manifest(manifest)
+
+    # Only now that the month is safely on disk do the logs leave the collection
+    ids = [doc['_id'] for doc in hot]
+    for start in range(0, len(ids), DELETE_BATCH_SIZE):
+        collection.delete_many({'_id': {'$in': ids[start:start + DELETE_BATCH_SIZE]}})
+    return len(hot)
+
+
+def write_month_file(name, rows):
+    """Write logs in (day, slot, _id) order as one gzip member per day.
+
+    Returns the checksum of the uncompressed lines and {day: [offset, length]}
+    of each day's member.
+    """
+    tmp = _path(f"{name}.tmp", create=True)
+    digest = hashlib.sha256()
+    days = {}
+    with open(tmp, 'wb') as raw:
+        for day, docs in itertools.groupby(rows, key=lambda doc: doc.get('day') or 0):
+            offset = raw.tell()
+            with gzip.GzipFile(fileobj=raw, mode='wb') as f:
+                for doc in docs:
+                    line = (json_util.dumps(doc, json_options=json_util.RELAXED_JSON_OPTIONS) + '\n').encode()
+                    digest.update(line)
+                    f.write(line)
+            days[str(day)] = [offset, raw.tell() - offset]
+        raw.flush()
+        os.fsync(raw.fileno())
+    os.replace(tmp, _path(name))
+    return digest.hexdigest(), days
+
+
+def months_before(horizon):
+    """Months that still have logs in the collection before a day key."""
+    pipeline = [
+        {'$match': {'day': {'$lt': horizon}}},
+        {'$group': {'_id': {'$floor': {'$divide': ['$day', 100]}}}},
+        {'$sort': {'_id': 1}},
+    ]
+    return [month_of(int(group['_id']) * 100 + 1) for group in DailyLog._get_collection().aggregate(pipeline)]
+
+
+def archive_before(horizon):
+    """Archive every month before a day key; returns {month: logs moved}."""
+    manifest = read_manifest()
+    moved = {}
+    for month in months_before(horizon):
+        moved[month] = archive_month(month, manifest)
+    if manifest['horizon'] is None or horizon > manifest['horizon']:
+        manifest['horizon'] = horizon
+        _write_manifest(manifest)
+    return moved
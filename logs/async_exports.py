@@ -0,0 +1,206 @@
+"""The admin and staff exports for the async views.
+
+Same sheets, files and rows as logs.exports, with the logs read through the
+async client. CSV and NDJSON are streamed from the event loop; a workbook
+is built by openpyxl in a worker thread that pulls its rows from the loop,
+and its file is read back a chunk at a time in worker threads.
+"""
+import asyncio
+import csv
+import json
+import os
+import zlib
+
+from django.conf import settings
+from django.http import StreamingHttpResponse
+
+from logs.async_queries import aemployee_for_id_card, alog_batches, alogs_stats
+from logs.days import day_key
+from logs.exports import (
+    ADMIN_HEADERS, EXPORT_FIELDS, STAFF_HEADERS, STREAM_CONTENT_TYPES, XLSX_CONTENT_TYPE, _Echo, admin_filename,
+    admin_row, all_past, export_filename, staff_days, staff_filename, staff_read_preference, staff_row, version_of,
+    write_xlsx,
+)
+from logs.metrics import timed
+from logs.mongo_models import User
+from logs.queries import staff_name
+
+# Bytes of a workbook file read per worker thread hop
+FILE_CHUNK_SIZE = 64 * 1024
+
+
+class AsyncExport:
+    """An Export whose ``batches`` is an async generator of lists of sheet rows.
+
+    ``version``, set only when every day covered is in the past, is a
+    coroutine function returning (last modified timestamp, version token).
+    """
+
+    def __init__(self, title, headers, filename, batches, auto_width=False, version=None):
+        self.title = title
+        self.headers = headers
+        self.filename = filename
+        self.batches = batches
+        self.auto_width = auto_width
+        self.version = version
+
+
+def _export(title, headers, filename, query, row, first_day, last_day, employee, names, read_preference,
+            auto_width=False):
+    async def batches():
+        # A query of None is an unknown staff member, which matches nothing
+        if query is None:
+            return
+        async for logs in alog_batches(
+            query, EXPORT_FIELDS, first_day, last_day, employee, names, read_preference=read_preference,
+        ):
+            yield [row(log) for log in logs]
+
+    async def version():
+        updated_at, count = await alogs_stats(query, read_preference)
+        return await asyncio.to_thread(version_of, updated_at, count, first_day, last_day)
+
+    past = query is not None and all_past(last_day)
+    return AsyncExport(title, headers, filename, batches, auto_width, version if past else None)
+
+
+async def aadmin_export(id_card='', date=''):
+    """admin_export() through the async client.
+
+    Raises ValueError if date is not a 'YYYY-MM-DD' string.
+    """
+    query = {}
+    employee = day = None
+    staff_name_for_filename = ""
+    if id_card:
+        mongo_user = await aemployee_for_id_card(id_card)
+        if mongo_user:
+            employee = query['employee'] = mongo_user['_id']
+            first_name, last_name = mongo_user.get('first_name'), mongo_user.get('last_name')
+            staff_name_for_filename = f"{first_name}_{last_name}" if first_name and last_name else mongo_user.get('username')
+        else:
+            query = None
+    if date:
+        day = day_key(date)
+        if query is not None:
+            query['day'] = day
+
+    return _export(
+        "Staff Logs", ADMIN_HEADERS, admin_filename(staff_name_for_filename, date),
+        query, admin_row, day, day, employee, names=True, read_preference=settings.REPORT_READ_PREFERENCE,
+    )
+
+
+def astaff_export(mongo_user, id_card_number, user_first_name, date='', start_date='', end_date=''):
+    """staff_export() for a Mongo user given as a raw dict.
+
+    Raises ValueError if a date is not a 'YYYY-MM-DD' string.
+    """
+    first_day, last_day = staff_days(date, start_date, end_date)
+    query = {'employee': mongo_user['_id']}
+    if first_day is not None:
+        query['day'] = {'$gte': first_day, '$lte': last_day}
+    name = staff_name(User._from_son(mongo_user))
+    return _export(
+        "My Daily Logs", STAFF_HEADERS, staff_filename(user_first_name, date, start_date, end_date),
+        query, staff_row(name, id_card_number), first_day, last_day, mongo_user['_id'], names=False,
+        read_preference=staff_read_preference(last_day), auto_width=True,
+    )
+
+
+async def alines(fmt, headers, batches):
+    """CSV or NDJSON text of an export, one chunk per batch of rows."""
+    if fmt == 'csv':
+        writer = csv.writer(_Echo())
+        line = writer.writerow
+        yield line(headers)
+    else:
+        keys = [header.lower().replace(' ', '_') for header in headers]
+
+        def line(row):
+            return json.dumps(dict(zip(keys, row)), ensure_ascii=False) + '\n'
+    async for rows in batches:
+        yield ''.join(line(row) for row in rows)
+
+
+async def agzipped(chunks):
+    """exports.gzipped() over an async stream of byte chunks."""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+    async for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+async def _encoded(lines):
+    async for text in lines:
+        yield text.encode()
+
+
+def astream_export(export, fmt, gzip=False):
+    """stream_export() of an AsyncExport; the response body is produced on the loop."""
+    chunks = _encoded(alines(fmt, export.headers, export.batches()))
+    if gzip:
+        chunks = agzipped(chunks)
+    response = StreamingHttpResponse(chunks, content_type=STREAM_CONTENT_TYPES[fmt])
+    if gzip:
+        response['Content-Encoding'] = 'gzip'
+    response['Content-Disposition'] = f'attachment; filename={export_filename(export, fmt)}'
+    return response
+
+
+async def _next_batch(batches):
+    return await anext(batches)
+
+
+def rows_from_loop(batches, loop):
+    """Rows of an async generator of batches, for a worker thread to iterate.
+
+    Each batch is read on the loop, which stays free for other requests while
+    the thread works through the rows.
+    """
+    while True:
+        try:
+            rows = asyncio.run_coroutine_threadsafe(_next_batch(batches), loop).result()
+        except StopAsyncIteration:
+            return
+        yield from rows
+
+
+async def awrite_export(export):
+    """write_export() of an AsyncExport, returning the finished workbook file."""
+    rows = rows_from_loop(export.batches(), asyncio.get_running_loop())
+    return await asyncio.to_thread(write_xlsx, export.title, export.headers, rows, auto_width=export.auto_width)
+
+
+async def afile_chunks(output, chunk_size=FILE_CHUNK_SIZE):
+    """Chunks of a file read in worker threads; the file is closed once read."""
+    try:
+        while chunk := await asyncio.to_thread(output.read, chunk_size):
+            yield chunk
+    finally:
+        await asyncio.to_thread(output.close)
+
+
+def axlsx_response(output, filename):
+    """xlsx_response() for the async views.
+
+    Django would read a FileResponse's file to the end in one go before
+    sending any of it under ASGI; this streams it instead.
+    """
+    size = output.seek(0, os.SEEK_END)
+    output.seek(0)
+    response = StreamingHttpResponse(afile_chunks(output), content_type=XLSX_CONTENT_TYPE)
+    response['Content-Length'] = str(size)
+    response['Content-Disposition'] = f'attachment; filename={filename}'
+    return response
+
+
+async def aexport_response(export, fmt='xlsx', gzip=False):
+    """export_response() of an AsyncExport."""
+    if fmt == 'xlsx':
+        with timed('export'):
+            output = await awrite_export(export)
+        return axlsx_response(output, export.filename)
+    return astream_export(export, fmt, gzip=gzip)
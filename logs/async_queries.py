@@ -0,0 +1,151 @@
+"""Reads of the async views, on the AsyncMongoClient.
+
+Each function issues the same query as its sync counterpart as a raw pymongo
+command awaited on the event loop, and hands the results to the same
+LogRow, cursor and day view helpers. Archive files are read in a worker
+thread so the loop never blocks on disk.
+"""
+import asyncio
+from itertools import islice
+
+from daily.mongo import async_collection
+from logs.archive import archived_rows, is_cold
+from logs.days import day_key
+from logs.mongo_models import DailyLog, EmployeeProfile, User
+from logs.queries import (
+    DEFAULT_PAGE_SIZE, EMPLOYEE_BATCH_SIZE, EMPLOYEE_FIELDS, LOG_FIELDS, PAGE_SORT, LogRow, day_view,
+    keyset_query, keyset_result, staff_name,
+)
+
+# Archived rows handed from the worker thread to the loop at a time
+ARCHIVE_BATCH_SIZE = 1000
+
+
+def _and(*queries):
+    queries = [query for query in queries if query]
+    return {'$and': queries} if len(queries) > 1 else (queries[0] if queries else {})
+
+
+async def aload_employees(user_ids, read_preference=None):
+    """load_employees() through the async client."""
+    ids = list(set(user_ids))
+    if not ids:
+        return {}
+    cursor = async_collection(User, read_preference).find({'_id': {'$in': ids}}, dict.fromkeys(EMPLOYEE_FIELDS, 1))
+    # Only name fields and no references, so building the documents costs no query
+    return {doc['_id']: User._from_son(doc) async for doc in cursor}
+
+
+async def aattach_staff_names(rows, read_preference=None):
+    employees = await aload_employees((row.employee for row in rows if row.employee), read_preference)
+    for row in rows:
+        row.staff_name = staff_name(employees.get(row.employee))
+    return rows
+
+
+async def alog_rows(query, sort, fields=LOG_FIELDS, limit=0, read_preference=None):
+    """LogRows of the logs matching a raw filter, holding only ``fields``."""
+    cursor = async_collection(DailyLog, read_preference).find(query, dict.fromkeys(fields, 1), sort=sort, limit=limit)
+    async for doc in cursor:
+        yield LogRow(doc)
+
+
+async def in_thread_batches(iterable, batch_size=ARCHIVE_BATCH_SIZE):
+    """Lists of items of a blocking iterable, each read in a worker thread."""
+    iterator = iter(iterable)
+    while batch := await asyncio.to_thread(lambda: list(islice(iterator, batch_size))):
+        yield batch
+
+
+async def aarchived_rows(first_day=None, last_day=None, employee=None, newest_first=False):
+    """archived_rows() as LogRows, read off the loop."""
+    rows = []
+    async for batch in in_thread_batches(archived_rows(first_day, last_day, employee, newest_first)):
+        rows.extend(LogRow(doc) for doc in batch)
+    return rows
+
+
+async def ais_cold(day):
+    return await asyncio.to_thread(is_cold, day)
+
+
+async def akeyset_page(query, after=None, before=None, page_size=DEFAULT_PAGE_SIZE, read_preference=None):
+    """keyset_page() over the logs matching a raw filter.
+
+    Raises ValueError for a malformed cursor.
+    """
+    seek, sort = keyset_query(after, before)
+    rows = [
+        row async for row in alog_rows(_and(query, seek), sort, limit=page_size + 1, read_preference=read_preference)
+    ]
+    page, next_cursor, prev_cursor = keyset_result(rows, after, before, page_size)
+    return await aattach_staff_names(page, read_preference), next_cursor, prev_cursor
+
+
+async def aemployee_for_id_card(id_card):
+    """Mongo user of the staff member holding an id card, as a raw dict, or None."""
+    profile = await async_collection(EmployeeProfile).find_one({'id_card_number': id_card}, {'user': 1})
+    if not profile:
+        return None
+    return await async_collection(User).find_one({'_id': profile['user']}, dict.fromkeys(EMPLOYEE_FIELDS, 1))
+
+
+async def auser_by_username(username):
+    return await async_collection(User).find_one({'username': username}, dict.fromkeys(EMPLOYEE_FIELDS, 1))
+
+
+async def aid_card_number(user_id):
+    profile = await async_collection(EmployeeProfile).find_one({'user': user_id}, {'id_card_number': 1})
+    return profile['id_card_number'] if profile else None
+
+
+async def aload_day_view(username, date):
+    """load_day_view() through the async client."""
+    mongo_user = await auser_by_username(username)
+    if not mongo_user:
+        return None
+
+    day = day_key(date)
+    cursor = async_collection(DailyLog).find(
+        {'employee': mongo_user['_id'], 'day': day},
+        {'_id': 0, 'time_interval': 1, 'description': 1, 'status': 1, 'updated_at': 1},
+        sort=[('slot', 1)],
+    )
+    docs = await cursor.to_list()
+    if await ais_cold(day):
+        archived = await asyncio.to_thread(lambda: list(archived_rows(day, day, mongo_user['_id'])))
+        docs = archived + docs
+    return day_view(mongo_user, docs)
+
+
+async def alog_batches(query, fields, first_day=None, last_day=None, employee=None, names=True,
+                       batch_size=EMPLOYEE_BATCH_SIZE, read_preference=None):
+    """Lists of LogRows: the hot logs in dashboard order, then the archived ones.
+
+    The async form of exports.with_archived(), with staff names attached per
+    batch like with_staff_names() when ``names`` is set.
+    """
+    async def finished(batch):
+        return await aattach_staff_names(batch, read_preference) if names else batch
+
+    batch = []
+    async for row in alog_rows(query, PAGE_SORT, fields, read_preference=read_preference):
+        batch.append(row)
+        if len(batch) == batch_size:
+            yield await finished(batch)
+            batch = []
+    if batch:
+        yield await finished(batch)
+
+    async for docs in in_thread_batches(archived_rows(first_day, last_day, employee, newest_first=True), batch_size):
+        yield await finished([LogRow(doc) for doc in docs])
+
+
+async def alogs_stats(query, read_preference=None):
+    """Latest updated_at and count of the logs matching a raw filter, as exports._version() reads them."""
+    cursor = await async_collection(DailyLog, read_preference).aggregate([
+        {'$match': query},
+        {'$group': {'_id': None, 'updated_at': {'$max': '$updated_at'}, 'count': {'$sum': 1}}},
+    ])
+    stats = next(iter(await cursor.to_list()), {})
+    return stats.get('updated_at'), stats.get('count', 0)
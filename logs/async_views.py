@@ -0,0 +1,237 @@
+"""Async versions of the daily log page, the admin dashboard, the exports and
+the export job download.
+
+They are routed instead of their sync counterparts in logs.views when
+``SERVER_MODE`` is 'asgi', and read and write MongoDB through the async
+client, so a worker serves other requests while it waits on the database.
+Django auth and sessions sit on the ORM; loading the user is the only step
+that goes through sync_to_async.
+"""
+import asyncio
+import functools
+from datetime import datetime
+
+from asgiref.sync import sync_to_async
+from bson import ObjectId
+from django.conf import settings
+from django.contrib import messages
+from django.contrib.auth.views import redirect_to_login
+from django.http import Http404, JsonResponse
+from django.shortcuts import redirect, render
+from django.utils import timezone
+
+from logs import jobs
+from logs.async_exports import aadmin_export, aexport_response, astaff_export, axlsx_response
+from logs.async_queries import (
+    aarchived_rows, aattach_staff_names, aemployee_for_id_card, aid_card_number, ais_cold, akeyset_page,
+    aload_day_view, alog_rows, auser_by_username,
+)
+from logs.caching import acached_day, ainvalidate_day, etag_for, mark_immutable, not_modified
+from logs.days import day_key
+from logs.exports import EXPORT_FORMATS
+from logs.queries import PAGE_SORT, keyset_slice
+from logs.rollups import asave_log
+from logs.schedule import is_scheduled
+from logs.views import _get_job, _job_status, dashboard_page_size, day_context, is_past, selected_day
+
+
+def _is_authenticated(request):
+    # Loads the session and the Django user; request.user keeps them, so
+    # templates and later checks don't query again
+    return request.user.is_authenticated
+
+
+def alogin_required(view):
+    """login_required for async views."""
+    @functools.wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        if not await sync_to_async(_is_authenticated)(request):
+            return redirect_to_login(request.get_full_path())
+        return await view(request, *args, **kwargs)
+    return wrapper
+
+
+@alogin_required
+async def admin_dashboard(request):
+    id_card = request.GET.get('id_card', '')
+    date = request.GET.get('date', '')
+
+    try:
+        day = day_key(date)
+    except ValueError:
+        date = timezone.now().date().isoformat()
+        day = day_key(date)
+
+    # Scans may go to secondaries, as in the sync view
+    reads = settings.REPORT_READ_PREFERENCE
+    query = {'day': day}
+    employee = None
+    unknown_staff = False
+
+    if id_card:
+        mongo_user = await aemployee_for_id_card(id_card)
+        if mongo_user:
+            employee = query['employee'] = mongo_user['_id']
+        else:
+            unknown_staff = True
+            messages.error(request, f'No staff found with ID Card number: {id_card}')
+
+    page_size = dashboard_page_size(request)
+    after, before = request.GET.get('after'), request.GET.get('before')
+
+    if unknown_staff:
+        rows, next_cursor, prev_cursor = [], None, None
+    elif await ais_cold(day):
+        # An archived day is read from its month file, and is small enough to page in memory
+        logs = await aarchived_rows(day, day, employee) + [
+            row async for row in alog_rows(query, PAGE_SORT, read_preference=reads)
+        ]
+        try:
+            rows, next_cursor, prev_cursor = keyset_slice(logs, after, before, page_size)
+        except ValueError:
+            rows, next_cursor, prev_cursor = keyset_slice(logs, page_size=page_size)
+        rows = await aattach_staff_names(rows, reads)
+    else:
+        try:
+            rows, next_cursor, prev_cursor = await akeyset_page(query, after, before, page_size, reads)
+        except ValueError:
+            rows, next_cursor, prev_cursor = await akeyset_page(query, page_size=page_size, read_preference=reads)
+
+    context = {
+        'logs': rows,
+        'id_card': id_card,
+        'date': date,
+        'page_size': page_size,
+        'next_cursor': next_cursor,
+        'prev_cursor': prev_cursor,
+    }
+    return render(request, 'logs/admin_dashboard.html', context)
+
+
+@alogin_required
+async def daily_log_view(request):
+    selected_date = selected_day(request.GET.get('date', ''))
+    is_previous_day = is_past(selected_date)
+    username = request.user.username
+
+    day_view = await acached_day(username, selected_date, aload_day_view)
+
+    # As in the sync view, a past day the browser already has is a 304
+    etag = None
+    if day_view and is_previous_day and request.method == 'GET' and not messages.get_messages(request):
+        etag = etag_for(username, selected_date, day_view['version'])
+        response = not_modified(request, etag, day_view['last_modified'])
+        if response:
+            return response
+
+    if not day_view:
+        messages.error(request, 'User profile not found. Please contact administrator.')
+        return render(request, 'logs/daily_log.html', day_context(selected_date, None))
+
+    if request.method == 'POST':
+        if is_previous_day:
+            messages.error(request, 'Cannot modify logs for previous days.')
+            return redirect(f'{request.path}?date={selected_date}')
+
+        time_interval = request.POST.get('time_interval')
+        description = request.POST.get('description')
+        status = request.POST.get('status')
+
+        if time_interval and not is_scheduled(selected_date, time_interval):
+            messages.error(request, f'{time_interval} is not a valid time interval for this day.')
+            return redirect(f'{request.path}?date={selected_date}')
+
+        if time_interval and description:
+            await asave_log(
+                ObjectId(day_view['user']['id']),
+                day_key(selected_date),
+                datetime.combine(selected_date, datetime.min.time()),
+                time_interval,
+                description,
+                status,
+            )
+            await ainvalidate_day(username, selected_date)
+            messages.success(request, 'Log entry saved successfully')
+            return redirect(f'{request.path}?date={selected_date}')
+
+    response = render(request, 'logs/daily_log.html', day_context(selected_date, day_view))
+    if etag:
+        mark_immutable(response, etag, day_view['last_modified'])
+    return response
+
+
+async def _export_response(request, export, fmt):
+    """views._export_response() for an AsyncExport."""
+    etag = last_modified = None
+    if export.version:
+        last_modified, version = await export.version()
+        etag = etag_for(request.user.username, request.get_full_path(), version)
+        response = not_modified(request, etag, last_modified)
+        if response:
+            return response
+    response = await aexport_response(export, fmt, gzip=request.GET.get('gzip') == '1')
+    if etag:
+        mark_immutable(response, etag, last_modified)
+    return response
+
+
+@alogin_required
+async def export_logs_excel(request):
+    id_card = request.GET.get('id_card', '')
+    date = request.GET.get('date', '')
+    fmt = request.GET.get('format', 'xlsx')
+
+    if fmt not in EXPORT_FORMATS:
+        messages.error(request, f'Unknown export format: {fmt}')
+        return redirect('admin_dashboard')
+
+    try:
+        export = await aadmin_export(id_card, date)
+    except ValueError:
+        messages.error(request, f'Invalid date: {date}')
+        return redirect('admin_dashboard')
+    return await _export_response(request, export, fmt)
+
+
+@alogin_required
+async def export_staff_logs(request):
+    current_user = request.user
+    mongo_user = await auser_by_username(current_user.username)
+    if not mongo_user:
+        messages.error(request, 'User profile not found. Please contact administrator.')
+        return redirect('daily_log')
+
+    id_card_number = await aid_card_number(mongo_user['_id'])
+    if id_card_number is None:
+        id_card_number = "N/A"
+        messages.warning(request, 'ID card number not found in profile')
+
+    start_date = request.GET.get('start_date', '')
+    end_date = request.GET.get('end_date', '')
+    date = request.GET.get('date', '')
+    fmt = request.GET.get('format', 'xlsx')
+
+    if fmt not in EXPORT_FORMATS:
+        messages.error(request, f'Unknown export format: {fmt}')
+        return redirect('daily_log')
+
+    user_first_name = current_user.first_name if current_user.first_name else current_user.username
+
+    try:
+        export = astaff_export(mongo_user, id_card_number, user_first_name, date, start_date, end_date)
+    except ValueError:
+        messages.error(request, 'Dates must be in YYYY-MM-DD format')
+        return redirect('daily_log')
+    return await _export_response(request, export, fmt)
+
+
+@alogin_required
+async def download_export_job(request, job_id):
+    job = await asyncio.to_thread(_get_job, request, job_id)
+    if job['status'] != jobs.DONE:
+        return JsonResponse(_job_status(job), status=409)
+    try:
+        output = await asyncio.to_thread(open, jobs.artifact_path(job), 'rb')
+    except FileNotFoundError:
+        raise Http404('Export file has expired')
+    return axlsx_response(output, job['filename'])
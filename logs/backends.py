@@ -0,0 +1,143 @@
+import re
+
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+from django.contrib.auth.hashers import UNUSABLE_PASSWORD_PREFIX, check_password, identify_hasher, make_password
+from django.contrib.auth.models import User as DjangoUser
+from django.core.cache import caches
+from django.utils.crypto import constant_time_compare
+
+from logs.mongo_models import EmployeeProfile, User
+
+
+USER_CACHE_PREFIX = 'authuser'
+
+# The "algorithm$" start of an encoded password, whether or not its hasher is installed
+ENCODED_PASSWORD_RE = re.compile(r'^[\w-]+\$')
+
+
+def user_cache_key(user_id):
+    return f"{USER_CACHE_PREFIX}:{user_id}"
+
+
+def forget_user(sender, instance, **kwargs):
+    """post_save/post_delete receiver dropping a Django user from the cache."""
+    caches[settings.SESSION_CACHE_ALIAS].delete(user_cache_key(instance.pk))
+
+
+class CachedUserMixin:
+    """get_user() served from the sessions cache.
+
+    AuthenticationMiddleware loads the signed-in user on every request; this
+    keeps that off SQLite. The cached user carries its password hash, so
+    Django's session verification still logs out sessions of a changed
+    password once forget_user() has dropped the old copy.
+    """
+
+    def get_user(self, user_id):
+        users = caches[settings.SESSION_CACHE_ALIAS]
+        key = user_cache_key(user_id)
+        user = users.get(key)
+        if user is None:
+            user = super().get_user(user_id)
+            if user is not None:
+                users.set(key, user, settings.AUTH_USER_CACHE_TTL)
+        return user
+
+
+class CachedModelBackend(CachedUserMixin, ModelBackend):
+    pass
+
+
+def find_employee(id_card_number):
+    """Profile and user fields for an ID card, joined in one aggregation."""
+    pipeline = [
+        {'$match': {'id_card_number': id_card_number}},
+        {'$limit': 1},
+        {'$lookup': {
+            'from': User._get_collection_name(),
+            'localField': 'user',
+            'foreignField': '_id',
+            'as': 'user',
+        }},
+        {'$unwind': '$user'},
+        {'$project': {
+            '_id': 0,
+            'user_id': '$user._id',
+            'username': '$user.username',
+            'email': '$user.email',
+            'first_name': '$user.first_name',
+            'last_name': '$user.last_name',
+            'password': '$user.password',
+            'is_active': '$user.is_active',
+        }},
+    ]
+    return next(EmployeeProfile._get_collection().aggregate(pipeline), None)
+
+
+class MongoEmployeeBackend(CachedUserMixin, ModelBackend):
+    """Authenticates staff by ID card number against the Mongo user.
+
+    The profile and user are fetched in a single round trip and only one
+    password hash is checked. Legacy plaintext passwords and hashes made with
+    outdated parameters are rehashed after a successful login. The matching
+    Django user only carries the session; its own password is never used.
+    """
+
+    def authenticate(self, request, id_card=None, password=None, **kwargs):
+        if not id_card or password is None:
+            return None
+
+        employee = find_employee(id_card)
+        if employee is None:
+            # Run the hasher anyway so unknown ID cards take as long as wrong passwords
+            make_password(password)
+            return None
+        if not employee.get('is_active', True):
+            return None
+
+        stored = employee.get('password') or ''
+        try:
+            hasher = identify_hasher(stored)
+        except ValueError:
+            hasher = None
+
+        if hasher is None:
+            # Only a legacy plaintext password is compared as is; an encoded
+            # one whose hasher is missing, or an unusable one, never matches
+            if not stored or stored.startswith(UNUSABLE_PASSWORD_PREFIX) or ENCODED_PASSWORD_RE.match(stored):
+                return None
+            valid = constant_time_compare(stored, password)
+            needs_rehash = valid
+        else:
+            try:
+                valid = check_password(password, stored)
+                needs_rehash = valid and hasher.must_update(stored)
+            except ValueError:
+                # A listed hasher whose library is not installed
+                return None
+        if not valid:
+            return None
+
+        if needs_rehash:
+            # Only replace the hash we checked, in case it changed meanwhile
+            User._get_collection().update_one(
+                {'_id': employee['user_id'], 'password': stored},
+                {'$set': {'password': make_password(password)}},
+            )
+
+        return self.get_django_user(employee)
+
+    def get_django_user(self, employee):
+        django_user, created = DjangoUser.objects.get_or_create(
+            username=employee['username'],
+            defaults={
+                'email': employee.get('email') or '',
+                'first_name': employee.get('first_name') or '',
+                'last_name': employee.get('last_name') or '',
+            }
+        )
+        if created:
+            django_user.set_unusable_password()
+            django_user.save(update_fields=['password'])
+        return django_user if self.user_can_authenticate(django_user) else None
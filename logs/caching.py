@@ -0,0 +1,112 @@
+import calendar
+import hashlib
+import os
+import threading
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+
+DAY_CACHE_PREFIX = 'daylog'
+
+# Hits and misses of this process. Counting in the shared cache would cost
+# two cache writes per request and lose updates between workers
+_stats = {'hits': 0, 'misses': 0}
+_stats_lock = threading.Lock()
+
+
+def day_cache_key(username, date):
+    return f"{DAY_CACHE_PREFIX}:{username}:{date.isoformat()}"
+
+
+def day_cache_ttl(date):
+    # Past days can no longer be edited, so they can stay cached for long
+    if date < timezone.now().date():
+        return settings.DAY_CACHE_PAST_TTL
+    return settings.DAY_CACHE_TTL
+
+
+def _count(name):
+    with _stats_lock:
+        _stats[name] += 1
+
+
+def cached_day(username, date, loader):
+    """Read-through cache of a user's day view.
+
+    ``loader(username, date)`` is only called on a miss. A None result means
+    there is nothing to show and is not cached.
+    """
+    key = day_cache_key(username, date)
+    day = cache.get(key)
+    if day is not None:
+        _count('hits')
+        return day
+
+    _count('misses')
+    day = loader(username, date)
+    if day is not None:
+        cache.set(key, day, timeout=day_cache_ttl(date))
+    return day
+
+
+def invalidate_day(username, date):
+    cache.delete(day_cache_key(username, date))
+
+
+async def acached_day(username, date, loader):
+    """cached_day() for async views; ``loader`` is a coroutine function."""
+    key = day_cache_key(username, date)
+    day = await cache.aget(key)
+    if day is not None:
+        _count('hits')
+        return day
+
+    _count('misses')
+    day = await loader(username, date)
+    if day is not None:
+        await cache.aset(key, day, timeout=day_cache_ttl(date))
+    return day
+
+
+async def ainvalidate_day(username, date):
+    await cache.adelete(day_cache_key(username, date))
+
+
+def day_cache_stats():
+    """Hit ratio of the day cache in this worker process."""
+    with _stats_lock:
+        hits, misses = _stats['hits'], _stats['misses']
+    total = hits + misses
+    return {
+        'pid': os.getpid(),
+        'hits': hits,
+        'misses': misses,
+        'hit_ratio': hits / total if total else None,
+    }
+
+
+def timestamp(value):
+    """Seconds since the epoch of a naive UTC datetime, as Last-Modified needs."""
+    return calendar.timegm(value.utctimetuple()) if value else None
+
+
+def etag_for(*parts):
+    """Strong ETag over the string forms of ``parts``."""
+    return quote_etag(hashlib.sha1('\x1f'.join(str(part) for part in parts).encode()).hexdigest())
+
+
+def not_modified(request, etag, last_modified=None):
+    """A 304 response if the client's copy is still current, otherwise None."""
+    return get_conditional_response(request, etag=etag, last_modified=last_modified)
+
+
+def mark_immutable(response, etag, last_modified=None):
+    """Validators and per-user caching headers for a page that can no longer change."""
+    response['ETag'] = etag
+    if last_modified:
+        response['Last-Modified'] = http_date(last_modified)
+    patch_cache_control(response, private=True, max_age=settings.PAST_DAY_MAX_AGE)
+    return response
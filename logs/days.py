@@ -0,0 +1,22 @@
+"""Integer day keys.
+
+Every DailyLog carries ``day``, its calendar date as a yyyymmdd integer, so
+date filters are exact equality or range matches on an index instead of
+datetime comparisons that depend on how the timestamp was stored.
+"""
+import datetime
+
+
+def day_key(value):
+    """yyyymmdd for a date, a datetime or a 'YYYY-MM-DD' string.
+
+    Raises ValueError for strings in any other format.
+    """
+    if isinstance(value, str):
+        value = datetime.datetime.strptime(value, '%Y-%m-%d').date()
+    return value.year * 10000 + value.month * 100 + value.day
+
+
+def day_from_key(key):
+    return datetime.date(key // 10000, key // 100 % 100, key % 100)
+
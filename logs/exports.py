@@ -0,0 +1,350 @@
+import csv
+import json
+import tempfile
+import zlib
+
+import openpyxl
+from django.conf import settings
+from django.http import FileResponse, StreamingHttpResponse
+from django.utils import timezone
+from pymongo.read_preferences import Primary
+
+from logs.archive import archive_version, archived_rows
+from logs.caching import timestamp
+from logs.days import day_key
+from logs.metrics import timed
+from logs.mongo_models import DailyLog, EmployeeProfile
+from logs.queries import LogRow, log_rows, staff_name, with_staff_names
+
+XLSX_CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+# Formats that are streamed row by row instead of built as a workbook first
+STREAM_CONTENT_TYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson',
+}
+
+EXPORT_FORMATS = ('xlsx',) + tuple(STREAM_CONTENT_TYPES)
+
+# Log fields written to the export sheets
+EXPORT_FIELDS = ('employee', 'date', 'time_interval', 'description', 'status')
+
+# Workbooks smaller than this stay in memory, bigger ones roll over to a temp file
+SPOOL_MAX_SIZE = 1024 * 1024
+
+
+class Export:
+    """Everything needed to build one workbook: its sheet, headers and rows.
+
+    ``rows`` and ``count`` are callables so the queries only run when the
+    workbook is actually written, which may be in a background job.
+    ``version``, set only when every day covered is in the past, returns the
+    (last modified timestamp, version token) of the logs without reading them.
+    """
+
+    def __init__(self, title, headers, filename, rows, count, auto_width=False, version=None):
+        self.title = title
+        self.headers = headers
+        self.filename = filename
+        self.rows = rows
+        self.count = count
+        self.auto_width = auto_width
+        self.version = version
+
+
+def with_archived(logs, first_day=None, last_day=None, employee=None):
+    """Rows of a hot queryset followed by the archived logs in the same range.
+
+    Archived days are older than any hot one, so the newest-first order holds.
+    """
+    yield from log_rows(logs.no_cache(), EXPORT_FIELDS)
+    for doc in archived_rows(first_day, last_day, employee, newest_first=True):
+        yield LogRow(doc)
+
+
+def _archived_count(first_day=None, last_day=None, employee=None):
+    return sum(1 for _ in archived_rows(first_day, last_day, employee))
+
+
+def _version(logs, first_day=None, last_day=None):
+    stats = next(logs.aggregate([
+        {'$group': {'_id': None, 'updated_at': {'$max': '$updated_at'}, 'count': {'$sum': 1}}},
+    ]), {})
+    return version_of(stats.get('updated_at'), stats.get('count', 0), first_day, last_day)
+
+
+def version_of(updated_at, count, first_day=None, last_day=None):
+    """(last modified timestamp, version token) of an export's logs and the archived months it covers."""
+    last_modified = timestamp(updated_at)
+    return last_modified, f"{last_modified}-{count}-{','.join(archive_version(first_day, last_day))}"
+
+
+def all_past(last_day):
+    return last_day is not None and last_day < day_key(timezone.now().date())
+
+
+def staff_read_preference(last_day):
+    """Read preference of a staff member's export of their own logs.
+
+    Staff expect what they just saved to be there, so a range that includes
+    today stays on the primary; past days no longer change and may be read
+    from secondaries like the admin reports.
+    """
+    return settings.REPORT_READ_PREFERENCE if all_past(last_day) else Primary()
+
+
+ADMIN_HEADERS = ['Staff Name', 'Date', 'Time Interval', 'Description', 'Status']
+
+STAFF_HEADERS = ['Staff Name', 'ID Card Number', 'Date', 'Time Interval', 'Description', 'Status']
+
+
+def admin_filename(staff_name_for_filename, date):
+    # Generate filename based on whether it's for a specific staff or for the day
+    if staff_name_for_filename and date:
+        return f"logs_{staff_name_for_filename}_{date}.xlsx"
+    elif staff_name_for_filename:
+        return f"logs_{staff_name_for_filename}_{timezone.now().date().isoformat()}.xlsx"
+    elif date:
+        return f"all_staff_logs_{date}.xlsx"
+    return f"all_staff_logs_{timezone.now().date().isoformat()}.xlsx"
+
+
+def admin_row(log):
+    """Sheet row of a LogRow with its staff name attached."""
+    return [
+        log.staff_name,
+        log.date.strftime('%Y-%m-%d') if log.date else '',
+        log.time_interval,
+        log.description,
+        log.status
+    ]
+
+
+def staff_days(date='', start_date='', end_date=''):
+    """First and last day keys of a staff export, None when unbounded.
+
+    Raises ValueError if a date is not a 'YYYY-MM-DD' string.
+    """
+    if date:
+        return day_key(date), day_key(date)
+    if start_date and end_date:
+        return day_key(start_date), day_key(end_date)
+    return None, None
+
+
+def staff_filename(user_first_name, date='', start_date='', end_date=''):
+    # Generate filename with the user's first name
+    if date:
+        return f"my_logs_{user_first_name}_{date}.xlsx"
+    elif start_date and end_date:
+        return f"my_logs_{user_first_name}_{start_date}_to_{end_date}.xlsx"
+    return f"my_logs_{user_first_name}_{timezone.now().date().isoformat()}.xlsx"
+
+
+def staff_row(staff_name_val, id_card_number):
+    """Function turning one of a staff member's LogRows into a sheet row."""
+    def row(log):
+        return [
+            staff_name_val,
+            id_card_number,
+            log.date.strftime('%Y-%m-%d') if log.date else '',
+            log.time_interval,
+            log.description,
+            log.status,
+        ]
+    return row
+
+
+def admin_export(id_card='', date=''):
+    """All staff logs, optionally narrowed to one staff member and/or one day.
+
+    Raises ValueError if date is not a 'YYYY-MM-DD' string.
+    """
+    reads = settings.REPORT_READ_PREFERENCE
+    logs = DailyLog.objects().read_preference(reads)
+    staff_name_for_filename = ""
+    employee = None
+    day = None
+    # An unknown id card matches nothing, in the collection or the archive
+    unknown_staff = False
+
+    if id_card:
+        try:
+            profile = EmployeeProfile.objects.get(id_card_number=id_card)
+            mongo_user = profile.user
+            employee = mongo_user.id
+            logs = logs.filter(employee=mongo_user)
+            staff_name_for_filename = f"{mongo_user.first_name}_{mongo_user.last_name}" if mongo_user.first_name and mongo_user.last_name else mongo_user.username
+        except EmployeeProfile.DoesNotExist:
+            logs = DailyLog.objects.none()
+            unknown_staff = True
+
+    if date:
+        day = day_key(date)
+        logs = logs.filter(day=day)
+
+    # Same order as the admin dashboard, so the sort is served by its index
+    logs = logs.order_by('-day', 'slot', 'id')
+
+    def rows():
+        if unknown_staff:
+            return
+        for log in with_staff_names(with_archived(logs, day, day, employee), read_preference=reads):
+            yield admin_row(log)
+
+    return Export(
+        "Staff Logs",
+        ADMIN_HEADERS,
+        admin_filename(staff_name_for_filename, date),
+        rows,
+        lambda: 0 if unknown_staff else logs.count() + _archived_count(day, day, employee),
+        version=(lambda: _version(logs, day, day)) if all_past(day) else None,
+    )
+
+
+def staff_export(mongo_user, id_card_number, user_first_name, date='', start_date='', end_date=''):
+    """One staff member's own logs for a day or a date range.
+
+    Raises ValueError if a date is not a 'YYYY-MM-DD' string.
+    """
+    # Start with logs only for the given user
+    logs = DailyLog.objects(employee=mongo_user).order_by('-day', 'slot')
+
+    # Apply date filters
+    first_day, last_day = staff_days(date, start_date, end_date)
+    if first_day is not None:
+        logs = logs.filter(day__gte=first_day, day__lte=last_day)
+    logs = logs.read_preference(staff_read_preference(last_day))
+
+    row = staff_row(staff_name(mongo_user), id_card_number)
+
+    def rows():
+        for log in with_archived(logs, first_day, last_day, mongo_user.id):
+            yield row(log)
+
+    return Export(
+        "My Daily Logs",
+        STAFF_HEADERS,
+        staff_filename(user_first_name, date, start_date, end_date),
+        rows,
+        lambda: logs.count() + _archived_count(first_day, last_day, mongo_user.id),
+        auto_width=True,
+        version=(lambda: _version(logs, first_day, last_day)) if all_past(last_day) else None,
+    )
+
+
+def write_xlsx(title, headers, rows, output=None, auto_width=False):
+    """Write rows into a workbook and return the file, rewound.
+
+    By default a write-only worksheet is used, which flushes each row to disk
+    as it is appended so memory stays flat no matter how many rows the
+    iterable yields. Auto-sized columns need every row up front, so
+    ``auto_width`` falls back to a regular in-memory workbook.
+    """
+    if auto_width:
+        wb = openpyxl.Workbook()
+        ws = wb.active
+        ws.title = title
+    else:
+        wb = openpyxl.Workbook(write_only=True)
+        ws = wb.create_sheet(title)
+    ws.append(headers)
+    for row in rows:
+        ws.append(row)
+
+    if auto_width:
+        for column in ws.columns:
+            max_length = max(len(str(cell.value)) for cell in column)
+            ws.column_dimensions[column[0].column_letter].width = max_length + 2
+
+    if output is None:
+        output = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+    wb.save(output)
+    output.seek(0)
+    return output
+
+
+def write_export(export, output=None, progress=None):
+    """Write an Export to a workbook file, reporting the rows done to ``progress``."""
+    rows = export.rows()
+    if progress is not None:
+        rows = _counting(rows, progress)
+    return write_xlsx(export.title, export.headers, rows, output=output, auto_width=export.auto_width)
+
+
+def _counting(rows, progress, every=500):
+    done = 0
+    for row in rows:
+        yield row
+        done += 1
+        if done % every == 0:
+            progress(done)
+    progress(done)
+
+
+def xlsx_response(output, filename):
+    """Stream a finished workbook file to the client in chunks."""
+    response = FileResponse(output, content_type=XLSX_CONTENT_TYPE)
+    response['Content-Disposition'] = f'attachment; filename={filename}'
+    return response
+
+
+class _Echo:
+    """File-like object whose write() hands the line back to the caller."""
+
+    def write(self, value):
+        return value
+
+
+def csv_lines(headers, rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(headers)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def ndjson_lines(headers, rows):
+    """One JSON object per row, keyed by the snake-cased headers."""
+    keys = [header.lower().replace(' ', '_') for header in headers]
+    for row in rows:
+        yield json.dumps(dict(zip(keys, row)), ensure_ascii=False) + '\n'
+
+
+def gzipped(chunks):
+    """Compress a stream of byte chunks into one gzip member as it is produced."""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def export_filename(export, fmt):
+    return f"{export.filename.rsplit('.', 1)[0]}.{fmt}"
+
+
+def stream_export(export, fmt, gzip=False):
+    """Stream an Export as CSV or NDJSON straight from the Mongo cursor.
+
+    Rows are written as they are read, so nothing but the current batch of
+    logs is held in memory.
+    """
+    lines = csv_lines if fmt == 'csv' else ndjson_lines
+    chunks = (line.encode() for line in lines(export.headers, export.rows()))
+    if gzip:
+        chunks = gzipped(chunks)
+    response = StreamingHttpResponse(chunks, content_type=STREAM_CONTENT_TYPES[fmt])
+    if gzip:
+        response['Content-Encoding'] = 'gzip'
+    response['Content-Disposition'] = f'attachment; filename={export_filename(export, fmt)}'
+    return response
+
+
+def export_response(export, fmt='xlsx', gzip=False):
+    """Response for an Export in one of EXPORT_FORMATS."""
+    if fmt == 'xlsx':
+        with timed('export'):
+            output = write_export(export)
+        return xlsx_response(output, export.filename)
+    return stream_export(export, fmt, gzip=gzip)
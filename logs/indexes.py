@@ -0,0 +1,179 @@
+"""Query shapes issued by the views, and helpers to check them against indexes.
+
+Used by the ``audit_indexes`` management command. Each shape is a function
+that, given sample values, returns the find() the view would run; keep this
+list in step with the queries in views.py, exports.py and backends.py.
+"""
+import datetime
+
+from bson import ObjectId
+
+from logs.days import day_key
+from logs.mongo_models import DailyLog, DailySummary, EmployeeProfile, User
+
+
+def sample_values():
+    """Realistic values for the shapes, taken from an existing log if there is one."""
+    log = DailyLog._get_collection().find_one({}, {'employee': 1, 'day': 1, 'time_interval': 1})
+    profile = EmployeeProfile._get_collection().find_one({}, {'id_card_number': 1, 'user': 1})
+    user = User._get_collection().find_one({}, {'username': 1})
+    return {
+        'employee': log['employee'] if log else ObjectId(),
+        'day': log['day'] if log and log.get('day') else day_key(datetime.date.today()),
+        'time_interval': log['time_interval'] if log else '08:00 - 08:30',
+        'id_card_number': profile['id_card_number'] if profile else 'KD0000',
+        'user': profile['user'] if profile else ObjectId(),
+        'username': user['username'] if user else 'staff0',
+    }
+
+
+DASHBOARD_SORT = [('day', -1), ('slot', 1), ('_id', 1)]
+
+# (name, document, find spec builder). A spec has a filter and optionally a sort and limit.
+QUERY_SHAPES = [
+    ('daily_log_view: day rows', DailyLog, lambda v: {
+        'filter': {'employee': v['employee'], 'day': v['day']},
+        'sort': [('slot', 1)],
+    }),
+    ('daily_log_view: upsert match', DailyLog, lambda v: {
+        'filter': {'employee': v['employee'], 'day': v['day'], 'time_interval': v['time_interval']},
+    }),
+    ('admin_dashboard: day page', DailyLog, lambda v: {
+        'filter': {'day': v['day']},
+        'sort': DASHBOARD_SORT,
+        'limit': 51,
+    }),
+    ('admin_dashboard: staff day page', DailyLog, lambda v: {
+        'filter': {'day': v['day'], 'employee': v['employee']},
+        'sort': DASHBOARD_SORT,
+        'limit': 51,
+    }),
+    ('export_logs_excel: day', DailyLog, lambda v: {
+        'filter': {'day': v['day']},
+        'sort': DASHBOARD_SORT,
+    }),
+    ('export_logs_excel: everything', DailyLog, lambda v: {
+        'filter': {},
+        'sort': DASHBOARD_SORT,
+    }),
+    ('export_staff_logs: date range', DailyLog, lambda v: {
+        'filter': {'employee': v['employee'], 'day': {'$gte': v['day'] - 100, '$lte': v['day']}},
+        'sort': [('day', -1), ('slot', 1)],
+    }),
+    ('daily_summary_view: day range', DailySummary, lambda v: {
+        'filter': {'day': {'$gte': v['day'] - 100, '$lte': v['day']}},
+        'sort': [('day', 1)],
+    }),
+    ('search_view: text search', DailyLog, lambda v: {
+        'filter': {'$text': {'$search': 'meeting'}, 'employee': v['employee']},
+    }),
+    ('login_view: profile by id card', EmployeeProfile, lambda v: {
+        'filter': {'id_card_number': v['id_card_number']},
+    }),
+    ('export_staff_logs: profile by user', EmployeeProfile, lambda v: {
+        'filter': {'user': v['user']},
+    }),
+    ('daily_log_view: user by username', User, lambda v: {
+        'filter': {'username': v['username']},
+    }),
+]
+
+
+def explain(document, spec, verbosity='executionStats'):
+    command = {'find': document._get_collection_name(), 'filter': spec['filter']}
+    if spec.get('sort'):
+        command['sort'] = dict(spec['sort'])
+    if spec.get('limit'):
+        command['limit'] = spec['limit']
+    return document._get_db().command('explain', command, verbosity=verbosity)
+
+
+def _stages(plan):
+    yield plan
+    for key in ('inputStage', 'queryPlan'):
+        if key in plan:
+            yield from _stages(plan[key])
+    for child in plan.get('inputStages', []):
+        yield from _stages(child)
+
+
+def summarize_plan(explained):
+    """Stages, index and work done by the winning plan of an explain() result."""
+    planner = explained['queryPlanner']
+    stages = list(_stages(planner['winningPlan']))
+    stats = explained.get('executionStats', {})
+    return {
+        'stages': [stage['stage'] for stage in stages],
+        'index': next((stage['indexName'] for stage in stages if 'indexName' in stage), None),
+        'collscan': any(stage['stage'] == 'COLLSCAN' for stage in stages),
+        'in_memory_sort': any(stage['stage'] == 'SORT' for stage in stages),
+        'returned': stats.get('nReturned'),
+        'keys_examined': stats.get('totalKeysExamined'),
+        'docs_examined': stats.get('totalDocsExamined'),
+        'millis': stats.get('executionTimeMillis'),
+    }
+
+
+def suggest_index(spec):
+    """Equality fields, then sort fields, then range fields."""
+    equality, ranges = [], []
+    for field, value in spec['filter'].items():
+        if isinstance(value, dict) and any(key.startswith('$') for key in value):
+            ranges.append((field, 1))
+        else:
+            equality.append((field, 1))
+    keys = equality + [key for key in spec.get('sort') or [] if key[0] not in dict(equality)]
+    keys += [key for key in ranges if key[0] not in dict(keys)]
+    return keys
+
+
+def index_stats(document):
+    """Usage counters of every index on the document's collection."""
+    return {
+        stat['name']: {'key': list(stat['key'].items()), 'ops': stat['accesses']['ops'], 'since': stat['accesses']['since']}
+        for stat in document._get_collection().aggregate([{'$indexStats': {}}])
+    }
+
+
+def _key(info):
+    if 'weights' in info:
+        # Text indexes are stored under _fts/_ftsx; compare them by their fields
+        return [(field, 'text') for field in sorted(info['weights'])]
+    return [(field, int(direction) if isinstance(direction, float) else direction) for field, direction in info['key']]
+
+
+def _is_prefix(short, long):
+    if len(short) >= len(long):
+        return False
+    head = long[:len(short)]
+    # An index can be walked backwards, so all-reversed directions also count
+    return head == short or head == [(field, -direction) for field, direction in short]
+
+
+def redundant_indexes(index_information):
+    """Non-unique indexes whose keys are a prefix of, or equal to, another index.
+
+    Takes the result of Collection.index_information().
+    """
+    redundant = []
+    for name, info in index_information.items():
+        if name == '_id_' or info.get('unique'):
+            continue
+        key = _key(info)
+        for other_name, other in index_information.items():
+            if other_name == name:
+                continue
+            other_key = _key(other)
+            if _is_prefix(key, other_key) or (key == other_key and other_name < name):
+                redundant.append((name, other_name))
+                break
+    return redundant
+
+
+def undeclared_indexes(document, index_information):
+    """Indexes on the collection that the model no longer declares."""
+    declared = [list(spec['fields']) for spec in document._meta['index_specs']]
+    return [
+        name for name, info in index_information.items()
+        if name != '_id_' and _key(info) not in declared
+    ]
@@ -0,0 +1,263 @@
+"""Background export jobs.
+
+Exports are built by a per-process thread pool and written to
+``settings.EXPORT_JOBS_DIR``. Job state lives next to the artifact as a JSON
+file, so any gunicorn worker can report the status of, or serve, a job that
+another worker built. Identical requests share one build while it is in
+flight through an ``<key>.inflight`` pointer file that only one request
+can create.
+"""
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+
+from logs.exports import admin_export, staff_export, write_export
+from logs.mongo_models import EmployeeProfile, User
+
+logger = logging.getLogger(__name__)
+
+PENDING = 'pending'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+JOB_ID_RE = re.compile(r'^[0-9a-f]{32}$')
+
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+
+
+def _admin_job_export(id_card='', date=''):
+    return admin_export(id_card, date)
+
+
+def _staff_job_export(username, first_name, date='', start_date='', end_date=''):
+    mongo_user = User.objects(username=username).first()
+    if not mongo_user:
+        raise ValueError(f"User profile not found: {username}")
+    profile = EmployeeProfile.objects(user=mongo_user).first()
+    id_card_number = profile.id_card_number if profile else "N/A"
+    return staff_export(mongo_user, id_card_number, first_name, date, start_date, end_date)
+
+
+BUILDERS = {
+    'admin': _admin_job_export,
+    'staff': _staff_job_export,
+}
+
+
+def _get_executor():
+    # The pool is created lazily and re-created after a fork, since threads
+    # do not survive into a forked gunicorn worker
+    global _executor, _executor_pid
+    with _executor_lock:
+        if _executor is None or _executor_pid != os.getpid():
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.EXPORT_JOB_WORKERS,
+                thread_name_prefix='export-job',
+            )
+            _executor_pid = os.getpid()
+        return _executor
+
+
+def _path(name):
+    os.makedirs(settings.EXPORT_JOBS_DIR, exist_ok=True)
+    return os.path.join(settings.EXPORT_JOBS_DIR, name)
+
+
+def artifact_path(job):
+    return _path(f"{job['id']}.xlsx")
+
+
+def job_key(kind, params):
+    raw = json.dumps([kind, params], sort_keys=True)
+    return hashlib.sha1(raw.encode()).hexdigest()
+
+
+def read_job(job_id):
+    if not JOB_ID_RE.match(job_id or ''):
+        return None
+    try:
+        with open(_path(f"{job_id}.json")) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def _write_job(job):
+    job['updated_at'] = time.time()
+    tmp = _path(f"{job['id']}.{threading.get_ident()}.tmp")
+    with open(tmp, 'w') as f:
+        json.dump(job, f)
+    os.replace(tmp, _path(f"{job['id']}.json"))
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def _inflight_job(pointer):
+    """The job a pointer file refers to, if that job is still being built."""
+    try:
+        with open(pointer) as f:
+            job_id = f.read().strip()
+    except FileNotFoundError:
+        return None
+    job = read_job(job_id)
+    if job and job['status'] in (PENDING, RUNNING) and time.time() - job['updated_at'] < settings.EXPORT_JOB_TTL:
+        return job
+    # The build finished or its worker died; let a new one take over, unless
+    # another request already has
+    _release(pointer, {'id': job_id})
+    return None
+
+
+def submit(kind, params, owner=None):
+    """Queue an export build, or join the identical one already in flight."""
+    if kind not in BUILDERS:
+        raise ValueError(f"Unknown export kind: {kind}")
+    expire_jobs()
+
+    key = job_key(kind, params)
+    pointer = _path(f"{key}.inflight")
+    for _ in range(3):
+        job = _inflight_job(pointer)
+        if job:
+            return job
+
+        job = {
+            'id': uuid.uuid4().hex,
+            'key': key,
+            'kind': kind,
+            'params': params,
+            'owner': owner,
+            'status': PENDING,
+            'progress': 0,
+            'total': None,
+            'filename': None,
+            'error': None,
+            'created_at': time.time(),
+        }
+        _write_job(job)
+        claim = _path(f"{job['id']}.claim")
+        with open(claim, 'w') as f:
+            f.write(job['id'])
+        try:
+            # link() fails if the pointer exists, so only one request wins
+            os.link(claim, pointer)
+        except FileExistsError:
+            # Another request claimed this build between our check and now
+            _remove(_path(f"{job['id']}.json"))
+            continue
+        finally:
+            _remove(claim)
+        _get_executor().submit(_run, job, pointer)
+        return job
+    raise RuntimeError("Could not claim or join an export job")
+
+
+class JobExpired(Exception):
+    """The job was expired as stalled while it was still being built."""
+
+
+def _update_job(job):
+    # A stalled job removed by expire_jobs() must not be written back
+    if not os.path.exists(_path(f"{job['id']}.json")):
+        raise JobExpired(job['id'])
+    _write_job(job)
+
+
+def _run(job, pointer):
+    job['status'] = RUNNING
+    tmp = artifact_path(job) + '.part'
+    try:
+        _update_job(job)
+        export = BUILDERS[job['kind']](**job['params'])
+        job['filename'] = export.filename
+        job['total'] = export.count()
+        _update_job(job)
+
+        def progress(done):
+            job['progress'] = done
+            try:
+                _update_job(job)
+            except JobExpired:
+                # Raising through openpyxl's writer would leave it half closed;
+                # the workbook is discarded once it is done
+                pass
+
+        with open(tmp, 'wb') as output:
+            write_export(export, output=output, progress=progress)
+        try:
+            os.replace(tmp, artifact_path(job))
+        except FileNotFoundError:
+            # expire_jobs() removed the part file of a job it gave up on
+            if not os.path.exists(_path(f"{job['id']}.json")):
+                raise JobExpired(job['id'])
+            raise
+        job['status'] = DONE
+        _update_job(job)
+    except JobExpired:
+        _remove(tmp)
+        _remove(artifact_path(job))
+    except Exception as e:
+        logger.exception("Export job %s failed", job['id'])
+        _remove(tmp)
+        job['status'] = FAILED
+        job['error'] = str(e)
+        try:
+            _update_job(job)
+        except JobExpired:
+            pass
+    finally:
+        _release(pointer, job)
+
+
+def _release(pointer, job):
+    # Only drop the pointer if a newer build has not taken it over
+    try:
+        with open(pointer) as f:
+            if f.read().strip() != job['id']:
+                return
+    except FileNotFoundError:
+        return
+    _remove(pointer)
+
+
+def expire_jobs(max_age=None):
+    """Delete jobs and their files once they are older than max_age seconds.
+
+    Finished jobs expire that long after they finished. Pending and running
+    jobs expire that long after their last progress: their worker has died
+    or hung, so their in-flight claim is released too and an identical
+    request starts a fresh build.
+    """
+    if max_age is None:
+        max_age = settings.EXPORT_JOB_TTL
+    cutoff = time.time() - max_age
+    removed = 0
+    for name in os.listdir(_path('')):
+        if not name.endswith('.json'):
+            continue
+        job = read_job(name[:-len('.json')])
+        if not job or job['updated_at'] > cutoff:
+            continue
+        _remove(artifact_path(job))
+        _remove(artifact_path(job) + '.part')
+        _remove(_path(name))
+        if job['status'] in (PENDING, RUNNING):
+            _release(_path(f"{job['key']}.inflight"), job)
+        removed += 1
+    return removed
@@ -0,0 +1,99 @@
+"""A small load generator for benchmarking views and running servers.
+
+``concurrency`` threads each open their own session (an HTTP connection, a
+test client, ...) and send requests back to back until ``total`` have been
+sent, which is enough to saturate a handful of workers without any
+third-party client.
+"""
+import http.client
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a sorted list."""
+    if not values:
+        return None
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+def summarize(latencies, errors, seconds):
+    """Throughput and latency percentiles, in milliseconds, of one run."""
+    latencies = sorted(latencies)
+    return {
+        'requests': len(latencies) + errors,
+        'errors': errors,
+        'seconds': seconds,
+        'requests_per_second': len(latencies) / seconds if seconds else 0,
+        'p50_ms': percentile(latencies, 0.50),
+        'p95_ms': percentile(latencies, 0.95),
+        'p99_ms': percentile(latencies, 0.99),
+    }
+
+
+def run(send, open_session, concurrency=10, total=1000, close_session=None):
+    """Call ``send(session, index)`` ``total`` times from ``concurrency`` threads.
+
+    Each thread calls ``open_session()`` once and passes the result to every
+    send it makes. ``send`` returns whether the request succeeded; an
+    exception counts as a failure. Returns summarize() of the run.
+    """
+    counter = iter(range(total))
+    lock = threading.Lock()
+    latencies, errors = [], [0]
+
+    def worker():
+        session = open_session()
+        try:
+            while True:
+                with lock:
+                    index = next(counter, None)
+                if index is None:
+                    return
+                start = time.perf_counter()
+                try:
+                    ok = send(session, index)
+                except Exception:
+                    ok = False
+                elapsed = (time.perf_counter() - start) * 1000
+                with lock:
+                    if ok:
+                        latencies.append(elapsed)
+                    else:
+                        errors[0] += 1
+        finally:
+            if close_session is not None:
+                close_session(session)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        futures = [pool.submit(worker) for _ in range(concurrency)]
+    for future in futures:
+        # A session that could not be opened is a broken benchmark, not a slow request
+        future.result()
+    return summarize(latencies, errors[0], time.perf_counter() - start)
+
+
+def run_load(host, port, paths, cookies=None, concurrency=10, total=1000, timeout=30):
+    """Send ``total`` GETs to a server, cycling through ``paths``; returns summarize().
+
+    Any status other than 200 or 304, or a failed connection, counts as an
+    error.
+    """
+    headers = {'Cookie': '; '.join(f'{name}={value}' for name, value in (cookies or {}).items())}
+
+    def send(connection, index):
+        try:
+            connection.request('GET', paths[index % len(paths)], headers=headers)
+            response = connection.getresponse()
+            response.read()
+        except (OSError, http.client.HTTPException):
+            connection.close()
+            return False
+        return response.status in (200, 304)
+
+    return run(
+        send, lambda: http.client.HTTPConnection(host, port, timeout=timeout), concurrency, total,
+        close_session=lambda connection: connection.close(),
+    )
@@ -0,0 +1,52 @@
+import datetime
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from logs.archive import archive_before, horizon_for, month_days, months_before
+from logs.days import day_from_key
+from logs.mongo_models import DailyLog
+
+
+class Command(BaseCommand):
+    help = 'Move whole months of old logs out of MongoDB into compressed files under ARCHIVE_DIR'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=int, default=None,
+            help='Archive months entirely older than this many days (default: ARCHIVE_AFTER_DAYS)',
+        )
+        parser.add_argument(
+            '--before', default=None,
+            help='Archive months before the one containing this YYYY-MM-DD date instead, '
+                 'at most the first day of the current month',
+        )
+        parser.add_argument('--dry-run', action='store_true', help='Only list the months that would be archived')
+
+    def handle(self, *args, **options):
+        if options['before']:
+            try:
+                before = datetime.datetime.strptime(options['before'], '%Y-%m-%d').date()
+            except ValueError:
+                raise CommandError('--before must be a YYYY-MM-DD date')
+            # Days of the current month can still be written, and a write under the horizon is never read
+            if before > datetime.date.today().replace(day=1):
+                raise CommandError('--before cannot be later than the first day of the current month')
+            horizon = horizon_for(before, 0)
+        else:
+            days = options['days'] if options['days'] is not None else settings.ARCHIVE_AFTER_DAYS
+            horizon = horizon_for(datetime.date.today(), days)
+        self.stdout.write(f'Archiving logs before {day_from_key(horizon).isoformat()}')
+
+        if options['dry_run']:
+            for month in months_before(horizon):
+                first_day, last_day = month_days(month)
+                self.stdout.write(f'  {month}: {DailyLog.objects(day__gte=first_day, day__lte=last_day).count()} log(s)')
+            return
+
+        moved = archive_before(horizon)
+        for month, count in moved.items():
+            self.stdout.write(f'  {month}: moved {count} log(s)')
+        self.stdout.write(self.style.SUCCESS(
+            f'Archived {sum(moved.values())} log(s) from {len(moved)} month(s) into {settings.ARCHIVE_DIR}'
+        ))
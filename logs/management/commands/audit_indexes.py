@@ -0,0 +1,81 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from logs.indexes import (
+    QUERY_SHAPES, explain, index_stats, redundant_indexes, sample_values, suggest_index, summarize_plan,
+    undeclared_indexes,
+)
+from logs.mongo_models import DailyLog, DailySummary, EmployeeProfile, User
+
+
+class Command(BaseCommand):
+    help = 'Explain the query shapes the views issue, report index usage and flag redundant or missing indexes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--json', action='store_true', help='Print the report as JSON')
+        parser.add_argument(
+            '--drop-undeclared', action='store_true',
+            help='Drop indexes that exist in MongoDB but are no longer declared on the models',
+        )
+
+    def handle(self, *args, **options):
+        report = {'queries': [], 'collections': {}}
+
+        values = sample_values()
+        for name, document, build in QUERY_SHAPES:
+            spec = build(values)
+            plan = summarize_plan(explain(document, spec))
+            plan['name'] = name
+            plan['collection'] = document._get_collection_name()
+            if plan['collscan'] or plan['in_memory_sort']:
+                plan['suggested_index'] = suggest_index(spec)
+            report['queries'].append(plan)
+
+        for document in (DailyLog, DailySummary, EmployeeProfile, User):
+            collection = document._get_collection()
+            information = collection.index_information()
+            undeclared = undeclared_indexes(document, information)
+            if options['drop_undeclared']:
+                for index_name in undeclared:
+                    collection.drop_index(index_name)
+            report['collections'][collection.name] = {
+                'usage': index_stats(document),
+                'redundant': [{'index': index, 'covered_by': other} for index, other in redundant_indexes(information)],
+                'undeclared': undeclared,
+                'dropped': undeclared if options['drop_undeclared'] else [],
+            }
+
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2, default=str))
+        else:
+            self.print_report(report)
+
+    def print_report(self, report):
+        self.stdout.write(self.style.MIGRATE_HEADING('Query plans'))
+        for plan in report['queries']:
+            line = (
+                f"  {plan['name']}: {plan['index'] or 'no index'} "
+                f"[{' > '.join(plan['stages'])}] "
+                f"keys={plan['keys_examined']} docs={plan['docs_examined']} "
+                f"returned={plan['returned']} {plan['millis']}ms"
+            )
+            if 'suggested_index' in plan:
+                self.stdout.write(self.style.WARNING(line))
+                problem = 'collection scan' if plan['collscan'] else 'in-memory sort'
+                self.stdout.write(self.style.WARNING(f"    {problem}; consider index {plan['suggested_index']}"))
+            else:
+                self.stdout.write(line)
+
+        for collection, info in report['collections'].items():
+            self.stdout.write(self.style.MIGRATE_HEADING(f'Indexes on {collection}'))
+            for index_name, usage in info['usage'].items():
+                line = f"  {index_name}: {usage['ops']} ops since {usage['since']}"
+                self.stdout.write(self.style.WARNING(line + ' (unused)') if not usage['ops'] else line)
+            for redundant in info['redundant']:
+                self.stdout.write(self.style.WARNING(
+                    f"  {redundant['index']} is redundant with {redundant['covered_by']}"
+                ))
+            for index_name in info['undeclared']:
+                action = 'dropped' if index_name in info['dropped'] else 'run with --drop-undeclared to drop it'
+                self.stdout.write(self.style.WARNING(f"  {index_name} is not declared on the model; {action}"))
@@ -0,0 +1,118 @@
+from django.core.management.base import BaseCommand
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from logs.mongo_models import DailyLog
+
+# Logs keyed per bulk write
+BATCH_SIZE = 1000
+
+# Logs saved before day keys existed
+LEGACY = {'day': {'$exists': False}, 'date': {'$type': 'date'}}
+
+# DailyLog.clean()'s day key, computed on the server
+DAY_EXPR = {'$toInt': {'$dateToString': {'format': '%Y%m%d', 'date': '$date'}}}
+
+
+def collisions_pipeline(collection_name):
+    """Legacy logs that would share a (employee, day, time_interval) key with another log.
+
+    The other log may be legacy too, with a timestamp stored differently, or
+    already keyed. Yields one group per key with every log in it.
+    """
+    return [
+        {'$match': LEGACY},
+        {'$group': {
+            '_id': {'employee': '$employee', 'day': DAY_EXPR, 'time_interval': '$time_interval'},
+            'logs': {'$push': {'_id': '$_id', 'updated_at': '$updated_at'}},
+        }},
+        {'$lookup': {
+            'from': collection_name,
+            'let': {'employee': '$_id.employee', 'day': '$_id.day', 'time_interval': '$_id.time_interval'},
+            'pipeline': [
+                {'$match': {'$expr': {'$and': [
+                    {'$eq': ['$employee', '$$employee']},
+                    {'$eq': ['$day', '$$day']},
+                    {'$eq': ['$time_interval', '$$time_interval']},
+                ]}}},
+                {'$project': {'updated_at': 1}},
+            ],
+            'as': 'keyed',
+        }},
+        {'$project': {'logs': {'$concatArrays': ['$logs', '$keyed']}}},
+        {'$match': {'logs.1': {'$exists': True}}},
+    ]
+
+
+def newest_first(logs):
+    """Logs of a colliding group, the one to keep first: newest updated_at, then newest _id."""
+    return sorted(logs, key=lambda log: (log.get('updated_at') is not None, log.get('updated_at'), log['_id']),
+                  reverse=True)
+
+
+class Command(BaseCommand):
+    help = (
+        'Fill in DailyLog.day from date for logs saved before day keys existed. '
+        'Run it, and backfill_slots, before deploying code that pages by day and slot'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--merge', action='store_true',
+            help='Keep only the most recently updated log of each colliding interval and delete the others',
+        )
+
+    def handle(self, *args, **options):
+        collection = DailyLog._get_collection()
+
+        # The unique (employee, day, time_interval) index applies as soon as a
+        # log has a day, so logs that would collide are settled first
+        skipped = set()
+        deleted = 0
+        for group in collection.aggregate(collisions_pipeline(collection.name), allowDiskUse=True):
+            keep, *others = newest_first(group['logs'])
+            key = group['_id']
+            if options['merge']:
+                collection.delete_many({'_id': {'$in': [log['_id'] for log in others]}})
+                deleted += len(others)
+            else:
+                skipped.update(log['_id'] for log in group['logs'])
+                self.stdout.write(self.style.WARNING(
+                    f"  {len(group['logs'])} logs of employee {key['employee']} for {key['time_interval']} on "
+                    f"{key['day']}: {', '.join(str(log['_id']) for log in group['logs'])} (newest {keep['_id']})"
+                ))
+        if deleted:
+            self.stdout.write(f'Deleted {deleted} older duplicate log(s); run rebuild_daily_summary afterwards')
+
+        updated = 0
+        last_id = None
+        while True:
+            query = dict(LEGACY, **({'_id': {'$gt': last_id}} if last_id else {}))
+            ids = [doc['_id'] for doc in collection.find(query, {'_id': 1}).sort('_id', 1).limit(BATCH_SIZE)]
+            if not ids:
+                break
+            last_id = ids[-1]
+            batch = [log_id for log_id in ids if log_id not in skipped]
+            if not batch:
+                continue
+            writes = [UpdateOne(dict(LEGACY, _id=log_id), [{'$set': {'day': DAY_EXPR}}]) for log_id in batch]
+            try:
+                updated += collection.bulk_write(writes, ordered=False).modified_count
+            except BulkWriteError as e:
+                # A log saved meanwhile can still collide; the rest of the batch is written
+                updated += e.details['nModified']
+                for error in e.details['writeErrors']:
+                    log_id = batch[error['index']]
+                    skipped.add(log_id)
+                    self.stdout.write(self.style.WARNING(f'  Skipped {log_id}: {error["errmsg"]}'))
+        self.stdout.write(f'Set the day of {updated} log(s)')
+
+        if skipped:
+            self.stdout.write(self.style.WARNING(
+                f'{len(skipped)} log(s) left without a day because they collide; '
+                'resolve them or run again with --merge'
+            ))
+        missing = collection.count_documents({'day': {'$exists': False}, 'date': {'$not': {'$type': 'date'}}})
+        if missing:
+            self.stdout.write(self.style.WARNING(f'{missing} log(s) have no date and no day'))
+        self.stdout.write(self.style.SUCCESS('Day key backfill complete'))
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+
+from logs.mongo_models import DailyLog
+from logs.schedule import SLOTS
+
+
+class Command(BaseCommand):
+    help = (
+        'Fill in DailyLog.slot from time_interval for logs saved before slots existed. '
+        'Run it, and backfill_day_keys, before deploying code that pages by day and slot'
+    )
+
+    def handle(self, *args, **options):
+        collection = DailyLog._get_collection()
+
+        # One update per interval on the schedule rather than one per log
+        updated = 0
+        for time_interval, slot in SLOTS.items():
+            result = collection.update_many(
+                {'time_interval': time_interval, 'slot': {'$ne': slot}},
+                {'$set': {'slot': slot}},
+            )
+            updated += result.modified_count
+        self.stdout.write(f'Set the slot of {updated} log(s)')
+
+        unscheduled = collection.count_documents({'time_interval': {'$nin': list(SLOTS)}})
+        if unscheduled:
+            self.stdout.write(self.style.WARNING(
+                f'{unscheduled} log(s) have a time interval outside the schedule and no slot'
+            ))
+        self.stdout.write(self.style.SUCCESS('Slot backfill complete'))
@@ -0,0 +1,204 @@
+import datetime
+import itertools
+import json
+import threading
+
+from django.conf import settings
+from django.contrib.auth.models import User as DjangoUser
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+from django.utils import timezone
+from pymongo import monitoring
+
+from logs.loadtest import run
+from logs.mongo_models import EmployeeProfile, User
+from logs.schedule import intervals_for
+
+ENDPOINTS = (
+    'login', 'daily_log_get', 'daily_log_post', 'admin_dashboard', 'export_logs_excel', 'export_staff_logs',
+)
+
+# Metrics compared against a baseline report, and whether higher is better
+COMPARED = {'requests_per_second': True, 'p50_ms': False, 'p95_ms': False, 'p99_ms': False,
+            'mongo_commands_per_request': False}
+
+# Commands the driver sends on its own rather than for a view
+IGNORED_COMMANDS = {'endSessions', 'hello', 'isMaster', 'ismaster', 'ping'}
+
+
+class CommandCounter(monitoring.CommandListener):
+    """Counts the Mongo commands each endpoint sends, by the thread sending them."""
+
+    def __init__(self):
+        self.current = threading.local()
+        self.counts = {}
+        self.lock = threading.Lock()
+
+    def started(self, event):
+        endpoint = getattr(self.current, 'endpoint', None)
+        if endpoint and event.command_name not in IGNORED_COMMANDS:
+            with self.lock:
+                self.counts[endpoint] = self.counts.get(endpoint, 0) + 1
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+
+def _client():
+    # 'localhost' is an allowed host, and keeps production's HTTPS redirect off
+    return Client(HTTP_HOST='localhost')
+
+
+class Command(BaseCommand):
+    help = (
+        'Drive the main views at a set concurrency through the Django test client and report '
+        'p50/p95/p99 latency, throughput and Mongo commands per endpoint as JSON'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--prefix', default='seed', help='Username prefix the staff were seeded with (seed_logs)')
+        parser.add_argument('--password', default='seedpass', help='Password the staff were seeded with')
+        parser.add_argument('--date', default=None, help='Past day to read, YYYY-MM-DD (default: yesterday)')
+        parser.add_argument('--concurrency', type=int, default=8)
+        parser.add_argument('--requests', type=int, default=200, help='Requests per endpoint')
+        parser.add_argument(
+            '--endpoint', action='append', dest='endpoints', choices=ENDPOINTS, help='Only these endpoints',
+        )
+        parser.add_argument('--output', default=None, help='Also write the report to this file')
+        parser.add_argument('--baseline', default=None, help='Earlier report to compare against')
+
+    def handle(self, *args, **options):
+        # Registered before the first query so the client is created with it
+        counter = CommandCounter()
+        monitoring.register(counter)
+
+        date = options['date'] or (timezone.now().date() - datetime.timedelta(days=1)).isoformat()
+        today = timezone.now().date()
+        staff = self.seeded_staff(options['prefix'])
+        admin, _ = DjangoUser.objects.get_or_create(username='bench_admin', defaults={'is_staff': True})
+
+        next_staff = itertools.count()
+        lock = threading.Lock()
+
+        def staff_card():
+            with lock:
+                return staff[next(next_staff) % len(staff)]
+
+        def staff_client():
+            client = _client()
+            response = client.post('/logs/login/', {'id_card': staff_card(), 'password': options['password']})
+            if response.status_code != 302:
+                raise CommandError('A seeded staff member could not log in; check --prefix and --password')
+            return client
+
+        def admin_client():
+            client = _client()
+            client.force_login(admin)
+            return client
+
+        intervals = intervals_for(today)
+        first_day = (datetime.date.fromisoformat(date) - datetime.timedelta(days=6)).isoformat()
+        endpoints = {
+            'login': (
+                lambda: (_client(), staff_card()),
+                lambda session, i: session[0].post(
+                    '/logs/login/', {'id_card': session[1], 'password': options['password']},
+                ).status_code == 302,
+            ),
+            'daily_log_get': (
+                staff_client,
+                lambda client, i: client.get(f'/daily_log/?date={date}').status_code in (200, 304),
+            ),
+            'daily_log_post': (
+                staff_client,
+                lambda client, i: client.post(f'/daily_log/?date={today}', {
+                    'time_interval': intervals[i % len(intervals)],
+                    'description': f'Benchmark entry {i}',
+                    'status': 'Ongoing',
+                }).status_code == 302,
+            ),
+            'admin_dashboard': (
+                admin_client,
+                lambda client, i: client.get(f'/admin_dashboard/?date={date}').status_code == 200,
+            ),
+            'export_logs_excel': (
+                admin_client,
+                lambda client, i: _ok(client.get(f'/export_logs_excel/?date={date}')),
+            ),
+            'export_staff_logs': (
+                staff_client,
+                lambda client, i: _ok(client.get(f'/export_staff_logs/?start_date={first_day}&end_date={date}')),
+            ),
+        }
+
+        report = {
+            'started_at': timezone.now().isoformat(),
+            'server_mode': settings.SERVER_MODE,
+            'date': date,
+            'concurrency': options['concurrency'],
+            'staff': len(staff),
+            'endpoints': {},
+        }
+        for name in options['endpoints'] or ENDPOINTS:
+            open_session, send = endpoints[name]
+            self.stderr.write(f'{name}...')
+
+            def counted(session, index, name=name, send=send):
+                counter.current.endpoint = name
+                try:
+                    return send(session, index)
+                finally:
+                    counter.current.endpoint = None
+
+            stats = run(counted, open_session, options['concurrency'], options['requests'])
+            stats['mongo_commands_per_request'] = counter.counts.get(name, 0) / stats['requests']
+            report['endpoints'][name] = stats
+
+        if options['baseline']:
+            with open(options['baseline']) as f:
+                compare(report, json.load(f))
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output + '\n')
+        self.stdout.write(output)
+
+    def seeded_staff(self, prefix):
+        users = User.objects(username__startswith=prefix).only('id').as_pymongo()
+        cards = [
+            profile['id_card_number']
+            for profile in EmployeeProfile.objects(user__in=[user['_id'] for user in users])
+            .only('id_card_number').as_pymongo()
+        ]
+        if not cards:
+            raise CommandError(f'No staff seeded with prefix {prefix!r}; run seed_logs first')
+        return cards
+
+
+def _ok(response):
+    # Reading a streamed export is part of its cost
+    if response.streaming:
+        b''.join(response.streaming_content)
+    return response.status_code == 200
+
+
+def compare(report, baseline):
+    """Add each endpoint's baseline metrics and the change from them, in percent.
+
+    A positive ``change`` is always an improvement.
+    """
+    for name, stats in report['endpoints'].items():
+        before = baseline.get('endpoints', {}).get(name)
+        if not before:
+            continue
+        stats['baseline'] = {metric: before.get(metric) for metric in COMPARED}
+        stats['change_percent'] = {}
+        for metric, higher_is_better in COMPARED.items():
+            old, new = before.get(metric), stats.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old * 100
+            stats['change_percent'][metric] = round(change if higher_is_better else -change, 1)
@@ -0,0 +1,74 @@
+import datetime
+import time
+
+from bson import ObjectId
+from django.core.management.base import BaseCommand
+
+from logs.mongo_models import DailyLog
+from logs.queries import LOG_FIELDS, LogRow, log_rows
+from logs.schedule import SLOTS
+
+
+def sample_docs(count):
+    """Raw dicts shaped like stored logs, so hydration can be timed without a database."""
+    intervals = list(SLOTS.items())
+    employees = [ObjectId() for _ in range(50)]
+    docs = []
+    for i in range(count):
+        time_interval, slot = intervals[i % len(intervals)]
+        date = datetime.datetime(2025, 1, 1) + datetime.timedelta(days=i // 1000)
+        docs.append({
+            '_id': ObjectId(),
+            'employee': employees[i % len(employees)],
+            'date': date,
+            'day': date.year * 10000 + date.month * 100 + date.day,
+            'slot': slot,
+            'time_interval': time_interval,
+            'description': f'Task {i}',
+            'status': 'Ongoing',
+        })
+    return docs
+
+
+def _read(logs):
+    # Touch what the views and exports use, as they would
+    for log in logs:
+        log.employee, log.date, log.time_interval, log.description, log.status
+
+
+def _timed(function):
+    start = time.perf_counter()
+    function()
+    return time.perf_counter() - start
+
+
+class Command(BaseCommand):
+    help = 'Compare the per-row cost of reading logs as DailyLog documents and as raw LogRows'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=100_000, help='Rows to build in memory')
+        parser.add_argument(
+            '--query', action='store_true',
+            help='Also time reading every stored log through MongoDB both ways',
+        )
+
+    def handle(self, *args, **options):
+        docs = sample_docs(options['rows'])
+        self.report('hydration', len(docs), {
+            'DailyLog': _timed(lambda: _read(DailyLog._from_son(doc, _auto_dereference=False) for doc in docs)),
+            'LogRow': _timed(lambda: _read(LogRow(doc) for doc in docs)),
+        })
+
+        if options['query']:
+            count = DailyLog.objects.count()
+            self.report('query', count, {
+                'DailyLog': _timed(lambda: _read(DailyLog.objects.no_dereference().no_cache())),
+                'LogRow': _timed(lambda: _read(log_rows(DailyLog.objects.no_cache(), LOG_FIELDS))),
+            })
+
+    def report(self, name, count, timings):
+        self.stdout.write(f'{name}: {count} rows')
+        baseline = timings['DailyLog']
+        for label, seconds in timings.items():
+            per_row = seconds / count * 1e6 if count else 0
+            self.stdout.write(f'  {label:<10} {seconds:8.3f}s {per_row:8.2f} us/row {baseline / seconds if seconds else 0:6.1f}x')
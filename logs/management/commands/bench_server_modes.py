@@ -0,0 +1,92 @@
+import http.client
+import os
+import subprocess
+import sys
+import time
+from importlib import import_module
+
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY
+from django.contrib.auth.models import User as DjangoUser
+from django.core.management.base import BaseCommand, CommandError
+
+from logs.loadtest import run_load
+
+MODES = ('wsgi', 'asgi')
+
+
+def login_cookie(username):
+    """Session cookie of a signed-in Django user, made without going through the login form."""
+    try:
+        user = DjangoUser.objects.get(username=username)
+    except DjangoUser.DoesNotExist:
+        raise CommandError(f'No Django user named {username!r}')
+    session = import_module(settings.SESSION_ENGINE).SessionStore()
+    session[SESSION_KEY] = str(user.pk)
+    session[BACKEND_SESSION_KEY] = settings.AUTHENTICATION_BACKENDS[0]
+    session[HASH_SESSION_KEY] = user.get_session_auth_hash()
+    session.save()
+    return {settings.SESSION_COOKIE_NAME: session.session_key}
+
+
+def wait_until_ready(port, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        connection = http.client.HTTPConnection('127.0.0.1', port, timeout=2)
+        try:
+            connection.request('GET', '/ready/')
+            if connection.getresponse().status == 200:
+                return
+        except OSError:
+            pass
+        finally:
+            connection.close()
+        time.sleep(0.5)
+    raise CommandError(f'Server on port {port} did not become ready')
+
+
+class Command(BaseCommand):
+    help = 'Compare concurrent-request throughput of the sync (WSGI) and async (ASGI) server modes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--username', required=True, help='Staff member whose session the requests use')
+        parser.add_argument(
+            '--path', action='append', dest='paths',
+            help='Path to request, repeatable (default: the daily log page and today on the dashboard)',
+        )
+        parser.add_argument('--concurrency', type=int, default=50)
+        parser.add_argument('--requests', type=int, default=2000)
+        parser.add_argument('--workers', type=int, default=2, help='gunicorn workers in each mode')
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument('--mode', choices=MODES, action='append', dest='modes', help='Only run these modes')
+
+    def handle(self, *args, **options):
+        paths = options['paths'] or ['/daily_log/', '/admin_dashboard/']
+        cookies = login_cookie(options['username'])
+
+        results = {}
+        for mode in options['modes'] or MODES:
+            self.stdout.write(f'{mode}: starting {options["workers"]} workers')
+            server = subprocess.Popen(
+                [sys.executable, '-m', 'gunicorn', '--bind', f'127.0.0.1:{options["port"]}',
+                 '--workers', str(options['workers'])],
+                cwd=settings.BASE_DIR,
+                env={**os.environ, 'SERVER_MODE': mode},
+            )
+            try:
+                wait_until_ready(options['port'])
+                # One untimed round so both modes start with warm caches and pools
+                run_load('127.0.0.1', options['port'], paths, cookies, options['concurrency'], options['concurrency'])
+                results[mode] = run_load(
+                    '127.0.0.1', options['port'], paths, cookies, options['concurrency'], options['requests'],
+                )
+            finally:
+                server.terminate()
+                server.wait()
+
+        self.stdout.write(f'{"mode":<6} {"req/s":>9} {"p50 ms":>8} {"p95 ms":>8} {"p99 ms":>8} {"errors":>7}')
+        for mode, stats in results.items():
+            self.stdout.write(
+                f'{mode:<6} {stats["requests_per_second"]:9.1f} {stats["p50_ms"] or 0:8.1f} '
+                f'{stats["p95_ms"] or 0:8.1f} {stats["p99_ms"] or 0:8.1f} {stats["errors"]:7d}'
+            )
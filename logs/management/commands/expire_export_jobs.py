@@ -0,0 +1,18 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from logs import jobs
+
+
+class Command(BaseCommand):
+    help = 'Delete finished export jobs and their workbooks once they have expired'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--max-age', type=int, default=settings.EXPORT_JOB_TTL,
+            help='Age in seconds after which a finished job is deleted',
+        )
+
+    def handle(self, *args, **options):
+        removed = jobs.expire_jobs(max_age=options['max_age'])
+        self.stdout.write(self.style.SUCCESS(f'Removed {removed} expired export job(s)'))
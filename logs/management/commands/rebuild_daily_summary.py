@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from logs.mongo_models import DailySummary
+from logs.rollups import rebuild_summaries
+
+
+class Command(BaseCommand):
+    help = (
+        'Recompute the daily_summary rollups of the days still in MongoDB from their logs, e.g. after a '
+        'migration or bulk import that bypassed daily_log_view. Summaries of archived months are kept'
+    )
+
+    def handle(self, *args, **options):
+        rebuild_summaries()
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt {DailySummary.objects.count()} daily summaries'
+        ))
@@ -0,0 +1,84 @@
+import datetime
+import random
+import re
+from itertools import islice
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User as DjangoUser
+from django.core.management.base import BaseCommand, CommandError
+
+from logs.mongo_models import DailyLog, DailySummary, EmployeeProfile, User
+from logs.rollups import rebuild_summaries
+from logs.seed import id_card_for, log_docs, staff_docs
+
+# Logs written per insert_many
+INSERT_BATCH_SIZE = 5000
+
+
+class Command(BaseCommand):
+    help = 'Bulk-generate synthetic staff and days of logs for benchmarks and load tests'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--employees', type=int, default=50, help='Staff members to create')
+        parser.add_argument('--days', type=int, default=30, help='Days of logs per staff member')
+        parser.add_argument('--end', default=None, help='Last day to seed, YYYY-MM-DD (default: today)')
+        parser.add_argument('--fill', type=float, default=0.85, help="Share of each day's intervals logged")
+        parser.add_argument('--prefix', default='seed', help='Username prefix; ID cards use it upper-cased')
+        parser.add_argument('--password', default='seedpass', help='Password of every seeded staff member')
+        parser.add_argument('--random-seed', type=int, default=None, help='Make the generated data repeatable')
+        parser.add_argument('--clear', action='store_true', help='Remove staff and logs seeded with this prefix first')
+
+    def handle(self, *args, **options):
+        prefix = options['prefix']
+        if len(id_card_for(prefix, 0)) > EmployeeProfile.id_card_number.max_length:
+            raise CommandError('--prefix is too long for an ID card number')
+        if not 0 < options['fill'] <= 1:
+            raise CommandError('--fill must be between 0 and 1')
+        try:
+            end = (
+                datetime.datetime.strptime(options['end'], '%Y-%m-%d').date()
+                if options['end'] else datetime.date.today()
+            )
+        except ValueError:
+            raise CommandError('--end must be a YYYY-MM-DD date')
+        start = end - datetime.timedelta(days=options['days'] - 1)
+
+        users = User._get_collection()
+        seeded = {'username': {'$regex': f'^{re.escape(prefix)}[0-9]+$'}}
+        if options['clear']:
+            self.clear(prefix, seeded)
+        elif users.count_documents(seeded, limit=1):
+            raise CommandError(f'Staff seeded with prefix {prefix!r} already exist; use --clear to replace them')
+
+        now = datetime.datetime.utcnow()
+        # Hashing once is enough: every seeded staff member shares the password
+        staff = list(staff_docs(prefix, options['employees'], make_password(options['password']), now))
+        users.insert_many([user for user, _ in staff])
+        EmployeeProfile._get_collection().insert_many([profile for _, profile in staff])
+
+        rng = random.Random(options['random_seed'])
+        logs = log_docs([user['_id'] for user, _ in staff], start, end, options['fill'], rng, now)
+        collection = DailyLog._get_collection()
+        written = 0
+        while batch := list(islice(logs, INSERT_BATCH_SIZE)):
+            collection.insert_many(batch, ordered=False)
+            written += len(batch)
+            self.stdout.write(f'  {written} log(s)', ending='\r')
+
+        # Seeded logs bypass save_log, so the rollups are recomputed from them
+        rebuild_summaries()
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Seeded {len(staff)} staff ({id_card_for(prefix, 0)}..., password {options["password"]!r}) '
+            f'and {written} log(s) from {start} to {end}'
+        ))
+
+    def clear(self, prefix, seeded):
+        ids = [user['_id'] for user in User._get_collection().find(seeded, {'_id': 1})]
+        DailyLog._get_collection().delete_many({'employee': {'$in': ids}})
+        DailySummary._get_collection().delete_many({'employee': {'$in': ids}})
+        EmployeeProfile._get_collection().delete_many({'user': {'$in': ids}})
+        User._get_collection().delete_many({'_id': {'$in': ids}})
+        # Django users made on their first login only carry sessions
+        DjangoUser.objects.filter(username__regex=f'^{re.escape(prefix)}[0-9]+$').delete()
+        self.stdout.write(f'Removed {len(ids)} previously seeded staff and their logs')
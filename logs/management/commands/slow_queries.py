@@ -0,0 +1,48 @@
+import datetime
+import json
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from logs.slowlog import read_records, top_offenders
+
+
+class Command(BaseCommand):
+    help = 'Rank the recorded slow Mongo operations by the total time of their query shape'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hours', type=float, default=None, help='Only operations of the last N hours')
+        parser.add_argument('--limit', type=int, default=10, help='Query shapes to show')
+        parser.add_argument('--json', action='store_true', help='Print the report as JSON')
+
+    def handle(self, *args, **options):
+        since = timezone.now() - datetime.timedelta(hours=options['hours']) if options['hours'] else None
+        offenders = top_offenders(read_records(since), options['limit'])
+
+        if options['json']:
+            self.stdout.write(json.dumps(offenders, indent=2, default=str))
+            return
+        if not offenders:
+            self.stdout.write('No slow operations recorded')
+            return
+        for rank, offender in enumerate(offenders, 1):
+            self.stdout.write(self.style.MIGRATE_HEADING(
+                f"{rank}. {offender['command']} on {offender['collection']}: "
+                f"{offender['total_ms']:.0f}ms in {offender['count']} op(s), "
+                f"mean {offender['mean_ms']:.0f}ms, max {offender['max_ms']:.0f}ms"
+            ))
+            self.stdout.write(f"  shape: {offender['shape']}")
+            self.stdout.write(f"  views: {', '.join(offender['views'])}")
+            if offender['failed']:
+                self.stdout.write(self.style.WARNING(f"  {offender['failed']} failed"))
+            plan = offender['plan']
+            if not plan:
+                continue
+            if 'error' in plan:
+                self.stdout.write(self.style.WARNING(f"  explain failed: {plan['error']}"))
+                continue
+            line = (
+                f"  plan: {plan['index'] or 'no index'} [{' > '.join(plan['stages'])}] "
+                f"keys={plan['keys_examined']} docs={plan['docs_examined']} returned={plan['returned']}"
+            )
+            self.stdout.write(self.style.WARNING(line) if plan['collscan'] or plan['in_memory_sort'] else line)
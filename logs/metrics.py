@@ -0,0 +1,312 @@
+"""Where the time of a request goes.
+
+RequestMetricsMiddleware gives each request a RequestTimings, kept in a
+context variable so the pieces below can find it from whatever thread or
+task does the work:
+
+- MongoCommandTimer, a pymongo CommandListener, adds every Mongo command
+  sent by the sync or the async client;
+- an execute wrapper installed on each Django database connection adds the
+  SQLite queries (sessions, Django users);
+- TimedDjangoTemplates adds template rendering;
+- timed('export') wraps building a workbook, and a streamed response
+  counts the time spent producing its body.
+
+The totals go out in a Server-Timing header when SERVER_TIMING is on, and
+into per-view histograms that ``/metrics`` exposes in the Prometheus text
+format. The histograms live in the worker process; every series carries
+its pid, so a scraper reaching the workers at random can still sum them.
+"""
+import contextvars
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.http import FileResponse
+from django.template.backends.django import DjangoTemplates, Template
+from pymongo import monitoring
+
+COMPONENTS = ('mongo', 'sqlite', 'template', 'export')
+
+# Upper bounds, in seconds, of the histogram buckets
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_current = contextvars.ContextVar('request_timings', default=None)
+
+
+class RequestTimings:
+    """Count and seconds spent per component during one request."""
+
+    def __init__(self, request=None):
+        self.request = request
+        self.started = time.perf_counter()
+        self.counts = dict.fromkeys(COMPONENTS, 0)
+        self.seconds = dict.fromkeys(COMPONENTS, 0.0)
+        # Mongo events of the async client and a worker thread may interleave
+        self.lock = threading.Lock()
+
+    def add(self, component, seconds, count=1):
+        with self.lock:
+            self.counts[component] += count
+            self.seconds[component] += seconds
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+
+def add(component, seconds, count=1):
+    """Charge work to the current request, if there is one."""
+    timings = _current.get()
+    if timings is not None:
+        timings.add(component, seconds, count)
+
+
+@contextmanager
+def timed(component):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        add(component, time.perf_counter() - start)
+
+
+class MongoCommandTimer(monitoring.CommandListener):
+    """Charges each Mongo command to the request it was sent for."""
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        add('mongo', event.duration_micros / 1e6)
+
+    def failed(self, event):
+        add('mongo', event.duration_micros / 1e6)
+
+
+def time_query(execute, sql, params, many, context):
+    """Django database execute wrapper timing each query."""
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        add('sqlite', time.perf_counter() - start)
+
+
+def instrument_connection(sender, connection, **kwargs):
+    """connection_created receiver installing time_query on every new connection."""
+    if time_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(time_query)
+
+
+class TimedTemplate(Template):
+
+    def render(self, context=None, request=None):
+        with timed('template'):
+            return super().render(context, request)
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """The Django template backend, timing each top-level render."""
+
+    def from_string(self, template_code):
+        return TimedTemplate(super().from_string(template_code).template, self)
+
+    def get_template(self, template_name):
+        return TimedTemplate(super().get_template(template_name).template, self)
+
+
+class Histogram:
+    """A Prometheus histogram: cumulative bucket counts, a sum and a count."""
+
+    def __init__(self):
+        self.buckets = [0] * len(BUCKETS)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for index, bound in enumerate(BUCKETS):
+            if value <= bound:
+                self.buckets[index] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Registry:
+    """Per-view request and component histograms of this process."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = {}
+        self.components = {}
+        self.operations = {}
+
+    def record(self, view, timings, seconds):
+        with timings.lock:
+            counts, component_seconds = dict(timings.counts), dict(timings.seconds)
+        with self.lock:
+            self.requests.setdefault(view, Histogram()).observe(seconds)
+            for component in COMPONENTS:
+                if not counts[component]:
+                    continue
+                self.components.setdefault((view, component), Histogram()).observe(component_seconds[component])
+                self.operations[(view, component)] = self.operations.get((view, component), 0) + counts[component]
+
+    def exposition(self):
+        """The metrics in the Prometheus text format."""
+        pid = os.getpid()
+        lines = []
+        with self.lock:
+            lines += _histogram_lines(
+                'daily_request_duration_seconds', 'Time to produce a response, by view',
+                {f'view="{view}",pid="{pid}"': histogram for view, histogram in sorted(self.requests.items())},
+            )
+            lines += _histogram_lines(
+                'daily_request_component_seconds',
+                'Time per request spent in Mongo, SQLite, templates and exports, by view',
+                {
+                    f'view="{view}",component="{component}",pid="{pid}"': histogram
+                    for (view, component), histogram in sorted(self.components.items())
+                },
+            )
+            lines.append('# HELP daily_request_component_operations_total Mongo commands, SQLite queries, '
+                         'renders and exports, by view')
+            lines.append('# TYPE daily_request_component_operations_total counter')
+            for (view, component), count in sorted(self.operations.items()):
+                lines.append(
+                    f'daily_request_component_operations_total{{view="{view}",component="{component}",pid="{pid}"}} {count}'
+                )
+        return '\n'.join(lines) + '\n'
+
+
+def _histogram_lines(name, help_text, histograms):
+    lines = [f'# HELP {name} {help_text}', f'# TYPE {name} histogram']
+    for labels, histogram in histograms.items():
+        for bound, count in zip(BUCKETS, histogram.buckets):
+            lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {count}')
+        lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {histogram.count}')
+        lines.append(f'{name}_sum{{{labels}}} {histogram.sum}')
+        lines.append(f'{name}_count{{{labels}}} {histogram.count}')
+    return lines
+
+
+REGISTRY = Registry()
+
+
+def server_timing(timings, total):
+    """Server-Timing header value: one metric per component used, then the total."""
+    parts = []
+    for component in COMPONENTS:
+        if timings.counts[component]:
+            parts.append(
+                f'{component};dur={timings.seconds[component] * 1000:.1f};desc="{timings.counts[component]}x"'
+            )
+    parts.append(f'total;dur={total * 1000:.1f}')
+    return ', '.join(parts)
+
+
+def _view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    return match.view_name if match else 'unmatched'
+
+
+def current_view():
+    """Name of the view serving the current request, or None outside one."""
+    timings = _current.get()
+    if timings is None or timings.request is None:
+        return None
+    return _view_name(timings.request)
+
+
+class RequestMetricsMiddleware:
+    """Times each request and its components; see the module docstring.
+
+    Works under both WSGI and ASGI. A streamed export is produced after the
+    headers are sent, so the histograms of a streamed response include it
+    but its Server-Timing header does not. A file response is already
+    written and is passed through untouched.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        timings = RequestTimings(request)
+        token = _current.set(timings)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, timings)
+
+    async def __acall__(self, request):
+        timings = RequestTimings(request)
+        token = _current.set(timings)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, timings)
+
+    def finish(self, request, response, timings):
+        view = _view_name(request)
+        if settings.SERVER_TIMING:
+            response['Server-Timing'] = server_timing(timings, timings.elapsed())
+        if response.streaming and not isinstance(response, FileResponse):
+            response.streaming_content = _timed_stream(response.streaming_content, response.is_async, timings, view)
+        else:
+            REGISTRY.record(view, timings, timings.elapsed())
+        return response
+
+
+def _timed_stream(content, is_async, timings, view):
+    """The body of a streamed response, charged to its request as an export."""
+    def done():
+        timings.add('export', 0)
+        REGISTRY.record(view, timings, timings.elapsed())
+
+    if is_async:
+        async def chunks():
+            iterator = aiter(content)
+            try:
+                while True:
+                    token = _current.set(timings)
+                    start = time.perf_counter()
+                    try:
+                        chunk = await anext(iterator)
+                    except StopAsyncIteration:
+                        return
+                    finally:
+                        timings.add('export', time.perf_counter() - start, count=0)
+                        _current.reset(token)
+                    yield chunk
+            finally:
+                done()
+        return chunks()
+
+    def chunks():
+        iterator = iter(content)
+        try:
+            while True:
+                token = _current.set(timings)
+                start = time.perf_counter()
+                try:
+                    chunk = next(iterator)
+                except StopIteration:
+                    return
+                finally:
+                    timings.add('export', time.perf_counter() - start, count=0)
+                    _current.reset(token)
+                yield chunk
+        finally:
+            done()
+    return chunks()
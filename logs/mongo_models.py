@@ -1,6 +1,9 @@
-from mongoengine import Document, fields
+from mongoengine import Document, ValidationError, fields
 import datetime
 
+from logs.days import day_key
+from logs.schedule import is_scheduled, slot_for
+
 class User(Document):
     username = fields.StringField(required=True, unique=True)
     email = fields.EmailField(required=True, unique=True)
@@ -44,7 +47,11 @@ class DailyLog(Document):
 
     employee = fields.ReferenceField(User, required=True) 
     date = fields.DateTimeField(default=datetime.datetime.utcnow)
+    # Calendar day of date as yyyymmdd; all date filters go through this
+    day = fields.IntField()
     time_interval = fields.StringField(max_length=20, required=True)
+    # Position of time_interval in the schedule, used for ordering and comparison
+    slot = fields.IntField(min_value=0)
     description = fields.StringField(required=True)
     status = fields.StringField(choices=[s[0] for s in STATUS_CHOICES], default='Ongoing')
     created_at = fields.DateTimeField(default=datetime.datetime.utcnow)
@@ -53,10 +60,18 @@ class DailyLog(Document):
     meta = {
         'collection': 'logs_dailylog',
         'indexes': [
-            'employee',
-            'date',
-            'time_interval',
-            {'fields': ['employee', 'date', 'time_interval'], 'unique': True}
+            # Upsert key of daily_log_view; its employee and employee+day
+            # prefixes also serve the per-staff queries and exports. Logs
+            # without a day (not yet backfilled) are left out of it.
+            {
+                'fields': ['employee', 'day', 'time_interval'],
+                'unique': True,
+                'partialFilterExpression': {'day': {'$exists': True}},
+            },
+            # Day filters sorted like the admin dashboard and exports
+            {'fields': ['-day', 'slot', 'id']},
+            # Full-text search of descriptions; see logs.search
+            {'fields': ['$description'], 'default_language': 'english'},
         ],
         'ordering': ['-date', '-created_at']
     }
@@ -64,6 +79,47 @@ class DailyLog(Document):
     def __str__(self):
         return f"{self.employee.username} - {self.date.strftime('%Y-%m-%d')} - {self.time_interval}"
 
+    def clean(self):
+        if self.date and self.time_interval and not is_scheduled(self.date, self.time_interval):
+            raise ValidationError(f"{self.time_interval} is not on the schedule for {self.date:%A}s")
+        self.slot = slot_for(self.time_interval)
+        if self.date:
+            self.day = day_key(self.date)
+
     def save(self, *args, **kwargs):
         self.updated_at = datetime.datetime.utcnow()
         return super().save(*args, **kwargs)
+
+
+class DailySummary(Document):
+    """Per-employee counts for one day, kept in step with DailyLog by logs.rollups."""
+    employee = fields.ReferenceField(User, required=True)
+    day = fields.IntField(required=True)
+    # Logs saved for the day, i.e. filled slots
+    filled = fields.IntField(default=0)
+    ongoing = fields.IntField(default=0)
+    pending = fields.IntField(default=0)
+    completed = fields.IntField(default=0)
+
+    meta = {
+        'collection': 'daily_summary',
+        'indexes': [
+            # One summary per employee and day; the day prefix serves the stats endpoint
+            {'fields': ['day', 'employee'], 'unique': True},
+        ],
+    }
+
+
+class MongoSession(Document):
+    """A Django session, for the logs.sessions engine."""
+    session_key = fields.StringField(primary_key=True, max_length=40)
+    session_data = fields.StringField(required=True)
+    expire_date = fields.DateTimeField(required=True)
+
+    meta = {
+        'collection': 'django_session',
+        'indexes': [
+            # MongoDB removes sessions once they expire
+            {'fields': ['expire_date'], 'expireAfterSeconds': 0},
+        ],
+    }
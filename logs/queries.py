@@ -0,0 +1,259 @@
+import base64
+import binascii
+import json
+from bisect import bisect_left, bisect_right
+from itertools import islice
+
+from bson import ObjectId
+from bson.errors import InvalidId
+
+from logs.caching import timestamp
+from logs.mongo_models import User
+
+# Only the fields needed to print a staff name are fetched for referenced users
+EMPLOYEE_FIELDS = ('username', 'first_name', 'last_name')
+
+# Number of logs whose employees are resolved together in one query
+EMPLOYEE_BATCH_SIZE = 500
+
+DEFAULT_PAGE_SIZE = 50
+
+# Dashboard order of logs, as a pymongo sort
+PAGE_SORT = [('day', -1), ('slot', 1), ('_id', 1)]
+
+# Everything the read-only views and exports show of a log
+LOG_FIELDS = ('employee', 'date', 'day', 'slot', 'time_interval', 'description', 'status')
+
+
+class LogRow:
+    """A log read straight from its raw dict, for pages and exports that never save it.
+
+    Building one costs a few attribute stores, against field validation,
+    reference proxies and change tracking for a DailyLog. ``staff_name`` is
+    filled in by attach_staff_names().
+    """
+
+    __slots__ = ('id', 'employee', 'date', 'day', 'slot', 'time_interval', 'description', 'status', 'staff_name')
+
+    def __init__(self, doc):
+        get = doc.get
+        self.id = doc['_id']
+        self.employee = get('employee')
+        self.date = get('date')
+        self.day = get('day')
+        self.slot = get('slot')
+        self.time_interval = get('time_interval')
+        self.description = get('description')
+        self.status = get('status')
+        self.staff_name = None
+
+
+def log_rows(logs, fields=LOG_FIELDS):
+    """Iterate a DailyLog queryset as LogRows holding only ``fields``."""
+    for doc in logs.only(*fields).as_pymongo():
+        yield LogRow(doc)
+
+
+def load_employees(user_ids, read_preference=None):
+    """Fetch the name fields of many users in one query, keyed by id."""
+    ids = list(set(user_ids))
+    if not ids:
+        return {}
+    users = User.objects(id__in=ids).only(*EMPLOYEE_FIELDS)
+    if read_preference is not None:
+        users = users.read_preference(read_preference)
+    return {user.id: user for user in users}
+
+
+def staff_name(user):
+    """Full name of a user, falling back to the username."""
+    if user is None:
+        return "Unknown"
+    full_name = f"{user.first_name or ''} {user.last_name or ''}".strip()
+    return full_name or user.username
+
+
+def attach_staff_names(rows, read_preference=None):
+    """Set the staff_name of a list of LogRows, loading their employees in one query."""
+    employees = load_employees((row.employee for row in rows if row.employee), read_preference)
+    for row in rows:
+        row.staff_name = staff_name(employees.get(row.employee))
+    return rows
+
+
+def with_staff_names(rows, batch_size=EMPLOYEE_BATCH_SIZE, read_preference=None):
+    """Yield LogRows with their staff_name set.
+
+    References are not dereferenced one by one; instead the employees of each
+    batch of rows are loaded with a single query.
+    """
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            return
+        yield from attach_staff_names(batch, read_preference)
+
+
+def pack_cursor(key):
+    """Opaque, URL-safe form of a list of JSON values."""
+    return base64.urlsafe_b64encode(json.dumps(key).encode()).decode()
+
+
+def unpack_cursor(cursor):
+    return json.loads(base64.urlsafe_b64decode(cursor.encode()))
+
+
+def encode_cursor(log):
+    """Opaque cursor for a log's position in the (-day, slot, id) order."""
+    return pack_cursor([log.day, log.slot, str(log.id)])
+
+
+def decode_cursor(cursor):
+    """Inverse of encode_cursor; raises ValueError for anything malformed."""
+    try:
+        day, slot, log_id = unpack_cursor(cursor)
+        if not all(value is None or isinstance(value, int) for value in (day, slot)):
+            raise TypeError(cursor)
+        return day, slot, ObjectId(log_id)
+    except (TypeError, ValueError, InvalidId, binascii.Error) as e:
+        raise ValueError(f"Invalid cursor: {cursor!r}") from e
+
+
+def _row_key(row):
+    # (-day, slot, id) as a sortable tuple; a missing slot sorts first like null does
+    return -(row.day or 0), -1 if row.slot is None else row.slot, row.id
+
+
+def keyset_slice(rows, after=None, before=None, page_size=DEFAULT_PAGE_SIZE):
+    """keyset_page_rows() without the staff names."""
+    rows = sorted(rows, key=_row_key)
+    keys = [_row_key(row) for row in rows]
+    if before:
+        day, slot, log_id = decode_cursor(before)
+        end = bisect_left(keys, _row_key(LogRow({'_id': log_id, 'day': day, 'slot': slot})))
+        start = max(end - page_size, 0)
+        has_previous, has_next = start > 0, True
+    else:
+        start = 0
+        if after:
+            day, slot, log_id = decode_cursor(after)
+            start = bisect_right(keys, _row_key(LogRow({'_id': log_id, 'day': day, 'slot': slot})))
+        end = start + page_size
+        has_previous, has_next = bool(after), end < len(rows)
+
+    page = rows[start:end]
+    if not page:
+        return [], None, None
+    next_cursor = encode_cursor(page[-1]) if has_next else None
+    prev_cursor = encode_cursor(page[0]) if has_previous else None
+    return page, next_cursor, prev_cursor
+
+
+def keyset_page_rows(rows, after=None, before=None, page_size=DEFAULT_PAGE_SIZE, read_preference=None):
+    """keyset_page() over LogRows already in memory, e.g. read from the archive."""
+    page, next_cursor, prev_cursor = keyset_slice(rows, after, before, page_size)
+    return attach_staff_names(page, read_preference), next_cursor, prev_cursor
+
+
+# Page sort fields a legacy log may lack
+NULLABLE = ('day', 'slot')
+
+
+def _after(field, value, direction):
+    """Filter for values of a field sorting after ``value`` in a direction.
+
+    Like MongoDB, null (or a missing field, as on logs saved before the day
+    and slot backfills) sorts below any number; None when nothing can follow.
+    """
+    if field not in NULLABLE:
+        return {field: {'$gt' if direction > 0 else '$lt': value}}
+    if direction > 0:
+        return {field: {'$ne': None}} if value is None else {field: {'$gt': value}}
+    if value is None:
+        return None
+    return {'$or': [{field: {'$lt': value}}, {field: None}]}
+
+
+def _seek(sort, values):
+    # Rows equal on the leading fields and after the cursor on the next one
+    clauses = []
+    for index, (field, direction) in enumerate(sort):
+        after = _after(field, values[index], direction)
+        if after is not None:
+            clauses.append(dict({name: value for (name, _), value in zip(sort[:index], values)}, **after))
+    return {'$or': clauses}
+
+
+def keyset_query(after=None, before=None):
+    """Raw filter and sort fetching the logs of the page after or before a cursor.
+
+    The sort is reversed when paging backwards; keyset_result() puts the page
+    back in order. Raises ValueError for a malformed cursor.
+    """
+    if before:
+        sort = [(field, -direction) for field, direction in PAGE_SORT]
+        return _seek(sort, decode_cursor(before)), sort
+    if after:
+        return _seek(PAGE_SORT, decode_cursor(after)), PAGE_SORT
+    return {}, PAGE_SORT
+
+
+def _order_by(sort):
+    return [('-' if direction < 0 else '+') + ('id' if field == '_id' else field) for field, direction in sort]
+
+
+def keyset_page(logs, after=None, before=None, page_size=DEFAULT_PAGE_SIZE, read_preference=None):
+    """One page of logs in (-day, slot, id) order, seeking from a cursor.
+
+    Pass the ``next_cursor`` of a page as ``after`` to get the page following
+    it, or its ``prev_cursor`` as ``before`` to go back. Returns the page as
+    LogRows with their staff names, and the cursors of its neighbours, which
+    are None when there is no such page. The logs and the staff names are
+    read with ``read_preference`` when it is given.
+    """
+    seek, sort = keyset_query(after, before)
+    logs = logs.filter(__raw__=seek).order_by(*_order_by(sort))
+    if read_preference is not None:
+        logs = logs.read_preference(read_preference)
+
+    # One extra row tells whether there is a page beyond this one
+    rows = list(log_rows(logs.limit(page_size + 1)))
+    page, next_cursor, prev_cursor = keyset_result(rows, after, before, page_size)
+    return attach_staff_names(page, read_preference), next_cursor, prev_cursor
+
+
+def keyset_result(rows, after=None, before=None, page_size=DEFAULT_PAGE_SIZE):
+    """The page and neighbouring cursors from up to page_size + 1 rows read with keyset_query()."""
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+    if before:
+        rows.reverse()
+
+    if not rows:
+        return [], None, None
+    if before:
+        next_cursor = encode_cursor(rows[-1])
+        prev_cursor = encode_cursor(rows[0]) if has_more else None
+    else:
+        next_cursor = encode_cursor(rows[-1]) if has_more else None
+        prev_cursor = encode_cursor(rows[0]) if after else None
+    return rows, next_cursor, prev_cursor
+
+
+def day_view(mongo_user, docs):
+    """The cached form of a user's day: their names and the day's raw logs, in slot order."""
+    fields = ('time_interval', 'description', 'status')
+    updated = [doc['updated_at'] for doc in docs if doc.get('updated_at')]
+    return {
+        'user': {
+            'id': str(mongo_user['_id']),
+            'username': mongo_user.get('username'),
+            'first_name': mongo_user.get('first_name'),
+            'last_name': mongo_user.get('last_name'),
+        },
+        'logs': [{field: doc.get(field) for field in fields} for doc in docs],
+        # Changes whenever a log of the day is saved; drives ETags and the table cache
+        'last_modified': timestamp(max(updated)) if updated else None,
+        'version': f"{timestamp(max(updated)) if updated else 0}-{len(docs)}",
+    }
@@ -0,0 +1,210 @@
+"""Daily rollups of staff activity.
+
+Every log save applies its effect to the employee's DailySummary for the day
+with a single ``$inc``, so per-day statistics are read from one small document
+per staff member instead of counted over the logs. The log upsert and the
+``$inc`` are two separate atomic writes; ``rebuild_daily_summary`` recomputes
+the summaries from the logs should they ever drift apart. Summaries of days
+moved to cold storage by ``archive_logs`` are left as they are.
+"""
+import datetime
+
+from pymongo import ReturnDocument, UpdateOne
+
+from daily.mongo import async_collection
+from logs.archive import read_manifest
+from logs.days import day_from_key
+from logs.mongo_models import DailyLog, DailySummary
+from logs.schedule import intervals_for, slot_for
+
+# Counter of DailySummary for each log status
+STATUS_COUNTERS = {
+    'Ongoing': 'ongoing',
+    'Pending': 'pending',
+    'Completed': 'completed',
+}
+
+COUNTERS = ('filled',) + tuple(STATUS_COUNTERS.values())
+
+
+def summary_changes(previous_status, status, created):
+    """Counter increments for a log saved with ``status``.
+
+    ``previous_status`` is the status the log had before the save and is
+    ignored when the save ``created`` the log.
+    """
+    inc = {}
+    if created:
+        inc['filled'] = 1
+    elif previous_status in STATUS_COUNTERS:
+        inc[STATUS_COUNTERS[previous_status]] = -1
+    if status in STATUS_COUNTERS:
+        counter = STATUS_COUNTERS[status]
+        inc[counter] = inc.get(counter, 0) + 1
+    return {counter: value for counter, value in inc.items() if value}
+
+
+def save_log(employee_id, day, date, time_interval, slot, description, status):
+    """Upsert one log and move its day's summary counters to match."""
+    now = datetime.datetime.utcnow()
+    previous = DailyLog.objects(
+        employee=employee_id,
+        day=day,
+        time_interval=time_interval,
+    ).only('status').modify(
+        upsert=True,
+        new=False,
+        set__description=description,
+        set__status=status,
+        set__slot=slot,
+        set__updated_at=now,
+        set_on_insert__date=date,
+        set_on_insert__created_at=now,
+    )
+    inc = summary_changes(previous.status if previous else None, status, created=previous is None)
+    if inc:
+        DailySummary.objects(employee=employee_id, day=day).update_one(
+            upsert=True, **{f'inc__{counter}': value for counter, value in inc.items()}
+        )
+
+
+def log_upsert(employee_id, day, date, time_interval, description, status, now):
+    """Filter and update that save one log with an upsert."""
+    return (
+        {'employee': employee_id, 'day': day, 'time_interval': time_interval},
+        {
+            '$set': {
+                'description': description,
+                'status': status,
+                'slot': slot_for(time_interval),
+                'updated_at': now,
+            },
+            '$setOnInsert': {'date': date, 'created_at': now},
+        },
+    )
+
+
+async def asave_log(employee_id, day, date, time_interval, description, status):
+    """save_log() through the async client, for the async views."""
+    query, update = log_upsert(employee_id, day, date, time_interval, description, status, datetime.datetime.utcnow())
+    previous = await async_collection(DailyLog).find_one_and_update(
+        query, update, projection={'status': 1}, upsert=True, return_document=ReturnDocument.BEFORE,
+    )
+    inc = summary_changes(previous.get('status') if previous else None, status, created=previous is None)
+    if inc:
+        await async_collection(DailySummary).update_one({'employee': employee_id, 'day': day}, {'$inc': inc}, upsert=True)
+
+
+def save_logs(employee_id, day, date, entries):
+    """Upsert many logs of one day in a single bulk_write and update the day's summary.
+
+    ``entries`` are dicts with time_interval, description and status; a later
+    entry for the same interval wins. Returns, per entry, whether it created
+    a log. Previous statuses are read just before the write, so a save racing
+    with this one for the same interval can leave the summary off until it
+    is rebuilt.
+    """
+    collection = DailyLog._get_collection()
+    now = datetime.datetime.utcnow()
+    intervals = [entry['time_interval'] for entry in entries]
+    statuses = {
+        doc['time_interval']: doc.get('status')
+        for doc in collection.find(
+            {'employee': employee_id, 'day': day, 'time_interval': {'$in': intervals}},
+            {'time_interval': 1, 'status': 1},
+        )
+    }
+
+    result = collection.bulk_write([
+        UpdateOne(
+            *log_upsert(employee_id, day, date, entry['time_interval'], entry['description'], entry['status'], now),
+            upsert=True,
+        )
+        for entry in entries
+    ])
+
+    created, inc = [], {}
+    for index, entry in enumerate(entries):
+        was_created = index in result.upserted_ids
+        changes = summary_changes(statuses.get(entry['time_interval']), entry['status'], was_created)
+        for counter, value in changes.items():
+            inc[counter] = inc.get(counter, 0) + value
+        statuses[entry['time_interval']] = entry['status']
+        created.append(was_created)
+
+    inc = {counter: value for counter, value in inc.items() if value}
+    if inc:
+        DailySummary.objects(employee=employee_id, day=day).update_one(
+            upsert=True, **{f'inc__{counter}': value for counter, value in inc.items()}
+        )
+    return created
+
+
+def day_summaries(first_day, last_day):
+    """Raw summaries of every employee between two day keys, inclusive."""
+    return DailySummary.objects(day__gte=first_day, day__lte=last_day).order_by('day').exclude('id').as_pymongo()
+
+
+def empty_slots(summary):
+    return max(len(intervals_for(day_from_key(summary['day']))) - summary.get('filled', 0), 0)
+
+
+def rebuild_pipeline(horizon=None):
+    """Aggregation that recomputes the summaries of days from ``horizon`` on and merges them into daily_summary.
+
+    Archived days before the horizon have no logs left in the collection, so
+    their summaries are not touched.
+    """
+    counts = {'filled': {'$sum': 1}}
+    for status, counter in STATUS_COUNTERS.items():
+        counts[counter] = {'$sum': {'$cond': [{'$eq': ['$status', status]}, 1, 0]}}
+    return [
+        {'$match': {'day': {'$exists': True} if horizon is None else {'$gte': horizon}}},
+        {'$group': {'_id': {'employee': '$employee', 'day': '$day'}, **counts}},
+        {'$project': {
+            '_id': 0,
+            'employee': '$_id.employee',
+            'day': '$_id.day',
+            **{counter: 1 for counter in COUNTERS},
+        }},
+        # Unlike $out, $merge keeps the summaries it does not recompute
+        {'$merge': {
+            'into': DailySummary._get_collection_name(),
+            'on': ['day', 'employee'],
+            'whenMatched': 'replace',
+            'whenNotMatched': 'insert',
+        }},
+    ]
+
+
+def stale_summaries_pipeline(horizon=None):
+    """Summaries of days from ``horizon`` on that no log is left for."""
+    return [
+        {'$match': {'day': {'$exists': True} if horizon is None else {'$gte': horizon}}},
+        {'$lookup': {
+            'from': DailyLog._get_collection_name(),
+            'let': {'employee': '$employee', 'day': '$day'},
+            'pipeline': [
+                {'$match': {'$expr': {'$and': [
+                    {'$eq': ['$employee', '$$employee']},
+                    {'$eq': ['$day', '$$day']},
+                ]}}},
+                {'$limit': 1},
+                {'$project': {'_id': 1}},
+            ],
+            'as': 'logs',
+        }},
+        {'$match': {'logs.0': {'$exists': False}}},
+        {'$project': {'_id': 1}},
+    ]
+
+
+def rebuild_summaries():
+    """Recompute the summaries of the days still in the collection from their logs."""
+    horizon = read_manifest()['horizon']
+    # $merge needs the unique (day, employee) index
+    summaries = DailySummary._get_collection()
+    DailyLog._get_collection().aggregate(rebuild_pipeline(horizon), allowDiskUse=True)
+    stale = [doc['_id'] for doc in summaries.aggregate(stale_summaries_pipeline(horizon), allowDiskUse=True)]
+    if stale:
+        summaries.delete_many({'_id': {'$in': stale}})
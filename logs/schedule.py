@@ -0,0 +1,52 @@
+"""The fixed half-hour schedule staff log against.
+
+Intervals are computed once at import. Each interval also has an integer
+slot, the number of half hours from midnight to its start, which sorts and
+compares like the interval itself and is what DailyLog stores in ``slot``.
+"""
+from types import MappingProxyType
+
+SLOT_MINUTES = 30
+
+WEEKDAY = 'weekday'
+SATURDAY = 'saturday'
+
+
+def _intervals(start_hour, end_hour):
+    intervals = []
+    for start in range(start_hour * 60, end_hour * 60, SLOT_MINUTES):
+        end = start + SLOT_MINUTES
+        intervals.append(f"{start // 60:02d}:{start % 60:02d} - {end // 60:02d}:{end % 60:02d}")
+    return tuple(intervals)
+
+
+# Weekday type -> the day's intervals, in order
+SCHEDULES = MappingProxyType({
+    WEEKDAY: _intervals(8, 17),
+    SATURDAY: _intervals(9, 14),
+})
+
+# Every interval on any schedule -> its slot
+SLOTS = MappingProxyType({
+    interval: int(interval[:2]) * 60 // SLOT_MINUTES + int(interval[3:5]) // SLOT_MINUTES
+    for intervals in SCHEDULES.values()
+    for interval in intervals
+})
+
+
+def day_type(date):
+    return SATURDAY if date.weekday() == 5 else WEEKDAY
+
+
+def intervals_for(date):
+    """The intervals that can be logged on a date."""
+    return SCHEDULES[day_type(date)]
+
+
+def slot_for(time_interval):
+    """Slot of an interval, or None if it is not on any schedule."""
+    return SLOTS.get(time_interval)
+
+
+def is_scheduled(date, time_interval):
+    return time_interval in intervals_for(date)
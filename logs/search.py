@@ -0,0 +1,108 @@
+"""Full-text search over log descriptions.
+
+Matches come from the text index on DailyLog.description, ranked by text
+score and paged with a (score, id) cursor. The whole search is a single
+aggregation returning projected dicts, so no DailyLog is ever built.
+"""
+import binascii
+import re
+
+from bson import ObjectId
+from bson.errors import InvalidId
+from django.utils.html import escape
+
+from logs.mongo_models import DailyLog
+from logs.queries import pack_cursor, unpack_cursor
+
+DEFAULT_SEARCH_PAGE_SIZE = 20
+
+# Characters of description shown around the first match
+SNIPPET_LENGTH = 160
+
+SEARCH_FIELDS = ('employee', 'day', 'time_interval', 'description', 'status')
+
+
+def encode_search_cursor(result):
+    return pack_cursor([result['score'], str(result['_id'])])
+
+
+def decode_search_cursor(cursor):
+    """Inverse of encode_search_cursor; raises ValueError for anything malformed."""
+    try:
+        score, log_id = unpack_cursor(cursor)
+        if not isinstance(score, (int, float)):
+            raise TypeError(cursor)
+        return score, ObjectId(log_id)
+    except (TypeError, ValueError, InvalidId, binascii.Error) as e:
+        raise ValueError(f"Invalid cursor: {cursor!r}") from e
+
+
+def search_pipeline(text, employee=None, first_day=None, last_day=None, after=None, page_size=DEFAULT_SEARCH_PAGE_SIZE):
+    """Aggregation for one page of matches, best first; ``after`` is a search cursor."""
+    match = {'$text': {'$search': text}}
+    if employee is not None:
+        match['employee'] = employee
+    if first_day is not None or last_day is not None:
+        match['day'] = {}
+        if first_day is not None:
+            match['day']['$gte'] = first_day
+        if last_day is not None:
+            match['day']['$lte'] = last_day
+
+    pipeline = [
+        {'$match': match},
+        {'$project': {'score': {'$meta': 'textScore'}, **{field: 1 for field in SEARCH_FIELDS}}},
+    ]
+    if after:
+        score, log_id = decode_search_cursor(after)
+        pipeline.append({'$match': {'$or': [
+            {'score': {'$lt': score}},
+            {'score': score, '_id': {'$gt': log_id}},
+        ]}})
+    pipeline += [
+        {'$sort': {'score': -1, '_id': 1}},
+        # One extra result tells whether there is another page
+        {'$limit': page_size + 1},
+    ]
+    return pipeline
+
+
+def search_logs(text, employee=None, first_day=None, last_day=None, after=None, page_size=DEFAULT_SEARCH_PAGE_SIZE):
+    """One page of raw matching logs with their score, and the cursor of the next page.
+
+    Raises ValueError for a malformed ``after`` cursor.
+    """
+    pipeline = search_pipeline(text, employee, first_day, last_day, after, page_size)
+    results = list(DailyLog._get_collection().aggregate(pipeline))
+    next_cursor = encode_search_cursor(results[page_size - 1]) if len(results) > page_size else None
+    return results[:page_size], next_cursor
+
+
+def search_terms(text):
+    """Words of a $text query worth highlighting: negated words are left out."""
+    return [word.strip('"') for word in text.split() if word.strip('"') and not word.startswith('-')]
+
+
+def snippet(description, terms, length=SNIPPET_LENGTH):
+    """HTML-escaped excerpt of a description with the search terms in <mark>.
+
+    Words starting with a term are highlighted, a rough stand-in for the
+    stemming the text index does.
+    """
+    description = description or ''
+    if not terms:
+        return escape(description[:length])
+    pattern = re.compile(r'\b(?:' + '|'.join(re.escape(term) for term in terms) + r')\w*', re.IGNORECASE)
+
+    first = pattern.search(description)
+    start = max(first.start() - length // 4, 0) if first else 0
+    end = start + length
+    excerpt = description[start:end]
+
+    parts, position = [], 0
+    for match in pattern.finditer(excerpt):
+        parts.append(escape(excerpt[position:match.start()]))
+        parts.append(f'<mark>{escape(match.group())}</mark>')
+        position = match.end()
+    parts.append(escape(excerpt[position:]))
+    return ('…' if start else '') + ''.join(parts) + ('…' if end < len(description) else '')
@@ -0,0 +1,87 @@
+"""Synthetic staff and logs for benchmarks and local load testing.
+
+Documents are built as raw dicts shaped like the ones the app stores, so
+they can be written with insert_many at full speed.
+"""
+import datetime
+
+from bson import ObjectId
+
+from logs.days import day_key
+from logs.schedule import intervals_for, slot_for
+
+FIRST_NAMES = ('Ada', 'Kwame', 'Amina', 'Chidi', 'Grace', 'Tunde', 'Ngozi', 'Femi', 'Zainab', 'Emeka')
+LAST_NAMES = ('Okafor', 'Mensah', 'Bello', 'Adeyemi', 'Nwosu', 'Owusu', 'Ibrahim', 'Eze', 'Balogun', 'Danso')
+
+DESCRIPTIONS = (
+    'Reviewed and answered customer emails',
+    'Prepared the weekly sales report',
+    'Team standup and planning',
+    'Updated inventory records',
+    'Followed up on pending invoices',
+    'Trained a new colleague on the POS system',
+    'Fixed data entry errors in the ledger',
+    'Called suppliers about late deliveries',
+    'Filed documents and cleaned up shared drive',
+    'Met with the manager about Q3 targets',
+)
+
+# Status mix of a day's logs: settled on older days, mostly in progress on recent ones
+SETTLED_STATUSES = {'Completed': 75, 'Ongoing': 10, 'Pending': 15}
+RECENT_STATUSES = {'Completed': 40, 'Ongoing': 45, 'Pending': 15}
+
+# Days before the last seeded one that still count as recent
+RECENT_DAYS = 2
+
+
+def id_card_for(prefix, index):
+    return f"{prefix.upper()}{index:06d}"
+
+
+def staff_docs(prefix, count, password_hash, now):
+    """(User, EmployeeProfile) raw documents for ``count`` staff named ``<prefix><n>``."""
+    for index in range(count):
+        user_id = ObjectId()
+        username = f"{prefix}{index}"
+        yield {
+            '_id': user_id,
+            'username': username,
+            'email': f"{username}@example.com",
+            'password': password_hash,
+            'first_name': FIRST_NAMES[index % len(FIRST_NAMES)],
+            'last_name': LAST_NAMES[index // len(FIRST_NAMES) % len(LAST_NAMES)],
+            'is_active': True,
+            'is_staff': False,
+            'date_joined': now,
+        }, {
+            '_id': ObjectId(),
+            'user': user_id,
+            'id_card_number': id_card_for(prefix, index),
+        }
+
+
+def log_docs(employee_ids, first_date, last_date, fill, rng, now):
+    """Raw DailyLog documents for every employee and day, inclusive.
+
+    Each employee logs about ``fill`` of a day's intervals.
+    """
+    days = (last_date - first_date).days + 1
+    for offset in range(days):
+        date = first_date + datetime.timedelta(days=offset)
+        weights = RECENT_STATUSES if days - offset <= RECENT_DAYS + 1 else SETTLED_STATUSES
+        stamp = datetime.datetime.combine(date, datetime.time(17)) if date < now.date() else now
+        for employee_id in employee_ids:
+            for time_interval in intervals_for(date):
+                if rng.random() >= fill:
+                    continue
+                yield {
+                    'employee': employee_id,
+                    'date': datetime.datetime.combine(date, datetime.time()),
+                    'day': day_key(date),
+                    'slot': slot_for(time_interval),
+                    'time_interval': time_interval,
+                    'description': rng.choice(DESCRIPTIONS),
+                    'status': rng.choices(list(weights), list(weights.values()))[0],
+                    'created_at': stamp,
+                    'updated_at': stamp,
+                }
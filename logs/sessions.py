@@ -0,0 +1,70 @@
+"""Django session engine storing sessions in MongoDB.
+
+Set ``SESSION_ENGINE = 'logs.sessions'`` to share sessions between
+instances that do not share a disk. A TTL index on ``expire_date`` (see
+MongoSession) removes expired sessions, so ``clearsessions`` has little
+left to do.
+"""
+from django.contrib.sessions.backends.base import CreateError, SessionBase, UpdateError
+from django.utils import timezone
+from pymongo.errors import DuplicateKeyError
+
+from logs.mongo_models import MongoSession
+
+
+def _sessions():
+    return MongoSession._get_collection()
+
+
+class SessionStore(SessionBase):
+
+    def load(self):
+        doc = _sessions().find_one({'_id': self.session_key, 'expire_date': {'$gt': timezone.now()}})
+        if doc is None:
+            self._session_key = None
+            return {}
+        return self.decode(doc['session_data'])
+
+    def exists(self, session_key):
+        return bool(_sessions().count_documents({'_id': session_key}, limit=1))
+
+    def create(self):
+        while True:
+            self._session_key = self._get_new_session_key()
+            try:
+                self.save(must_create=True)
+            except CreateError:
+                # The key was taken meanwhile; try another
+                continue
+            self.modified = True
+            return
+
+    def save(self, must_create=False):
+        if self.session_key is None:
+            return self.create()
+        data = self._get_session(no_load=must_create)
+        doc = {
+            '_id': self._get_or_create_session_key(),
+            'session_data': self.encode(data),
+            'expire_date': self.get_expiry_date(),
+        }
+        if must_create:
+            try:
+                _sessions().insert_one(doc)
+            except DuplicateKeyError:
+                raise CreateError
+            return
+        if not _sessions().replace_one({'_id': doc['_id']}, doc).matched_count:
+            # Deleted since it was loaded, e.g. by a logout in another tab
+            raise UpdateError
+
+    def delete(self, session_key=None):
+        if session_key is None:
+            if self.session_key is None:
+                return
+            session_key = self.session_key
+        _sessions().delete_one({'_id': session_key})
+
+    @classmethod
+    def clear_expired(cls):
+        _sessions().delete_many({'expire_date': {'$lt': timezone.now()}})
@@ -0,0 +1,266 @@
+"""Capture of slow Mongo operations, with their query shape and plan.
+
+SlowQueryListener, a pymongo CommandListener, watches the reads and writes
+the app sends: DailyLog.objects(...) finds and aggregations, profile
+lookups, the finds behind ReferenceField dereferences and the upserts.
+An operation slower than ``settings.SLOW_QUERY_MS`` is recorded with the
+view that sent it and the shape of its filter, every value replaced by
+'?', so no staff data ends up in the record.
+
+Recording happens on a background thread: it re-runs the command under
+``explain`` with executionStats (at most once per shape every
+``SLOW_QUERY_EXPLAIN_INTERVAL`` seconds) and appends the record to a capped
+collection, or to a JSON-lines file when ``SLOW_QUERY_LOG_FILE`` is set.
+Every worker process appends to that file, each record in a single write;
+it is rotated outside the app, e.g. by logrotate. The ``slow_queries``
+command ranks the shapes by total time.
+"""
+import datetime
+import glob
+import gzip
+import json
+import logging
+import os
+import queue
+import threading
+import time
+
+from django.conf import settings
+from mongoengine.connection import get_db
+from pymongo import monitoring
+from pymongo.errors import CollectionInvalid, PyMongoError
+
+from logs.indexes import summarize_plan
+from logs.metrics import current_view
+
+logger = logging.getLogger(__name__)
+
+COLLECTION = 'slow_queries'
+
+# Commands worth recording, and where each keeps its filter
+FILTERS = {
+    'find': 'filter',
+    'aggregate': 'pipeline',
+    'count': 'query',
+    'distinct': 'query',
+    'findAndModify': 'query',
+    'update': 'updates',
+    'delete': 'deletes',
+}
+
+# Session and routing fields explain does not accept
+_UNEXPLAINABLE = {'lsid', 'txnNumber', 'autocommit', 'startTransaction', '$clusterTime', '$db', '$readPreference'}
+
+# Records waiting for the writer; when it falls behind, new ones are dropped
+_QUEUE_SIZE = 1000
+
+_queue = None
+_writer_pid = None
+_writer_lock = threading.Lock()
+_explained = {}
+_capped = False
+
+
+def shape(value):
+    """A filter, sort or pipeline with every value replaced by '?'."""
+    if isinstance(value, dict):
+        return {key: shape(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        # $in lists and the like have one shape however long they are
+        shapes = []
+        for item in value:
+            item_shape = shape(item)
+            if item_shape not in shapes:
+                shapes.append(item_shape)
+        return shapes
+    return '?'
+
+
+def operation_shape(command_name, command):
+    """JSON shape of an operation's filter, and of its sort if it has one."""
+    spec = command.get(FILTERS[command_name]) or {}
+    if command_name == 'update':
+        # upsert is a flag, not data, so it is kept
+        spec = [{'q': shape(update.get('q', {})), 'upsert': update.get('upsert', False)} for update in spec]
+    elif command_name == 'delete':
+        spec = [shape(delete.get('q', {})) for delete in spec]
+    else:
+        spec = shape(spec)
+    described = {'filter': spec}
+    if command.get('sort'):
+        described['sort'] = dict(command['sort'])
+    return json.dumps(described, sort_keys=True, default=str)
+
+
+class SlowQueryListener(monitoring.CommandListener):
+    """Hands operations slower than ``threshold_ms`` to ``sink``."""
+
+    def __init__(self, threshold_ms, sink=None):
+        self.threshold_micros = threshold_ms * 1000
+        self.sink = sink or enqueue
+        self.started_commands = {}
+
+    def _key(self, event):
+        return (event.connection_id, event.request_id)
+
+    def started(self, event):
+        if event.command_name in FILTERS:
+            self.started_commands[self._key(event)] = (event.command, event.database_name, current_view())
+
+    def succeeded(self, event):
+        self.finished(event, failed=False)
+
+    def failed(self, event):
+        self.finished(event, failed=True)
+
+    def finished(self, event, failed):
+        started = self.started_commands.pop(self._key(event), None)
+        if started is None or event.duration_micros < self.threshold_micros:
+            return
+        command, database, view = started
+        name = event.command_name
+        self.sink({
+            'at': datetime.datetime.now(datetime.timezone.utc),
+            'view': view,
+            'command': name,
+            'database': database,
+            'collection': command.get(name),
+            'shape': operation_shape(name, command),
+            'millis': event.duration_micros / 1000,
+            'failed': failed,
+            # Explained and dropped by the writer
+            '_command': command,
+        })
+
+
+def enqueue(record):
+    """Queue a record for the writer thread, started on first use in each process."""
+    global _queue, _writer_pid
+    with _writer_lock:
+        if _queue is None or _writer_pid != os.getpid():
+            _queue = queue.Queue(_QUEUE_SIZE)
+            _writer_pid = os.getpid()
+            threading.Thread(target=_write_forever, args=(_queue,), name='slow-queries', daemon=True).start()
+    try:
+        _queue.put_nowait(record)
+    except queue.Full:
+        pass
+
+
+def _write_forever(records):
+    while True:
+        record = records.get()
+        try:
+            write_record(record)
+        except Exception:
+            logger.exception('Could not record a slow %s on %s', record['command'], record['collection'])
+
+
+def write_record(record):
+    """Explain a captured operation if due, then store it."""
+    command = record.pop('_command')
+    key = (record['collection'], record['command'], record['shape'])
+    now = time.monotonic()
+    record['plan'] = None
+    if settings.SLOW_QUERY_EXPLAIN and now - _explained.get(key, -float('inf')) >= settings.SLOW_QUERY_EXPLAIN_INTERVAL:
+        _explained[key] = now
+        record['plan'] = explain_plan(record['database'], command)
+    if settings.SLOW_QUERY_LOG_FILE:
+        _append_line(settings.SLOW_QUERY_LOG_FILE, json.dumps(record, default=str) + '\n')
+    else:
+        _collection().insert_one(record)
+
+
+def explain_plan(database, command):
+    """summarize_plan() of the command explained with executionStats.
+
+    Explaining a write only plans it; nothing is changed. A command that
+    cannot be explained gets ``{'error': ...}`` instead.
+    """
+    explainable = {key: value for key, value in command.items() if key not in _UNEXPLAINABLE}
+    try:
+        explained = get_db().client[database].command(
+            {'explain': explainable, 'verbosity': 'executionStats'},
+        )
+        return summarize_plan(explained)
+    except (PyMongoError, KeyError) as e:
+        # Some aggregations explain in another layout; the record is still useful
+        return {'error': str(e)}
+
+
+def _collection():
+    global _capped
+    db = get_db()
+    if not _capped:
+        try:
+            db.create_collection(COLLECTION, capped=True, size=settings.SLOW_QUERY_CAPPED_BYTES)
+        except CollectionInvalid:
+            pass
+        _capped = True
+    return db[COLLECTION]
+
+
+def _append_line(path, line):
+    # Opened for each record, so a file rotated away is never written to again;
+    # a single O_APPEND write keeps the workers' lines from interleaving
+    fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        os.write(fd, line.encode())
+    finally:
+        os.close(fd)
+
+
+def read_records(since=None):
+    """Stored records, from the rotating file or the capped collection.
+
+    ``since`` is an aware datetime; older records are skipped. Rotated
+    files next to the records file are read too, compressed or not.
+    """
+    if settings.SLOW_QUERY_LOG_FILE:
+        paths = sorted(glob.glob(f'{glob.escape(settings.SLOW_QUERY_LOG_FILE)}.*'), reverse=True)
+        for path in paths + [settings.SLOW_QUERY_LOG_FILE]:
+            if not os.path.exists(path):
+                continue
+            with (gzip.open(path, 'rt') if path.endswith('.gz') else open(path)) as f:
+                for line in f:
+                    record = json.loads(line)
+                    record['at'] = datetime.datetime.fromisoformat(record['at'])
+                    if since is None or record['at'] >= since:
+                        yield record
+        return
+    query = {'at': {'$gte': since}} if since else {}
+    for record in get_db()[COLLECTION].find(query, {'_id': 0}):
+        record['at'] = record['at'].replace(tzinfo=datetime.timezone.utc)
+        yield record
+
+
+def top_offenders(records, limit=10):
+    """Shapes ranked by the total time their operations took."""
+    offenders = {}
+    for record in records:
+        key = (record['collection'], record['command'], record['shape'])
+        offender = offenders.setdefault(key, {
+            'collection': record['collection'],
+            'command': record['command'],
+            'shape': record['shape'],
+            'count': 0,
+            'total_ms': 0.0,
+            'max_ms': 0.0,
+            'failed': 0,
+            'views': set(),
+            'plan': None,
+            'last_seen': None,
+        })
+        offender['count'] += 1
+        offender['total_ms'] += record['millis']
+        offender['max_ms'] = max(offender['max_ms'], record['millis'])
+        offender['failed'] += bool(record.get('failed'))
+        offender['views'].add(record.get('view') or '-')
+        if offender['last_seen'] is None or record['at'] >= offender['last_seen']:
+            offender['last_seen'] = record['at']
+            offender['plan'] = record.get('plan') or offender['plan']
+    ranked = sorted(offenders.values(), key=lambda offender: offender['total_ms'], reverse=True)[:limit]
+    for offender in ranked:
+        offender['views'] = sorted(offender['views'])
+        offender['mean_ms'] = offender['total_ms'] / offender['count']
+    return ranked
@@ -1,3 +1,1527 @@
-from django.test import TestCase
+import contextlib
+import datetime
+import gzip
+import io
+import json
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
 
-# Create your tests here.
+import openpyxl
+from asgiref.sync import async_to_sync
+from bson import ObjectId
+from django.conf import settings
+from django.contrib.auth import authenticate
+from django.contrib.auth.hashers import check_password, identify_hasher, make_password
+from django.contrib.auth.models import AnonymousUser, User as DjangoUser
+from django.core.cache import cache, caches
+from django.core.management import CommandError, call_command
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from mongoengine import ValidationError, connect, disconnect
+from mongoengine.connection import get_connection
+from mongoengine.context_managers import query_counter
+from pymongo import monitoring
+from pymongo.collection import Collection
+from pymongo.errors import BulkWriteError, PyMongoError
+
+import migrate_to_mongo
+from daily.mongo import _forget_inherited_clients, configure_mongodb, get_async_db, read_preference
+from logs import async_views, caching, jobs
+from logs.async_exports import AsyncExport, aexport_response, afile_chunks, astream_export, awrite_export
+from logs.archive import archived_rows, horizon_for, is_cold, month_days, read_manifest, write_month_file
+from logs.backends import user_cache_key
+from logs.caching import (
+    cached_day, day_cache_stats, day_cache_ttl, etag_for, invalidate_day, mark_immutable, not_modified, timestamp,
+)
+from logs.days import day_from_key, day_key
+from logs.exports import Export, export_response, staff_read_preference
+from logs.mongo_models import DailyLog, DailySummary, EmployeeProfile, MongoSession, User
+from logs.indexes import redundant_indexes, suggest_index, summarize_plan
+from logs.loadtest import run
+from logs.management.commands.backfill_day_keys import newest_first
+from logs.management.commands.bench_endpoints import compare
+from logs.metrics import (
+    REGISTRY, Histogram, MongoCommandTimer, Registry, RequestMetricsMiddleware, RequestTimings, _current, timed,
+)
+from logs.queries import (
+    PAGE_SORT, LogRow, _row_key, decode_cursor, encode_cursor, keyset_page, keyset_page_rows, keyset_query,
+)
+from logs.rollups import summary_changes
+from logs.seed import log_docs, staff_docs
+from logs.sessions import SessionStore as MongoSessionStore
+from logs.slowlog import SlowQueryListener, operation_shape, read_records, top_offenders, write_record
+from logs.search import decode_search_cursor, encode_search_cursor, search_terms, snippet
+from logs.schedule import SCHEDULES, SLOTS, intervals_for, slot_for
+
+
+class MongoTestCase(TestCase):
+    """Runs against a throwaway Mongo database next to the configured one."""
+
+    # Subclasses may connect elsewhere, or with more client options
+    mongo_host = None
+    mongo_options = {}
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        disconnect()
+        cls.mongo_db_name = f"{settings.MONGODB_NAME}_test"
+        client = connect(
+            db=cls.mongo_db_name, host=cls.mongo_host or settings.MONGODB_HOST, serverSelectionTimeoutMS=2000,
+            **cls.mongo_options,
+        )
+        try:
+            client.admin.command('ping')
+        except PyMongoError:
+            disconnect()
+            cls.tearDownClass()
+            raise unittest.SkipTest('MongoDB is not reachable')
+        cls.mongo_client = client
+
+    @classmethod
+    def tearDownClass(cls):
+        if getattr(cls, 'mongo_client', None) is not None:
+            cls.mongo_client.drop_database(cls.mongo_db_name)
+            disconnect()
+        super().tearDownClass()
+
+    def tearDown(self):
+        for document in (DailyLog, DailySummary, EmployeeProfile, User):
+            document.drop_collection()
+        super().tearDown()
+
+    def make_staff(self, n, start=0):
+        users = []
+        for i in range(start, start + n):
+            user = User(
+                username=f"staff{i}",
+                email=f"staff{i}@example.com",
+                password='secret',
+                first_name='Staff',
+                last_name=str(i),
+            ).save()
+            EmployeeProfile(user=user, id_card_number=f"KD{i:04d}").save()
+            users.append(user)
+        return users
+
+    def make_logs(self, users, date, intervals=('08:00 - 08:30', '08:30 - 09:00')):
+        for user in users:
+            for interval in intervals:
+                DailyLog(employee=user, date=date, time_interval=interval, description='Work', status='Ongoing').save()
+
+    def login_admin(self):
+        admin = DjangoUser.objects.create_user(username='admin', password='admin123', is_staff=True)
+        self.client.force_login(admin)
+
+
+class EmployeeResolutionTests(MongoTestCase):
+    date = datetime.datetime(2025, 3, 3)
+
+    def count_queries(self, url):
+        with query_counter() as q:
+            response = self.client.get(url)
+            if hasattr(response, 'streaming_content'):
+                b''.join(response.streaming_content)
+            return response, int(q)
+
+    def test_dashboard_query_count_does_not_grow_with_rows(self):
+        self.login_admin()
+        self.make_logs(self.make_staff(2), self.date)
+        _, few = self.count_queries('/admin_dashboard/?date=2025-03-03')
+
+        self.make_logs(self.make_staff(18, start=2), self.date)
+        response, many = self.count_queries('/admin_dashboard/?date=2025-03-03')
+
+        self.assertEqual(few, many)
+        self.assertEqual(len(response.context['logs']), 40)
+        self.assertContains(response, 'Staff 19')
+
+    def test_export_query_count_does_not_grow_with_rows(self):
+        self.login_admin()
+        self.make_logs(self.make_staff(2), self.date)
+        _, few = self.count_queries('/export_logs_excel/?date=2025-03-03')
+
+        self.make_logs(self.make_staff(18, start=2), self.date)
+        _, many = self.count_queries('/export_logs_excel/?date=2025-03-03')
+
+        self.assertEqual(few, many)
+
+
+class KeysetPaginationTests(MongoTestCase):
+
+    def test_pages_forward_and_back(self):
+        users = self.make_staff(3)
+        intervals = ('08:00 - 08:30', '08:30 - 09:00', '09:00 - 09:30')
+        self.make_logs(users, datetime.datetime(2025, 3, 3), intervals)
+        self.make_logs(users, datetime.datetime(2025, 3, 4), intervals)
+        expected = [log.id for log in DailyLog.objects.order_by('-day', 'slot', 'id')]
+
+        seen, after, prev_cursors = [], None, []
+        while True:
+            page, next_cursor, prev_cursor = keyset_page(DailyLog.objects, after=after, page_size=4)
+            seen += [log.id for log in page]
+            prev_cursors.append(prev_cursor)
+            if not next_cursor:
+                break
+            after = next_cursor
+        self.assertEqual(seen, expected)
+        self.assertIsNone(prev_cursors[0])
+
+        page, next_cursor, prev_cursor = keyset_page(DailyLog.objects, before=prev_cursors[-1], page_size=4)
+        self.assertEqual([log.id for log in page], expected[12:16])
+        self.assertIsNotNone(next_cursor)
+        self.assertIsNotNone(prev_cursor)
+
+    def test_dashboard_page_size_and_cursors(self):
+        self.login_admin()
+        self.make_logs(self.make_staff(3), datetime.datetime(2025, 3, 3))
+        response = self.client.get('/admin_dashboard/?date=2025-03-03&page_size=4')
+
+        self.assertEqual(len(response.context['logs']), 4)
+        self.assertIsNone(response.context['prev_cursor'])
+        response = self.client.get(f"/admin_dashboard/?date=2025-03-03&page_size=4&after={response.context['next_cursor']}")
+        self.assertEqual(len(response.context['logs']), 2)
+        self.assertIsNone(response.context['next_cursor'])
+
+    def test_dashboard_matches_logs_by_day(self):
+        self.login_admin()
+        # Logs saved with a time of day still belong to their calendar day
+        self.make_logs(self.make_staff(1), datetime.datetime(2025, 3, 3, 15, 30))
+        response = self.client.get('/admin_dashboard/?date=2025-03-03')
+        self.assertEqual(len(response.context['logs']), 2)
+        response = self.client.get('/admin_dashboard/?date=2025-03-04')
+        self.assertEqual(len(response.context['logs']), 0)
+
+
+class CursorTests(SimpleTestCase):
+
+    def test_round_trip(self):
+        log = DailyLog(id=ObjectId(), day=20250303, time_interval='08:00 - 08:30', slot=16)
+        self.assertEqual(decode_cursor(encode_cursor(log)), (20250303, 16, log.id))
+
+    def test_log_rows_round_trip(self):
+        row = LogRow({'_id': ObjectId(), 'day': 20250303, 'slot': 16, 'time_interval': '08:00 - 08:30'})
+        self.assertEqual(decode_cursor(encode_cursor(row)), (20250303, 16, row.id))
+        self.assertIsNone(row.description)
+
+    def test_garbage_is_rejected(self):
+        for cursor in ('', 'not-base64!', encode_cursor(DailyLog(id=ObjectId(), time_interval='x'))[:-4]):
+            with self.assertRaises(ValueError):
+                decode_cursor(cursor)
+
+
+class MongoEmployeeBackendTests(MongoTestCase):
+
+    def test_plaintext_password_is_rehashed_on_login(self):
+        user = self.make_staff(1)[0]
+
+        self.assertIsNone(authenticate(id_card='KD0000', password='wrong'))
+        django_user = authenticate(id_card='KD0000', password='secret')
+
+        self.assertEqual(django_user.username, 'staff0')
+        self.assertFalse(django_user.has_usable_password())
+        user.reload()
+        self.assertTrue(user.password.startswith('pbkdf2_sha256$'))
+        self.assertTrue(check_password('secret', user.password))
+        self.assertEqual(authenticate(id_card='KD0000', password='secret'), django_user)
+
+    @override_settings(PASSWORD_HASH_ITERATIONS=1000)
+    def test_outdated_hash_is_upgraded(self):
+        user = self.make_staff(1)[0]
+        user.password = make_password('secret', hasher='pbkdf2_sha1')
+        user.save()
+
+        self.assertIsNotNone(authenticate(id_card='KD0000', password='secret'))
+        user.reload()
+        self.assertTrue(user.password.startswith('pbkdf2_sha256$1000$'))
+
+    def test_unknown_id_card(self):
+        self.assertIsNone(authenticate(id_card='KD9999', password='secret'))
+
+    def test_hash_without_its_hasher_is_not_a_password(self):
+        user = self.make_staff(1)[0]
+        for encoded in (
+            'md5$c29tZXNhbHQ$5ebe2294ecd0e0f08eab7690d2a6ee69',
+            # Listed in PASSWORD_HASHERS, but argon2-cffi may not be installed
+            'argon2$argon2id$v=19$m=102400,t=2,p=8$c29tZXNhbHQ$aGFzaA',
+        ):
+            user.password = encoded
+            user.save()
+            self.assertIsNone(authenticate(id_card='KD0000', password=encoded))
+            self.assertIsNone(authenticate(id_card='KD0000', password='secret'))
+            user.reload()
+            self.assertEqual(user.password, encoded)
+
+    def test_login_view(self):
+        self.make_staff(1)
+        response = self.client.post('/logs/login/', {'login_type': 'staff', 'id_card': 'KD0000', 'password': 'secret'})
+        self.assertRedirects(response, '/daily_log/', fetch_redirect_response=False)
+
+
+class TunablePasswordHasherTests(SimpleTestCase):
+
+    @override_settings(PASSWORD_HASH_ITERATIONS=1000)
+    def test_iterations_come_from_settings(self):
+        encoded = make_password('secret')
+        self.assertTrue(encoded.startswith('pbkdf2_sha256$1000$'))
+        self.assertTrue(check_password('secret', encoded))
+
+        with override_settings(PASSWORD_HASH_ITERATIONS=2000):
+            self.assertTrue(check_password('secret', encoded))
+            self.assertTrue(identify_hasher(encoded).must_update(encoded))
+
+
+LOCMEM_CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    # Sessions and signed-in users; see SESSION_CACHE_ALIAS
+    'sessions': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'sessions'},
+}
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class DayViewCacheTests(MongoTestCase):
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        stats = mock.patch.dict(caching._stats, {'hits': 0, 'misses': 0})
+        stats.start()
+        self.addCleanup(stats.stop)
+        self.user = self.make_staff(1)[0]
+        self.client.force_login(DjangoUser.objects.create_user(username='staff0'))
+
+    def test_reload_is_served_from_cache_until_saved(self):
+        today = timezone.now().date().isoformat()
+        self.client.get(f'/daily_log/?date={today}')
+        with query_counter() as q:
+            response = self.client.get(f'/daily_log/?date={today}')
+            self.assertEqual(q, 0)
+        self.assertEqual(response.context['logs'], [])
+
+        self.client.post(f'/daily_log/?date={today}', {
+            'time_interval': '08:00 - 08:30', 'description': 'Standup', 'status': 'Completed',
+        })
+        response = self.client.get(f'/daily_log/?date={today}')
+        self.assertEqual([log['description'] for log in response.context['logs']], ['Standup'])
+        self.assertEqual(day_cache_stats()['hits'], 1)
+
+
+class FindRecorder(monitoring.CommandListener):
+    """Remembers the server each find on a collection was sent to."""
+
+    def __init__(self):
+        self.finds = []
+
+    def started(self, event):
+        if event.command_name == 'find':
+            self.finds.append((event.command['find'], event.connection_id))
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+    def servers(self, collection):
+        return {server for name, server in self.finds if name == collection}
+
+
+@unittest.skipUnless(os.environ.get('MONGODB_REPLICA_SET_URI'), 'MONGODB_REPLICA_SET_URI is not set')
+@override_settings(CACHES=LOCMEM_CACHES, REPORT_READ_PREFERENCE=read_preference('secondary', 90))
+class ReplicaSetReadTests(MongoTestCase):
+    """Needs a local three-member replica set, for example::
+
+        for port in 27017 27018 27019; do
+            mkdir -p /tmp/rs0-$port && mongod --replSet rs0 --port $port --dbpath /tmp/rs0-$port --fork --logpath /tmp/rs0-$port.log
+        done
+        mongosh --eval "rs.initiate({_id: 'rs0', members: [
+            {_id: 0, host: 'localhost:27017'}, {_id: 1, host: 'localhost:27018'}, {_id: 2, host: 'localhost:27019'}]})"
+        MONGODB_REPLICA_SET_URI='mongodb://localhost:27017,localhost:27018,localhost:27019/?replicaSet=rs0' \\
+            python manage.py test logs.tests.ReplicaSetReadTests
+    """
+
+    recorder = FindRecorder()
+    mongo_host = os.environ.get('MONGODB_REPLICA_SET_URI')
+    # Every member acknowledges the fixtures, so any secondary already has them
+    mongo_options = {'event_listeners': [recorder], 'w': 3}
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.recorder.finds.clear()
+        self.client_db = DailyLog._get_collection().database.client
+
+    def test_dashboard_and_past_exports_read_from_secondaries(self):
+        self.make_logs(self.make_staff(2), datetime.datetime(2025, 3, 3))
+        self.login_admin()
+
+        response = self.client.get('/admin_dashboard/?date=2025-03-03')
+        self.assertEqual(len(response.context['logs']), 4)
+        response = self.client.get('/export_logs_excel/?date=2025-03-03&format=csv')
+        self.assertEqual(len(b''.join(response.streaming_content).splitlines()), 5)
+
+        servers = self.recorder.servers('logs_dailylog') | self.recorder.servers('auth_user')
+        self.assertTrue(servers)
+        self.assertTrue(servers <= self.client_db.secondaries)
+
+    def test_own_day_reads_from_primary(self):
+        self.make_staff(1)
+        self.client.force_login(DjangoUser.objects.create_user(username='staff0'))
+        today = timezone.now().date().isoformat()
+
+        self.client.post(f'/daily_log/?date={today}', {
+            'time_interval': '08:00 - 08:30', 'description': 'Standup', 'status': 'Completed',
+        })
+        response = self.client.get(f'/daily_log/?date={today}')
+        self.assertEqual([log['description'] for log in response.context['logs']], ['Standup'])
+        response = self.client.get(f'/export_staff_logs/?date={today}&format=csv')
+        self.assertIn(b'Standup', b''.join(response.streaming_content))
+
+        self.assertEqual(self.recorder.servers('logs_dailylog'), {self.client_db.primary})
+
+
+class ReadPreferenceTests(SimpleTestCase):
+
+    def test_modes_and_staleness(self):
+        preference = read_preference('secondaryPreferred', 120)
+        self.assertEqual(preference.mongos_mode, 'secondaryPreferred')
+        self.assertEqual(preference.max_staleness, 120)
+        self.assertEqual(read_preference('nearest').max_staleness, -1)
+        with self.assertRaises(ValueError):
+            read_preference('primary', 120)
+        with self.assertRaises(ValueError):
+            read_preference('secondaries')
+
+    @override_settings(REPORT_READ_PREFERENCE=read_preference('secondary', 90))
+    def test_staff_exports_of_today_stay_on_primary(self):
+        today = day_key(timezone.now().date())
+        self.assertEqual(staff_read_preference(today).mongos_mode, 'primary')
+        self.assertEqual(staff_read_preference(None).mongos_mode, 'primary')
+        self.assertEqual(staff_read_preference(today - 1).mongos_mode, 'secondary')
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class DailySummaryTests(MongoTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user = self.make_staff(1)[0]
+        self.client.force_login(DjangoUser.objects.create_user(username='staff0'))
+
+    def save(self, time_interval, status):
+        self.client.post(f'/daily_log/?date={self.today}', {
+            'time_interval': time_interval, 'description': 'Work', 'status': status,
+        })
+
+    def summary(self):
+        return DailySummary.objects.exclude('id').as_pymongo().get(employee=self.user.id)
+
+    def test_saves_move_counts_and_rebuild_agrees(self):
+        self.today = timezone.now().date().isoformat()
+        intervals = intervals_for(timezone.now().date())
+        self.save(intervals[0], 'Ongoing')
+        self.save(intervals[1], 'Pending')
+        self.save(intervals[0], 'Completed')
+
+        summary = self.summary()
+        self.assertEqual(
+            (summary['filled'], summary['ongoing'], summary['pending'], summary['completed']), (2, 0, 1, 1)
+        )
+
+        DailySummary.objects.update(set__filled=0)
+        call_command('rebuild_daily_summary', stdout=io.StringIO())
+        self.assertEqual(self.summary(), summary)
+
+        self.login_admin()
+        response = self.client.get(f'/daily_summary/?date={self.today}').json()
+        self.assertEqual(response['totals']['filled'], 2)
+        self.assertEqual(response['totals']['empty'], len(intervals) - 2)
+        self.assertEqual(response['rows'][0]['staff_name'], 'Staff 0')
+
+
+class SearchTests(MongoTestCase):
+
+    def test_ranked_filtered_and_paged(self):
+        self.login_admin()
+        alice, bob = self.make_staff(2)
+        day = datetime.datetime(2025, 3, 3)
+        for user, intervals, description in (
+            (alice, SCHEDULES['weekday'][:3], 'Budget meeting with finance'),
+            (bob, SCHEDULES['weekday'][:1], 'Meeting about the meeting schedule'),
+        ):
+            for interval in intervals:
+                DailyLog(employee=user, date=day, time_interval=interval, description=description).save()
+        DailyLog(employee=bob, date=day, time_interval=SCHEDULES['weekday'][1], description='Filing').save()
+
+        response = self.client.get('/search/?q=meeting&page_size=3').json()
+        self.assertEqual(len(response['results']), 3)
+        # Two mentions score higher than one
+        self.assertEqual(response['results'][0]['staff_name'], 'Staff 1')
+        self.assertIn('<mark>Meeting</mark>', response['results'][0]['snippet'])
+        response = self.client.get(f"/search/?q=meeting&page_size=3&after={response['next_cursor']}").json()
+        self.assertEqual(len(response['results']), 1)
+        self.assertIsNone(response['next_cursor'])
+
+        response = self.client.get('/search/?q=meeting&id_card=KD0001&date=2025-03-03').json()
+        self.assertEqual(len(response['results']), 1)
+        response = self.client.get('/search/?q=meeting&date=2025-03-04').json()
+        self.assertEqual(response['results'], [])
+
+
+class SnippetTests(SimpleTestCase):
+
+    def test_terms_are_marked_and_escaped(self):
+        terms = search_terms('meet -budget "<b>"')
+        self.assertEqual(terms, ['meet', '<b>'])
+        self.assertEqual(
+            snippet('Meetings & <b> budget', ['meet']),
+            '<mark>Meetings</mark> &amp; &lt;b&gt; budget',
+        )
+
+    def test_long_descriptions_are_cut_around_the_first_match(self):
+        description = 'x ' * 200 + 'deploy' + ' y' * 200
+        excerpt = snippet(description, ['deploy'], length=40)
+        self.assertTrue(excerpt.startswith('…') and excerpt.endswith('…'))
+        self.assertIn('<mark>deploy</mark>', excerpt)
+
+    def test_cursor_round_trip(self):
+        log_id = ObjectId()
+        cursor = encode_search_cursor({'score': 1.2345678901234567, '_id': log_id})
+        self.assertEqual(decode_search_cursor(cursor), (1.2345678901234567, log_id))
+        with self.assertRaises(ValueError):
+            decode_search_cursor(cursor[:-3])
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class BulkSaveTests(MongoTestCase):
+
+    def test_entries_are_saved_in_one_request(self):
+        user = self.make_staff(1)[0]
+        self.client.force_login(DjangoUser.objects.create_user(username='staff0'))
+        today = timezone.now().date()
+        intervals = intervals_for(today)
+        response = self.client.post('/daily_log/bulk/', {
+            'date': today.isoformat(),
+            'entries': [
+                {'time_interval': intervals[0], 'description': 'Standup', 'status': 'Completed'},
+                {'time_interval': intervals[1], 'description': 'Review'},
+                {'time_interval': '03:00 - 03:30', 'description': 'Night shift'},
+                {'time_interval': intervals[0], 'description': 'Standup', 'status': 'Pending'},
+            ],
+        }, content_type='application/json').json()
+
+        self.assertEqual([result['saved'] for result in response['results']], [True, True, False, True])
+        self.assertEqual([result.get('created') for result in response['results']], [True, True, None, False])
+        self.assertEqual([log['status'] for log in response['logs']], ['Pending', 'Ongoing'])
+        summary = DailySummary.objects.exclude('id').as_pymongo().get(employee=user.id)
+        self.assertEqual((summary['filled'], summary['ongoing'], summary['pending']), (2, 1, 1))
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ConditionalDayTests(MongoTestCase):
+
+    def test_past_day_revalidates_to_304(self):
+        user = self.make_staff(1)[0]
+        self.client.force_login(DjangoUser.objects.create_user(username='staff0'))
+        self.make_logs([user], datetime.datetime(2025, 3, 3))
+
+        response = self.client.get('/daily_log/?date=2025-03-03')
+        self.assertIn('private', response['Cache-Control'])
+        etag = response['ETag']
+        response = self.client.get('/daily_log/?date=2025-03-03', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        response = self.client.get('/export_staff_logs/?date=2025-03-03&format=csv')
+        response = self.client.get(
+            '/export_staff_logs/?date=2025-03-03&format=csv', HTTP_IF_NONE_MATCH=response['ETag']
+        )
+        self.assertEqual(response.status_code, 304)
+
+        # Today's page can still change and is not cached by the browser
+        response = self.client.get(f'/daily_log/?date={timezone.now().date().isoformat()}')
+        self.assertFalse(response.has_header('ETag'))
+
+
+class ConditionalResponseTests(SimpleTestCase):
+
+    def test_validators(self):
+        etag = etag_for('staff0', '2025-03-03', '1741000000-2')
+        self.assertEqual(etag, etag_for('staff0', '2025-03-03', '1741000000-2'))
+        self.assertNotEqual(etag, etag_for('staff0', '2025-03-03', '1741000000-3'))
+
+        request = RequestFactory().get('/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(not_modified(request, etag).status_code, 304)
+        self.assertIsNone(not_modified(RequestFactory().get('/'), etag))
+
+        response = mark_immutable(HttpResponse(), etag, timestamp(datetime.datetime(2025, 3, 3, 12)))
+        self.assertEqual(response['Last-Modified'], 'Mon, 03 Mar 2025 12:00:00 GMT')
+        self.assertIn('private', response['Cache-Control'])
+
+
+class BulkSaveRequestTests(TestCase):
+
+    def setUp(self):
+        self.client.force_login(DjangoUser.objects.create_user(username='staff0'))
+
+    def test_malformed_body_is_rejected(self):
+        for body in ('not json', '{"date": "2025-03-03"}', '{"date": "03/03/2025", "entries": []}'):
+            response = self.client.post('/daily_log/bulk/', body, content_type='application/json')
+            self.assertEqual(response.status_code, 400)
+
+    def test_previous_days_cannot_be_edited(self):
+        yesterday = timezone.now().date() - datetime.timedelta(days=1)
+        response = self.client.post('/daily_log/bulk/', {
+            'date': yesterday.isoformat(), 'entries': [],
+        }, content_type='application/json')
+        self.assertEqual(response.status_code, 403)
+
+
+class RollupTests(SimpleTestCase):
+
+    def test_summary_changes(self):
+        self.assertEqual(summary_changes(None, 'Ongoing', created=True), {'filled': 1, 'ongoing': 1})
+        self.assertEqual(summary_changes('Ongoing', 'Completed', created=False), {'ongoing': -1, 'completed': 1})
+        self.assertEqual(summary_changes('Pending', 'Pending', created=False), {})
+        self.assertEqual(summary_changes('Pending', 'Bogus', created=False), {'pending': -1})
+
+
+@override_settings(CACHES=LOCMEM_CACHES, DAY_CACHE_TTL=60, DAY_CACHE_PAST_TTL=3600)
+class CachedDayTests(SimpleTestCase):
+
+    def setUp(self):
+        cache.clear()
+        stats = mock.patch.dict(caching._stats, {'hits': 0, 'misses': 0})
+        stats.start()
+        self.addCleanup(stats.stop)
+        self.loads = 0
+
+    def loader(self, username, date):
+        self.loads += 1
+        return {'user': {'username': username}, 'logs': []} if username != 'ghost' else None
+
+    def test_read_through_and_invalidation(self):
+        today = timezone.now().date()
+        cached_day('staff0', today, self.loader)
+        cached_day('staff0', today, self.loader)
+        self.assertEqual(self.loads, 1)
+
+        invalidate_day('staff0', today)
+        cached_day('staff0', today, self.loader)
+        self.assertEqual(self.loads, 2)
+        self.assertEqual(day_cache_stats(), {'pid': os.getpid(), 'hits': 1, 'misses': 2, 'hit_ratio': 1 / 3})
+
+    def test_missing_users_are_not_cached(self):
+        today = timezone.now().date()
+        self.assertIsNone(cached_day('ghost', today, self.loader))
+        self.assertIsNone(cached_day('ghost', today, self.loader))
+        self.assertEqual(self.loads, 2)
+
+    def test_past_days_live_longer(self):
+        today = timezone.now().date()
+        self.assertEqual(day_cache_ttl(today), 60)
+        self.assertEqual(day_cache_ttl(today - datetime.timedelta(days=1)), 3600)
+
+
+class ScheduleTests(SimpleTestCase):
+
+    def test_day_types(self):
+        monday, saturday, sunday = datetime.date(2025, 3, 3), datetime.date(2025, 3, 8), datetime.date(2025, 3, 9)
+        self.assertEqual(len(intervals_for(monday)), 18)
+        self.assertEqual(intervals_for(monday)[0], '08:00 - 08:30')
+        self.assertEqual(intervals_for(monday)[-1], '16:30 - 17:00')
+        self.assertEqual(intervals_for(saturday), SCHEDULES['saturday'])
+        self.assertEqual(intervals_for(saturday)[-1], '13:30 - 14:00')
+        self.assertEqual(intervals_for(sunday), intervals_for(monday))
+
+    def test_slots_sort_like_intervals(self):
+        self.assertEqual(sorted(SLOTS, key=SLOTS.get), sorted(SLOTS))
+        self.assertEqual(slot_for('08:00 - 08:30'), 16)
+        self.assertIsNone(slot_for('07:00 - 07:30'))
+
+    def test_schedule_is_immutable(self):
+        with self.assertRaises(TypeError):
+            SLOTS['07:00 - 07:30'] = 14
+
+    def test_log_validation(self):
+        log = DailyLog(employee=ObjectId(), date=datetime.datetime(2025, 3, 8), time_interval='16:00 - 16:30', description='x')
+        with self.assertRaises(ValidationError):
+            log.validate()
+
+        log.time_interval = '09:00 - 09:30'
+        log.validate()
+        self.assertEqual(log.slot, 18)
+        self.assertEqual(log.day, 20250308)
+
+
+class DayKeyTests(SimpleTestCase):
+
+    def test_day_key(self):
+        self.assertEqual(day_key('2025-03-08'), 20250308)
+        self.assertEqual(day_key(datetime.date(2025, 3, 8)), 20250308)
+        self.assertEqual(day_key(datetime.datetime(2025, 12, 31, 23, 59)), 20251231)
+        self.assertEqual(day_from_key(20251231), datetime.date(2025, 12, 31))
+
+    def test_malformed_dates_are_rejected(self):
+        for value in ('', '08/03/2025', '2025-02-30'):
+            with self.assertRaises(ValueError):
+                day_key(value)
+
+
+class IndexAuditTests(SimpleTestCase):
+
+    def test_redundant_prefixes_are_flagged(self):
+        information = {
+            '_id_': {'key': [('_id', 1)]},
+            'employee_1': {'key': [('employee', 1)]},
+            'date_1': {'key': [('date', 1)]},
+            'time_interval_1': {'key': [('time_interval', 1)]},
+            'employee_1_date_1_time_interval_1': {
+                'key': [('employee', 1), ('date', 1), ('time_interval', 1)], 'unique': True,
+            },
+            'date_-1_slot_1__id_1': {'key': [('date', -1), ('slot', 1), ('_id', 1)]},
+        }
+        self.assertEqual(redundant_indexes(information), [
+            ('employee_1', 'employee_1_date_1_time_interval_1'),
+            ('date_1', 'date_-1_slot_1__id_1'),
+        ])
+
+    def test_suggestion_puts_equality_before_sort_before_range(self):
+        spec = {
+            'filter': {'employee': 1, 'date': {'$gte': 1, '$lte': 2}},
+            'sort': [('slot', 1)],
+        }
+        self.assertEqual(suggest_index(spec), [('employee', 1), ('slot', 1), ('date', 1)])
+
+    def test_plan_summary(self):
+        plan = summarize_plan({
+            'queryPlanner': {'winningPlan': {'stage': 'SORT', 'inputStage': {'stage': 'COLLSCAN'}}},
+            'executionStats': {'nReturned': 3, 'totalKeysExamined': 0, 'totalDocsExamined': 9, 'executionTimeMillis': 1},
+        })
+        self.assertTrue(plan['collscan'])
+        self.assertTrue(plan['in_memory_sort'])
+        self.assertIsNone(plan['index'])
+        self.assertEqual(plan['docs_examined'], 9)
+
+
+class ArchiveTests(MongoTestCase):
+
+    def setUp(self):
+        super().setUp()
+        archive_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, archive_dir)
+        settings_override = override_settings(ARCHIVE_DIR=archive_dir, CACHES=LOCMEM_CACHES)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def test_archived_days_are_still_read(self):
+        users = self.make_staff(2)
+        self.make_logs(users, datetime.datetime(2024, 1, 15))
+        self.make_logs(users, datetime.datetime(2024, 2, 1))
+        call_command('archive_logs', before='2024-02-10', stdout=io.StringIO())
+
+        self.assertEqual(DailyLog.objects.count(), 4)
+        self.assertEqual(read_manifest()['months']['2024-01']['count'], 4)
+        self.assertTrue(is_cold(20240131))
+        self.assertFalse(is_cold(20240201))
+
+        self.login_admin()
+        response = self.client.get('/admin_dashboard/?date=2024-01-15&page_size=3')
+        self.assertEqual(len(response.context['logs']), 3)
+        self.assertEqual(response.context['logs'][0].staff_name, 'Staff 0')
+        response = self.client.get(f"/admin_dashboard/?date=2024-01-15&page_size=3&after={response.context['next_cursor']}")
+        self.assertEqual(len(response.context['logs']), 1)
+
+        response = self.client.get('/export_logs_excel/?format=csv')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual([line.split(',')[1] for line in lines[1:]], ['2024-02-01'] * 4 + ['2024-01-15'] * 4)
+
+        # Archiving again is a no-op
+        call_command('archive_logs', before='2024-02-10', stdout=io.StringIO())
+        self.assertEqual(read_manifest()['months']['2024-01']['count'], 4)
+
+    def test_days_are_cold_before_they_leave_the_collection(self):
+        users = self.make_staff(2)
+        self.make_logs(users, datetime.datetime(2024, 1, 15))
+        self.make_logs(users, datetime.datetime(2024, 2, 1))
+        delete_many = Collection.delete_many
+        checked = []
+
+        def checked_delete_many(collection, *args, **kwargs):
+            # A reader in the middle of the run finds the month in its file
+            self.assertTrue(is_cold(20240115))
+            self.assertEqual(len(list(archived_rows(20240115, 20240115))), 4)
+            checked.append(True)
+            return delete_many(collection, *args, **kwargs)
+
+        with mock.patch.object(Collection, 'delete_many', checked_delete_many):
+            call_command('archive_logs', before='2024-02-10', stdout=io.StringIO())
+        self.assertTrue(checked)
+
+    def test_rebuild_keeps_summaries_of_archived_months(self):
+        users = self.make_staff(2)
+        self.make_logs(users, datetime.datetime(2024, 1, 15))
+        self.make_logs(users, datetime.datetime(2024, 2, 1))
+        call_command('rebuild_daily_summary', stdout=io.StringIO())
+        call_command('archive_logs', before='2024-02-10', stdout=io.StringIO())
+
+        # A log that lost its summary, and a summary that lost its logs
+        DailySummary.objects(day=20240201).update(set__filled=0)
+        DailyLog.objects(day=20240201, employee=users[1]).delete()
+        call_command('rebuild_daily_summary', stdout=io.StringIO())
+
+        self.assertEqual(sorted(DailySummary.objects(day=20240115).values_list('filled')), [2, 2])
+        self.assertEqual(list(DailySummary.objects(day=20240201).values_list('employee', 'filled')), [(users[0], 2)])
+
+    def test_current_month_is_not_archived(self):
+        for before in (datetime.date.today(), datetime.date.today() + datetime.timedelta(days=40)):
+            with self.assertRaisesMessage(CommandError, 'first day of the current month'):
+                call_command('archive_logs', before=before.isoformat(), stdout=io.StringIO())
+        self.assertEqual(read_manifest()['horizon'], None)
+
+
+class DayKeyBackfillTests(MongoTestCase):
+
+    def test_colliding_legacy_logs_are_reported_then_merged(self):
+        user = self.make_staff(1)[0]
+        collection = DailyLog._get_collection()
+
+        def legacy_log(date, updated_at, time_interval, description):
+            collection.insert_one({
+                'employee': user.id, 'date': date, 'time_interval': time_interval, 'description': description,
+                'status': 'Ongoing', 'updated_at': updated_at,
+            })
+
+        # The same interval of the same day, saved at midnight and later in the day
+        legacy_log(datetime.datetime(2025, 3, 3), datetime.datetime(2025, 3, 3, 9), '08:00 - 08:30', 'First')
+        legacy_log(datetime.datetime(2025, 3, 3, 8), datetime.datetime(2025, 3, 3, 10), '08:00 - 08:30', 'Second')
+        legacy_log(datetime.datetime(2025, 3, 3, 8), datetime.datetime(2025, 3, 3, 10), '08:30 - 09:00', 'Other')
+
+        out = io.StringIO()
+        call_command('backfill_day_keys', stdout=out)
+        self.assertIn('2 log(s) left without a day', out.getvalue())
+        self.assertEqual(collection.count_documents({'day': 20250303}), 1)
+
+        call_command('backfill_day_keys', merge=True, stdout=io.StringIO())
+        self.assertEqual(collection.count_documents({}), 2)
+        self.assertEqual(collection.find_one({'time_interval': '08:00 - 08:30'})['description'], 'Second')
+        self.assertEqual(collection.count_documents({'day': 20250303}), 2)
+
+
+class CollisionOrderTests(SimpleTestCase):
+
+    def test_newest_update_is_kept(self):
+        older, newer, undated = ObjectId(), ObjectId(), ObjectId()
+        logs = [
+            {'_id': undated},
+            {'_id': newer, 'updated_at': datetime.datetime(2025, 3, 3, 10)},
+            {'_id': older, 'updated_at': datetime.datetime(2025, 3, 3, 9)},
+        ]
+        self.assertEqual([log['_id'] for log in newest_first(logs)], [newer, older, undated])
+
+
+class ArchiveFileTests(SimpleTestCase):
+
+    def setUp(self):
+        archive_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, archive_dir)
+        settings_override = override_settings(ARCHIVE_DIR=archive_dir)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.archive_dir = archive_dir
+        self.employees = [ObjectId(), ObjectId()]
+        self.rows = [
+            {'_id': ObjectId(), 'employee': employee, 'day': day, 'slot': slot, 'description': f'{day}/{slot}'}
+            for day in (20240102, 20240103, 20240105)
+            for slot in (0, 1)
+            for employee in self.employees
+        ]
+        self.rows.sort(key=lambda doc: (doc['day'], doc['slot'], doc['_id']))
+
+    def write_manifest(self, entry):
+        with open(os.path.join(self.archive_dir, 'manifest.json'), 'w') as f:
+            json.dump({'horizon': 20240201, 'months': {'2024-01': entry}}, f)
+
+    def check_reads(self):
+        self.assertEqual(list(archived_rows()), self.rows)
+        newest_first = sorted(self.rows, key=lambda doc: (-doc['day'], doc['slot'], doc['_id']))
+        self.assertEqual(list(archived_rows(newest_first=True)), newest_first)
+        self.assertEqual(
+            [doc['day'] for doc in archived_rows(20240103, 20240104, self.employees[0])], [20240103, 20240103],
+        )
+
+    def test_days_are_read_from_their_own_member(self):
+        sha256, days = write_month_file('2024-01.ndjson.gz', self.rows)
+        self.assertEqual(sorted(days), ['20240102', '20240103', '20240105'])
+        self.write_manifest({'file': '2024-01.ndjson.gz', 'first_day': 20240102, 'last_day': 20240105,
+                             'days': days, 'sha256': sha256})
+        self.check_reads()
+
+        # The file is still one valid gzip stream
+        with gzip.open(os.path.join(self.archive_dir, '2024-01.ndjson.gz'), 'rt') as f:
+            self.assertEqual(len(f.readlines()), len(self.rows))
+
+
+class DatadumpTests(SimpleTestCase):
+
+    def test_records_crossing_read_boundaries(self):
+        records = [
+            {'model': 'logs.dailylog', 'pk': pk, 'fields': {'description': text, 'status': 'Ongoing'}}
+            for pk, text in enumerate(['Plain', 'Brackets ] and braces }, "quoted"', 'Café\nsecond line', ''])
+        ]
+        path = os.path.join(tempfile.mkdtemp(), 'datadump.json')
+        self.addCleanup(shutil.rmtree, os.path.dirname(path))
+        with open(path, 'w', encoding='utf-8-sig') as f:
+            json.dump(records, f, indent=2, ensure_ascii=False)
+
+        for read_size in (1, 3, 7, 64 * 1024):
+            self.assertEqual(list(migrate_to_mongo.iter_datadump(path, read_size=read_size)), records)
+
+    def test_rejected_upserts_are_counted(self):
+        collection = mock.Mock()
+        collection.bulk_write.side_effect = BulkWriteError({
+            'nUpserted': 1,
+            'writeErrors': [
+                {'index': 1, 'code': 11000, 'errmsg': 'duplicate key'},
+                {'index': 2, 'code': 121, 'errmsg': 'Document failed validation'},
+            ],
+        })
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.assertEqual(migrate_to_mongo.bulk_upsert(collection, [1, 2, 3], 'Logs'), (1, 1))
+
+
+class MigrationTests(MongoTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user = self.make_staff(1)[0]
+        self.addCleanup(lambda: migrate_to_mongo.checkpoint_collection().drop())
+        self.logs = [
+            {'employee': 1, 'date': date, 'time_interval': interval, 'description': 'Work', 'status': 'Ongoing',
+             'created_at': '2025-01-06 09:00:00.000000'}
+            for date in ('2025-01-06', '2025-02-03') for interval in ('08:00 - 08:30', '08:30 - 09:00')
+        ]
+
+        def source_records(model):
+            return iter(self.logs if model == 'logs.dailylog' else [])
+
+        for patcher in (
+            mock.patch.object(migrate_to_mongo, 'iter_source_records', source_records),
+            mock.patch.object(migrate_to_mongo, 'source_fingerprint', return_value='test'),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def migrate(self):
+        with contextlib.redirect_stdout(io.StringIO()):
+            return migrate_to_mongo.migrate_daily_logs({1: self.user.id})
+
+    def test_checkpointed_partitions_are_skipped(self):
+        self.assertEqual(self.migrate(), 4)
+        self.assertEqual(
+            sorted(doc['_id'] for doc in migrate_to_mongo.checkpoint_collection().find()), ['2025-01', '2025-02'],
+        )
+
+        DailyLog.drop_collection()
+        self.assertEqual(self.migrate(), 0)
+        self.assertEqual(DailyLog.objects.count(), 0)
+
+    def test_interrupted_partition_is_redone(self):
+        daily_log_operation = migrate_to_mongo.daily_log_operation
+
+        def interrupted(fields, user_map):
+            if fields['date'].startswith('2025-02'):
+                raise ConnectionError('lost the primary')
+            return daily_log_operation(fields, user_map)
+
+        with mock.patch.object(migrate_to_mongo, 'daily_log_operation', interrupted):
+            with self.assertRaisesMessage(RuntimeError, '2025-02'):
+                self.migrate()
+        self.assertEqual([doc['_id'] for doc in migrate_to_mongo.checkpoint_collection().find()], ['2025-01'])
+
+        # Rejected writes leave the month unfinished too
+        with mock.patch.object(migrate_to_mongo, 'bulk_upsert', return_value=(1, 1)):
+            with self.assertRaisesMessage(RuntimeError, '2025-02'):
+                self.migrate()
+        self.assertEqual(migrate_to_mongo.checkpoint_collection().count_documents({}), 1)
+
+        self.assertEqual(self.migrate(), 2)
+        self.assertEqual(DailyLog.objects.count(), 4)
+
+    def test_dry_run_writes_nothing(self):
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            migrate_to_mongo.main(['--dry-run', '--workers', '2'])
+        self.assertIn('2025-02: 2 logs (pending)', out.getvalue())
+        self.assertEqual(DailyLog.objects.count(), 0)
+        self.assertEqual(User.objects.count(), 1)
+        self.assertEqual(migrate_to_mongo.checkpoint_collection().count_documents({}), 0)
+
+
+class InMemoryPageTests(SimpleTestCase):
+
+    def test_pages_like_keyset_page(self):
+        rows = [
+            LogRow({'_id': ObjectId(), 'day': day, 'slot': slot})
+            for day in (20240101, 20240102) for slot in (16, 17, 18)
+        ]
+        with mock.patch('logs.queries.load_employees', return_value={}):
+            first, next_cursor, prev_cursor = keyset_page_rows(rows, page_size=4)
+            self.assertEqual([(row.day, row.slot) for row in first], [(20240102, 16), (20240102, 17), (20240102, 18), (20240101, 16)])
+            self.assertIsNone(prev_cursor)
+            second, next_cursor, prev_cursor = keyset_page_rows(rows, after=next_cursor, page_size=4)
+            self.assertEqual(len(second), 2)
+            self.assertIsNone(next_cursor)
+            back, _, _ = keyset_page_rows(rows, before=prev_cursor, page_size=4)
+            self.assertEqual([row.id for row in back], [row.id for row in first])
+
+    def test_horizon_is_a_month_start(self):
+        self.assertEqual(horizon_for(datetime.date(2025, 3, 20), 30), 20250201)
+        self.assertEqual(month_days('2025-02'), (20250201, 20250231))
+
+
+class StreamExportTests(SimpleTestCase):
+
+    def export(self):
+        def rows():
+            yield ['Staff 0', '2025-03-03', '08:00 - 08:30', 'Reports, "Q1"', 'Ongoing']
+            yield ['Staff 1', '2025-03-03', '08:30 - 09:00', 'Café', 'Completed']
+        return Export(
+            'Staff Logs', ['Staff Name', 'Date', 'Time Interval', 'Description', 'Status'],
+            'all_staff_logs_2025-03-03.xlsx', rows, lambda: 2,
+        )
+
+    def body(self, response):
+        return b''.join(response.streaming_content)
+
+    def test_csv(self):
+        response = export_response(self.export(), 'csv')
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename=all_staff_logs_2025-03-03.csv')
+        lines = self.body(response).decode().splitlines()
+        self.assertEqual(lines[0], 'Staff Name,Date,Time Interval,Description,Status')
+        self.assertEqual(lines[1], 'Staff 0,2025-03-03,08:00 - 08:30,"Reports, ""Q1""",Ongoing')
+
+    def test_gzipped_ndjson(self):
+        response = export_response(self.export(), 'ndjson', gzip=True)
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        lines = gzip.decompress(self.body(response)).decode().splitlines()
+        self.assertEqual(json.loads(lines[1]), {
+            'staff_name': 'Staff 1', 'date': '2025-03-03', 'time_interval': '08:30 - 09:00',
+            'description': 'Café', 'status': 'Completed',
+        })
+
+
+class AsyncPathTests(SimpleTestCase):
+
+    def export(self):
+        async def batches():
+            yield [['Staff 0', '2025-03-03', '08:00 - 08:30', 'Reports, "Q1"', 'Ongoing']]
+            yield [['Staff 1', '2025-03-03', '08:30 - 09:00', 'Café', 'Completed']]
+        return AsyncExport(
+            'Staff Logs', ['Staff Name', 'Date', 'Time Interval', 'Description', 'Status'],
+            'all_staff_logs_2025-03-03.xlsx', batches,
+        )
+
+    def test_stream_matches_sync_export(self):
+        async def body():
+            response = astream_export(self.export(), 'csv', gzip=True)
+            return b''.join([chunk async for chunk in response.streaming_content])
+
+        lines = gzip.decompress(async_to_sync(body)()).decode().splitlines()
+        self.assertEqual(lines[0], 'Staff Name,Date,Time Interval,Description,Status')
+        self.assertEqual(lines[1], 'Staff 0,2025-03-03,08:00 - 08:30,"Reports, ""Q1""",Ongoing')
+        self.assertEqual(len(lines), 3)
+
+    def test_workbook_rows_come_from_the_loop(self):
+        output = async_to_sync(awrite_export)(self.export())
+        ws = openpyxl.load_workbook(output).active
+        self.assertEqual([c.value for c in ws[3]][:2], ['Staff 1', '2025-03-03'])
+
+    def test_workbook_is_streamed_from_worker_threads(self):
+        async def respond():
+            response = await aexport_response(self.export())
+            return response, [chunk async for chunk in response.streaming_content]
+
+        async def read(output):
+            return [chunk async for chunk in afile_chunks(output, chunk_size=4)]
+
+        response, chunks = async_to_sync(respond)()
+        self.assertIsInstance(response, StreamingHttpResponse)
+        self.assertTrue(response.is_async)
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename=all_staff_logs_2025-03-03.xlsx')
+        self.assertEqual(int(response['Content-Length']), len(b''.join(chunks)))
+        ws = openpyxl.load_workbook(io.BytesIO(b''.join(chunks))).active
+        self.assertEqual([c.value for c in ws[2]][:2], ['Staff 0', '2025-03-03'])
+
+        output = io.BytesIO(b'0123456789')
+        self.assertEqual(async_to_sync(read)(output), [b'0123', b'4567', b'89'])
+        self.assertTrue(output.closed)
+
+    def test_job_download_is_streamed(self):
+        jobs_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, jobs_dir)
+        job = {
+            'id': 'b' * 32, 'key': 'key', 'kind': 'staff', 'params': {}, 'owner': 'staff0', 'status': jobs.DONE,
+            'progress': 3, 'total': 3, 'filename': 'my_logs.xlsx', 'error': None,
+        }
+        request = RequestFactory().get(f"/export_jobs/{job['id']}/download/")
+        request.user = mock.Mock(is_authenticated=True, username='staff0', is_staff=False)
+
+        async def download():
+            response = await async_views.download_export_job(request, job['id'])
+            return response, b''.join([chunk async for chunk in response.streaming_content])
+
+        with override_settings(EXPORT_JOBS_DIR=jobs_dir):
+            jobs._write_job(job)
+            with open(jobs.artifact_path(job), 'wb') as f:
+                f.write(b'workbook')
+            response, body = async_to_sync(download)()
+        self.assertTrue(response.is_async)
+        self.assertEqual(body, b'workbook')
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename=my_logs.xlsx')
+
+    def test_anonymous_user_is_sent_to_login(self):
+        request = RequestFactory().get('/daily_log/')
+        request.user = AnonymousUser()
+        response = async_to_sync(async_views.daily_log_view)(request)
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(response.url.startswith(settings.LOGIN_URL))
+
+    def test_backwards_page_is_sought_in_reverse(self):
+        log_id = ObjectId()
+        seek, sort = keyset_query(before=encode_cursor(LogRow({'_id': log_id, 'day': 20250303, 'slot': 17})))
+        self.assertEqual(sort, [('day', 1), ('slot', -1), ('_id', -1)])
+        self.assertEqual(seek['$or'][2], {'day': 20250303, 'slot': 17, '_id': {'$lt': log_id}})
+        self.assertEqual(keyset_query(), ({}, PAGE_SORT))
+
+    def test_pages_continue_past_logs_without_day_or_slot(self):
+        def matches(doc, query):
+            for field, condition in query.items():
+                if field == '$or':
+                    if not any(matches(doc, clause) for clause in condition):
+                        return False
+                    continue
+                value = doc.get(field)
+                if not isinstance(condition, dict):
+                    if value != condition:
+                        return False
+                    continue
+                for operator, operand in condition.items():
+                    # Comparisons only match numbers against numbers, as in MongoDB
+                    if operator == '$ne' and value == operand:
+                        return False
+                    if operator in ('$gt', '$lt') and (value is None or operand is None):
+                        return False
+                    if operator == '$gt' and not value > operand or operator == '$lt' and not value < operand:
+                        return False
+            return True
+
+        docs = [
+            {'_id': ObjectId(), 'day': day, 'slot': slot}
+            for day in (20250304, 20250303, None) for slot in (0, None, 1)
+        ]
+        ordered = [doc['_id'] for doc in sorted(docs, key=lambda doc: _row_key(LogRow(doc)))]
+
+        seen, cursor = [], None
+        while True:
+            seek, _ = keyset_query(after=cursor)
+            rest = sorted((doc for doc in docs if matches(doc, seek)), key=lambda doc: _row_key(LogRow(doc)))
+            if not rest:
+                break
+            page = [LogRow(doc) for doc in rest[:2]]
+            seen += [row.id for row in page]
+            cursor = encode_cursor(page[-1])
+        self.assertEqual(seen, ordered)
+
+        # And back again from the last log
+        seek, _ = keyset_query(before=encode_cursor(LogRow(docs[-1])))
+        self.assertEqual(len([doc for doc in docs if matches(doc, seek)]), len(docs) - 1)
+
+
+class BenchmarkHarnessTests(SimpleTestCase):
+
+    def test_seeded_logs(self):
+        staff = list(staff_docs('seed', 3, 'hash', timezone.now()))
+        self.assertEqual([profile['id_card_number'] for _, profile in staff], ['SEED000000', 'SEED000001', 'SEED000002'])
+        ids = [user['_id'] for user, _ in staff]
+
+        # Monday to Saturday: five full weekdays and a short Saturday
+        logs = list(log_docs(ids, datetime.date(2025, 3, 3), datetime.date(2025, 3, 8), 1, random.Random(1),
+                             datetime.datetime(2025, 3, 9)))
+        self.assertEqual(len(logs), 3 * (5 * 18 + 10))
+        self.assertEqual(len({(log['employee'], log['day'], log['time_interval']) for log in logs}), len(logs))
+        self.assertTrue(all(log['slot'] == slot_for(log['time_interval']) for log in logs))
+        self.assertEqual({log['status'] for log in logs}, {'Completed', 'Ongoing', 'Pending'})
+
+        fewer = list(log_docs(ids, datetime.date(2025, 3, 3), datetime.date(2025, 3, 8), 0.5, random.Random(1),
+                              datetime.datetime(2025, 3, 9)))
+        self.assertLess(len(fewer), len(logs) * 0.7)
+
+    def test_run_counts_failures(self):
+        stats = run(lambda session, index: index % 4 != 0, lambda: None, concurrency=3, total=20)
+        self.assertEqual(stats['requests'], 20)
+        self.assertEqual(stats['errors'], 5)
+        self.assertLessEqual(stats['p50_ms'], stats['p99_ms'])
+
+    def test_compare_with_baseline(self):
+        report = {'endpoints': {'admin_dashboard': {'requests_per_second': 120, 'p95_ms': 40}}}
+        compare(report, {'endpoints': {'admin_dashboard': {'requests_per_second': 100, 'p95_ms': 50}}})
+        self.assertEqual(report['endpoints']['admin_dashboard']['change_percent'], {
+            'requests_per_second': 20.0, 'p95_ms': 20.0,
+        })
+
+
+class RequestMetricsTests(TestCase):
+
+    @override_settings(SERVER_TIMING=True)
+    def test_server_timing_header(self):
+        response = self.client.get('/logs/login/')
+        self.assertRegex(response['Server-Timing'], r'^template;dur=[0-9.]+;desc="1x", total;dur=[0-9.]+$')
+
+        admin = DjangoUser.objects.create_user(username='admin0', is_staff=True)
+        self.client.force_login(admin)
+        caches['sessions'].delete(user_cache_key(admin.pk))
+        response = self.client.get('/metrics/')
+        # The session is cached; the user is read once, then cached too
+        self.assertRegex(response['Server-Timing'], r'^sqlite;dur=[0-9.]+;desc="1x", total')
+        self.assertNotIn('sqlite;', self.client.get('/metrics/')['Server-Timing'])
+
+    @override_settings(SERVER_TIMING=False)
+    def test_no_header_by_default(self):
+        self.assertNotIn('Server-Timing', self.client.get('/logs/login/'))
+
+    @override_settings(METRICS_TOKEN='s3cret')
+    def test_metrics_endpoint(self):
+        self.client.get('/logs/login/')
+        self.assertEqual(self.client.get('/metrics/').status_code, 403)
+        self.assertEqual(self.client.get('/metrics/', HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+
+        response = self.client.get('/metrics/', HTTP_AUTHORIZATION='Bearer s3cret')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('# TYPE daily_request_duration_seconds histogram', response.content.decode())
+        self.assertIn('daily_request_duration_seconds_count{view="login"', response.content.decode())
+
+    def test_streamed_body_is_timed_as_an_export(self):
+        def body():
+            yield b'a'
+            yield b'b'
+
+        middleware = RequestMetricsMiddleware(lambda request: StreamingHttpResponse(body()))
+        before = REGISTRY.requests.get('unmatched', Histogram()).count
+        response = middleware(RequestFactory().get('/'))
+        self.assertEqual(b''.join(response.streaming_content), b'ab')
+        self.assertEqual(REGISTRY.requests['unmatched'].count, before + 1)
+
+    def test_components_are_charged_to_the_current_request(self):
+        timings = RequestTimings()
+        token = _current.set(timings)
+        try:
+            MongoCommandTimer().succeeded(mock.Mock(duration_micros=1500))
+            MongoCommandTimer().failed(mock.Mock(duration_micros=500))
+            with timed('export'):
+                pass
+        finally:
+            _current.reset(token)
+        # Outside a request there is nothing to charge
+        MongoCommandTimer().succeeded(mock.Mock(duration_micros=1500))
+        self.assertEqual(timings.counts['mongo'], 2)
+        self.assertAlmostEqual(timings.seconds['mongo'], 0.002)
+        self.assertEqual(timings.counts['export'], 1)
+
+    def test_histogram_exposition(self):
+        registry = Registry()
+        timings = RequestTimings()
+        timings.add('mongo', 0.03, count=3)
+        registry.record('admin_dashboard', timings, 0.2)
+        registry.record('admin_dashboard', RequestTimings(), 3)
+
+        text = registry.exposition()
+        pid = os.getpid()
+        labels = f'view="admin_dashboard",pid="{pid}"'
+        self.assertIn(f'daily_request_duration_seconds_bucket{{{labels},le="0.1"}} 0', text)
+        self.assertIn(f'daily_request_duration_seconds_bucket{{{labels},le="0.25"}} 1', text)
+        self.assertIn(f'daily_request_duration_seconds_bucket{{{labels},le="+Inf"}} 2', text)
+        self.assertIn(f'daily_request_duration_seconds_sum{{{labels}}} 3.2', text)
+        mongo = f'view="admin_dashboard",component="mongo",pid="{pid}"'
+        self.assertIn(f'daily_request_component_seconds_count{{{mongo}}} 1', text)
+        self.assertIn(f'daily_request_component_operations_total{{{mongo}}} 3', text)
+        self.assertNotIn('component="sqlite"', text)
+
+
+class SlowQueryTests(SimpleTestCase):
+
+    def test_values_are_redacted(self):
+        find = {
+            'find': 'daily_logs',
+            'filter': {'employee': {'$in': [ObjectId(), ObjectId()]}, 'day': {'$gte': 20000, '$lte': 20006}},
+            'sort': {'day': -1, 'slot': 1},
+        }
+        self.assertEqual(json.loads(operation_shape('find', find)), {
+            'filter': {'employee': {'$in': ['?']}, 'day': {'$gte': '?', '$lte': '?'}},
+            'sort': {'day': -1, 'slot': 1},
+        })
+        update = {
+            'update': 'daily_logs',
+            'updates': [{'q': {'employee': ObjectId()}, 'u': {'$set': {'status': 'Completed'}}, 'upsert': True}],
+        }
+        self.assertEqual(json.loads(operation_shape('update', update)), {
+            'filter': [{'q': {'employee': '?'}, 'upsert': True}],
+        })
+
+    def test_only_slow_operations_are_recorded(self):
+        records = []
+        listener = SlowQueryListener(100, records.append)
+        for request_id, micros in ((1, 50_000), (2, 150_000)):
+            command = {'find': 'logs_employeeprofile', 'filter': {'id_card_number': 'KD0001'}}
+            listener.started(mock.Mock(connection_id=('db', 27017), request_id=request_id, command_name='find',
+                                       database_name='daily', command=command))
+            listener.succeeded(mock.Mock(connection_id=('db', 27017), request_id=request_id, command_name='find',
+                                         duration_micros=micros))
+        self.assertEqual(len(records), 1)
+        self.assertEqual(records[0]['collection'], 'logs_employeeprofile')
+        self.assertEqual(records[0]['millis'], 150)
+        self.assertIsNone(records[0]['view'])
+        self.assertNotIn('KD0001', records[0]['shape'])
+        self.assertEqual(listener.started_commands, {})
+
+    def test_rotated_file_and_summary(self):
+        log_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, log_dir)
+        path = os.path.join(log_dir, 'slow.jsonl')
+
+        def record(collection, millis, view):
+            command = {'find': collection, 'filter': {'day': 20000}}
+            return {
+                'at': timezone.now(), 'view': view, 'command': 'find', 'database': 'daily', 'collection': collection,
+                'shape': operation_shape('find', command), 'millis': millis, 'failed': False, '_command': command,
+            }
+
+        with override_settings(SLOW_QUERY_LOG_FILE=path, SLOW_QUERY_EXPLAIN=False):
+            write_record(record('daily_logs', 300, 'admin_dashboard'))
+            # Rotated and compressed, as logrotate would
+            with open(path, 'rb') as f, gzip.open(f'{path}.2.gz', 'wb') as rotated:
+                rotated.write(f.read())
+            os.remove(path)
+            write_record(record('daily_logs', 500, 'export_logs_excel'))
+            os.rename(path, f'{path}.1')
+            write_record(record('daily_summary', 400, 'daily_summary'))
+            offenders = top_offenders(read_records())
+            out = io.StringIO()
+            call_command('slow_queries', stdout=out)
+
+        self.assertEqual([offender['collection'] for offender in offenders], ['daily_logs', 'daily_summary'])
+        self.assertEqual(offenders[0]['count'], 2)
+        self.assertEqual(offenders[0]['total_ms'], 800)
+        self.assertEqual(offenders[0]['views'], ['admin_dashboard', 'export_logs_excel'])
+        self.assertIn('1. find on daily_logs: 800ms in 2 op(s)', out.getvalue())
+
+
+class ExportJobTests(SimpleTestCase):
+
+    def setUp(self):
+        jobs_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, jobs_dir)
+        settings_override = override_settings(EXPORT_JOBS_DIR=jobs_dir, EXPORT_JOB_TTL=60)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.release = threading.Event()
+        self.builds = 0
+        builders = mock.patch.dict(jobs.BUILDERS, {'admin': self.fake_export})
+        builders.start()
+        self.addCleanup(builders.stop)
+
+    def fake_export(self, id_card='', date=''):
+        self.builds += 1
+
+        def rows():
+            self.release.wait(5)
+            for i in range(3):
+                yield [f'row {i}', date]
+
+        return Export('Staff Logs', ['Name', 'Date'], f'all_staff_logs_{date}.xlsx', rows, lambda: 3)
+
+    def wait_for(self, job_id, status):
+        for _ in range(100):
+            job = jobs.read_job(job_id)
+            if job['status'] == status:
+                return job
+            time.sleep(0.05)
+        self.fail(f'Job {job_id} never reached {status}')
+
+    def test_identical_requests_share_one_build(self):
+        first = jobs.submit('admin', {'id_card': '', 'date': '2025-03-03'})
+        second = jobs.submit('admin', {'id_card': '', 'date': '2025-03-03'})
+        other = jobs.submit('admin', {'id_card': '', 'date': '2025-03-04'})
+        self.release.set()
+
+        self.assertEqual(first['id'], second['id'])
+        self.assertNotEqual(first['id'], other['id'])
+        job = self.wait_for(first['id'], jobs.DONE)
+        self.wait_for(other['id'], jobs.DONE)
+        self.assertEqual(self.builds, 2)
+        self.assertEqual(job['progress'], 3)
+
+        ws = openpyxl.load_workbook(jobs.artifact_path(job)).active
+        self.assertEqual([c.value for c in ws[2]], ['row 0', '2025-03-03'])
+
+    def test_finished_jobs_expire(self):
+        self.release.set()
+        job = jobs.submit('admin', {'id_card': '', 'date': '2025-03-03'})
+        self.wait_for(job['id'], jobs.DONE)
+
+        self.assertEqual(jobs.expire_jobs(max_age=60), 0)
+        self.assertEqual(jobs.expire_jobs(max_age=0), 1)
+        self.assertIsNone(jobs.read_job(job['id']))
+
+    def test_stalled_jobs_expire(self):
+        # The build hangs until released, like one whose worker died
+        job = jobs.submit('admin', {'id_card': '', 'date': '2025-03-03'})
+        for _ in range(100):
+            if jobs.read_job(job['id'])['total'] is not None:
+                break
+            time.sleep(0.05)
+
+        self.assertEqual(jobs.expire_jobs(max_age=60), 0)
+        self.assertEqual(jobs.expire_jobs(max_age=0), 1)
+        self.assertIsNone(jobs.read_job(job['id']))
+
+        # An identical request is no longer joined to the stalled build
+        retry = jobs.submit('admin', {'id_card': '', 'date': '2025-03-03'})
+        self.assertNotEqual(retry['id'], job['id'])
+        self.release.set()
+        self.wait_for(retry['id'], jobs.DONE)
+
+        # The stalled build finishing after all does not bring its job back
+        for _ in range(20):
+            self.assertIsNone(jobs.read_job(job['id']))
+            time.sleep(0.02)
+
+
+    def test_finished_pointer_taken_over_meanwhile_is_kept(self):
+        self.release.set()
+        job = jobs.submit('admin', {'id_card': '', 'date': '2025-03-03'})
+        self.wait_for(job['id'], jobs.DONE)
+        pointer = jobs._path(f"{job['key']}.inflight")
+        with open(pointer, 'w') as f:
+            f.write(job['id'])
+        read_job = jobs.read_job
+
+        def read_then_relink(job_id):
+            # Another request replaces the stale pointer with its own build
+            found = read_job(job_id)
+            with open(pointer, 'w') as f:
+                f.write('f' * 32)
+            return found
+
+        with mock.patch.object(jobs, 'read_job', read_then_relink):
+            self.assertIsNone(jobs._inflight_job(pointer))
+        with open(pointer) as f:
+            self.assertEqual(f.read(), 'f' * 32)
+
+
+class ExportJobAccessTests(TestCase):
+
+    def setUp(self):
+        jobs_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, jobs_dir)
+        settings_override = override_settings(EXPORT_JOBS_DIR=jobs_dir)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.client.force_login(DjangoUser.objects.create_user(username='staff0'))
+
+    def test_all_staff_exports_are_for_admins_only(self):
+        response = self.client.post('/export_jobs/', {'kind': 'admin', 'date': '2025-03-03'})
+        self.assertEqual(response.status_code, 403)
+
+        job = {
+            'id': 'a' * 32, 'key': 'key', 'kind': 'admin', 'params': {}, 'owner': None, 'status': jobs.DONE,
+            'progress': 3, 'total': 3, 'filename': 'all_staff_logs_2025-03-03.xlsx', 'error': None,
+        }
+        jobs._write_job(job)
+        self.assertEqual(self.client.get(f"/export_jobs/{job['id']}/").status_code, 404)
+        self.assertEqual(self.client.get(f"/export_jobs/{job['id']}/download/").status_code, 404)
+
+
+class SessionTests(TestCase):
+
+    def setUp(self):
+        self.admin = DjangoUser.objects.create_user(username='admin0', is_staff=True)
+        self.client.force_login(self.admin)
+
+    def test_signed_in_request_makes_no_sqlite_query(self):
+        self.assertEqual(self.client.get('/metrics/').status_code, 200)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get('/metrics/').status_code, 200)
+
+    def test_saving_a_user_drops_the_cached_copy(self):
+        self.client.get('/metrics/')
+        self.admin.is_staff = False
+        self.admin.save()
+        self.assertEqual(self.client.get('/metrics/').status_code, 403)
+
+        self.admin.set_password('changed')
+        self.admin.save()
+        # The session was made for the old password
+        self.assertEqual(self.client.get('/metrics/').status_code, 403)
+        self.assertNotIn('_auth_user_id', self.client.session)
+
+
+class MongoSessionTests(MongoTestCase):
+
+    def tearDown(self):
+        MongoSession.drop_collection()
+        super().tearDown()
+
+    def test_session_round_trip(self):
+        session = MongoSessionStore()
+        session['user'] = 'staff0'
+        session.create()
+        session.save()
+
+        loaded = MongoSessionStore(session.session_key)
+        self.assertEqual(loaded['user'], 'staff0')
+        self.assertTrue(loaded.exists(session.session_key))
+
+        loaded.delete()
+        self.assertFalse(MongoSessionStore(session.session_key).exists(session.session_key))
+        self.assertEqual(MongoSessionStore(session.session_key).load(), {})
+
+
+class MongoConnectionTests(SimpleTestCase):
+
+    def test_configure_does_not_connect(self):
+        configure_mongodb('lazy', 'mongodb://mongo.invalid:27017', alias='lazy', maxPoolSize=7, minPoolSize=None)
+        self.addCleanup(disconnect, 'lazy')
+
+        client = get_connection('lazy')
+        self.assertEqual(client.options.pool_options.max_pool_size, 7)
+
+    def test_forked_child_builds_its_own_client(self):
+        configure_mongodb('forked', 'mongodb://mongo.invalid:27017', alias='forked')
+        self.addCleanup(disconnect, 'forked')
+        inherited = get_connection('forked')
+        self.addCleanup(inherited.close)
+
+        # What os.fork() runs in the child
+        _forget_inherited_clients()
+        self.assertIsNot(get_connection('forked'), inherited)
+
+    def test_async_client_per_event_loop(self):
+        configure_mongodb('async', 'mongodb://mongo.invalid:27017', alias='async')
+        self.addCleanup(disconnect, 'async')
+
+        async def twice():
+            return get_async_db('async'), get_async_db('async')
+
+        first, again = async_to_sync(twice)()
+        self.assertIs(first, again)
+        self.assertEqual(first.name, 'async')
+        _forget_inherited_clients()
+        self.assertIsNot(async_to_sync(twice)()[0], first)
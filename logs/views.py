@@ -1,15 +1,35 @@
 from django.shortcuts import render, redirect
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import login_required
+from django.contrib.auth.hashers import make_password
 from django.contrib import messages
+from django.conf import settings
 from django.contrib.auth.models import User as DjangoUser
-from django.http import HttpResponse
+from django.core.exceptions import PermissionDenied
+from django.http import Http404, HttpResponse, JsonResponse
+from django.urls import reverse
+from django.views.decorators.http import require_POST
 from django.utils import timezone
-from datetime import datetime, time
-import openpyxl
-import io
+from django.utils.crypto import constant_time_compare
+import json
+from datetime import datetime
+from bson import ObjectId
+from pymongo.errors import PyMongoError
+from daily.mongo import warm_up
 from logs.mongo_models import User
 from logs.forms import StaffRegistrationForm
+from logs import jobs
+from logs.exports import EXPORT_FORMATS, admin_export, export_response, staff_export, xlsx_response
+from logs.schedule import intervals_for, is_scheduled, slot_for
+from logs.days import day_from_key, day_key
+from logs.rollups import COUNTERS, day_summaries, empty_slots, save_log, save_logs
+from logs.search import DEFAULT_SEARCH_PAGE_SIZE, search_logs, search_terms, snippet
+from logs.caching import (
+    cached_day, day_cache_stats, day_cache_ttl, etag_for, invalidate_day, mark_immutable, not_modified,
+)
+from logs.archive import archived_rows, is_cold
+from logs.metrics import REGISTRY
+from logs.queries import LogRow, day_view, keyset_page, keyset_page_rows, load_employees, log_rows, staff_name
 from mongoengine.queryset.visitor import Q
 from logs.mongo_models import DailyLog, EmployeeProfile, User as MongoUser
 
@@ -52,36 +72,13 @@ def login_view(request):
             id_card_number = request.POST.get('id_card')
             password = request.POST.get('password')
 
-            try:
-                # Find employee profile by ID card number
-                profile = EmployeeProfile.objects.get(id_card_number=id_card_number)
-                mongo_user = profile.user
-
-                if mongo_user.password == password:
-                    # Create or get Django user for session management
-                    django_user, created = DjangoUser.objects.get_or_create(
-                        username=mongo_user.username,
-                        defaults={
-                            'email': mongo_user.email,
-                            'first_name': mongo_user.first_name,
-                            'last_name': mongo_user.last_name
-                        }
-                    )
-                    if created:
-                        django_user.set_password(password)
-                        django_user.save()
-
-                    # Authenticate and login using Django
-                    user = authenticate(request, username=mongo_user.username, password=password)
-                    if user:
-                        login(request, user)
-                        return redirect('daily_log')
-                    else:
-                        messages.error(request, 'Authentication failed')
-                else:
-                    messages.error(request, 'Invalid credentials')
-            except EmployeeProfile.DoesNotExist:
-                messages.error(request, 'User does not exist')
+            # Profile, user and password are checked against Mongo in one round trip
+            user = authenticate(request, id_card=id_card_number, password=password)
+            if user:
+                login(request, user)
+                return redirect('daily_log')
+            else:
+                messages.error(request, 'Invalid credentials')
 
     return render(request, 'logs/login.html')
 
@@ -90,58 +87,141 @@ def admin_dashboard(request):
     id_card = request.GET.get('id_card', '')
     date = request.GET.get('date', '')
 
-    if not date:
+    try:
+        day = day_key(date)
+    except ValueError:
         date = timezone.now().date().isoformat()
+        day = day_key(date)
 
-    logs = DailyLog.objects(date=date)
+    # A dashboard a few seconds behind is fine, so its scans may go to secondaries
+    reads = settings.REPORT_READ_PREFERENCE
+    logs = DailyLog.objects(day=day).read_preference(reads)
+    employee = None
+    unknown_staff = False
 
     if id_card:
         try:
             profile = EmployeeProfile.objects.get(id_card_number=id_card)
             mongo_user = profile.user
+            employee = mongo_user.id
             logs = logs.filter(employee=mongo_user)
         except EmployeeProfile.DoesNotExist:
             logs = DailyLog.objects.none()
+            unknown_staff = True
             messages.error(request, f'No staff found with ID Card number: {id_card}')
 
+    page_size = dashboard_page_size(request)
+
+    # Seek from the cursor instead of skipping rows; employees of the page are
+    # resolved in one query so the page costs a fixed number of queries
+    page = keyset_page
+    if is_cold(day) and not unknown_staff:
+        # An archived day is read from its month file, and is small enough to page in memory
+        logs = [LogRow(doc) for doc in archived_rows(day, day, employee)] + list(log_rows(logs))
+        page = keyset_page_rows
+    try:
+        rows, next_cursor, prev_cursor = page(
+            logs,
+            after=request.GET.get('after'),
+            before=request.GET.get('before'),
+            page_size=page_size,
+            read_preference=reads,
+        )
+    except ValueError:
+        rows, next_cursor, prev_cursor = page(logs, page_size=page_size, read_preference=reads)
+
     context = {
-        'logs': logs.order_by('-date', 'time_interval'),
+        'logs': rows,
         'id_card': id_card,
         'date': date,
+        'page_size': page_size,
+        'next_cursor': next_cursor,
+        'prev_cursor': prev_cursor,
     }
     return render(request, 'logs/admin_dashboard.html', context)
 
-@login_required
-def daily_log_view(request):
-    selected_date_str = request.GET.get('date', '')
-    if selected_date_str:
+def dashboard_page_size(request, default=None):
+    default = default or settings.DASHBOARD_PAGE_SIZE
+    try:
+        page_size = min(int(request.GET.get('page_size', default)), settings.DASHBOARD_MAX_PAGE_SIZE)
+    except ValueError:
+        page_size = default
+    return max(page_size, 1)
+
+def is_past(date):
+    """Logs of past days are read-only."""
+    return date < timezone.now().date()
+
+def selected_day(value):
+    """The date of a 'YYYY-MM-DD' query parameter, today if it is missing or malformed."""
+    if value:
         try:
-            selected_date = datetime.strptime(selected_date_str, '%Y-%m-%d').date()
+            return datetime.strptime(value, '%Y-%m-%d').date()
         except ValueError:
-            selected_date = timezone.now().date()
-    else:
-        selected_date = timezone.now().date()
+            pass
+    return timezone.now().date()
+
+def formatted_day(date):
+    """A date as '3rd March, 2025'."""
+    # Format date with ordinal suffix
+    day = date.day
+    day_str = str(day).lstrip('0')
     
-    # Check if the selected date is in the past
-    today = timezone.now().date()
-    is_previous_day = selected_date < today
+    if 4 <= day <= 20 or 24 <= day <= 30:
+        suffix = "th"
+    else:
+        suffix = ["st", "nd", "rd"][day % 10 - 1]
     
-    time_intervals = generate_time_intervals(selected_date)
-
-    # Get the Mongo user
-    mongo_user = MongoUser.objects(username=request.user.username).first()
-
-    if not mongo_user:
-        messages.error(request, 'User profile not found. Please contact administrator.')
-        context = {
-            'time_intervals': time_intervals,
+    # Format the month and year
+    month_year = date.strftime('%B, %Y')
+    return f"{day_str}{suffix} {month_year}"
+
+def day_context(selected_date, day_view):
+    """Template context of the daily log page; ``day_view`` is None for an unknown user."""
+    if not day_view:
+        return {
+            'time_intervals': generate_time_intervals(selected_date),
             'logs': [],
             'today': selected_date.strftime('%d %B, %Y'),
             'selected_date': selected_date.isoformat(),
             'user': {'first_name': 'User', 'last_name': ''},
-            'is_previous_day': is_previous_day,
+            'is_previous_day': is_past(selected_date),
+            'day_version': None,
+            'table_cache_ttl': 0,
         }
-        return render(request, 'logs/daily_log.html', context)
+    return {
+        'time_intervals': generate_time_intervals(selected_date),
+        'logs': day_view['logs'],
+        'today': formatted_day(selected_date),
+        'selected_date': selected_date.isoformat(),
+        'user': day_view['user'],
+        'is_previous_day': is_past(selected_date),
+        'day_version': day_view['version'],
+        'table_cache_ttl': day_cache_ttl(selected_date),
+    }
+
+@login_required
+def daily_log_view(request):
+    selected_date = selected_day(request.GET.get('date', ''))
+    
+    # Check if the selected date is in the past
+    is_previous_day = is_past(selected_date)
+
+    # The user and their logs for the day come from the cache when possible
+    day_view = cached_day(request.user.username, selected_date, load_day_view)
+
+    # A past day cannot change any more, so a browser holding the current
+    # version of the page gets a 304 without it being rendered
+    etag = None
+    if day_view and is_previous_day and request.method == 'GET' and not messages.get_messages(request):
+        etag = etag_for(request.user.username, selected_date, day_view['version'])
+        response = not_modified(request, etag, day_view['last_modified'])
+        if response:
+            return response
+
+    if not day_view:
+        messages.error(request, 'User profile not found. Please contact administrator.')
+        return render(request, 'logs/daily_log.html', day_context(selected_date, None))
 
     if request.method == 'POST':
         if is_previous_day:
@@ -152,126 +232,246 @@ def daily_log_view(request):
         description = request.POST.get('description')
         status = request.POST.get('status')
 
-        if time_interval and description and mongo_user:
-            DailyLog.objects(
-                employee=mongo_user,
-                date=selected_date,
-                time_interval=time_interval
-            ).update_one(
-                set__description=description,
-                set__status=status,
-                upsert=True
+        if time_interval and not is_scheduled(selected_date, time_interval):
+            messages.error(request, f'{time_interval} is not a valid time interval for this day.')
+            return redirect(f'{request.path}?date={selected_date}')
+
+        if time_interval and description:
+            # Also moves the day's rollup counters; see logs.rollups
+            save_log(
+                ObjectId(day_view['user']['id']),
+                day_key(selected_date),
+                datetime.combine(selected_date, datetime.min.time()),
+                time_interval,
+                slot_for(time_interval),
+                description,
+                status,
             )
+            invalidate_day(request.user.username, selected_date)
             messages.success(request, 'Log entry saved successfully')
             return redirect(f'{request.path}?date={selected_date}')
 
-    # Get logs for the selected date
-    logs = DailyLog.objects(employee=mongo_user, date=selected_date).order_by('time_interval')
+    response = render(request, 'logs/daily_log.html', day_context(selected_date, day_view))
+    if etag:
+        mark_immutable(response, etag, day_view['last_modified'])
+    return response
 
-    # Format date with ordinal suffix
-    day = selected_date.day
-    day_str = str(day).lstrip('0')
-    
-    if 4 <= day <= 20 or 24 <= day <= 30:
-        suffix = "th"
-    else:
-        suffix = ["st", "nd", "rd"][day % 10 - 1]
-    
-    # Format the month and year
-    month_year = selected_date.strftime('%B, %Y')
-    formatted_date = f"{day_str}{suffix} {month_year}"
+def _entry_error(date, entry):
+    """Why one entry of a bulk save cannot be saved, or None."""
+    if not isinstance(entry, dict):
+        return 'Each entry must be an object'
+    time_interval = entry.get('time_interval')
+    if not time_interval or not is_scheduled(date, time_interval):
+        return f'{time_interval} is not a valid time interval for this day.'
+    if not isinstance(entry.get('description'), str) or not entry['description'].strip():
+        return 'A description is required'
+    if entry.get('status', 'Ongoing') not in dict(DailyLog.STATUS_CHOICES):
+        return f"Unknown status: {entry.get('status')}"
+    return None
 
-    context = {
-        'time_intervals': time_intervals,
-        'logs': logs,
-        'today': formatted_date,
-        'selected_date': selected_date.isoformat(),
-        'user': mongo_user,
-        'is_previous_day': is_previous_day,
-    }
-    return render(request, 'logs/daily_log.html', context)
+@login_required
+@require_POST
+def save_logs_view(request):
+    """Save several intervals of one day from a JSON body with a single bulk write.
 
-def generate_time_intervals(date):
-    intervals = []
-    if date.weekday() == 5:  # Saturday
-        start_hour, end_hour = 9, 14
-    else:
-        start_hour, end_hour = 8, 17
-
-    for hour in range(start_hour, end_hour):
-        for minute in [0, 30]:
-            if hour == end_hour and minute == 30:
-                continue
-            start_time = time(hour, minute)
-            end_minute, end_hour_adjusted = minute + 30, hour
-            if end_minute == 60:
-                end_minute, end_hour_adjusted = 0, hour + 1
-
-            end_time = time(end_hour_adjusted, end_minute)
-            interval_str = f"{start_time.strftime('%H:%M')} - {end_time.strftime('%H:%M')}"
-            intervals.append(interval_str)
-    return intervals
+    Expects ``{"date": "YYYY-MM-DD", "entries": [{"time_interval", "description",
+    "status"}, ...]}`` and answers with a result per entry and the day's logs.
+    """
+    try:
+        payload = json.loads(request.body)
+        selected_date = datetime.strptime(payload['date'], '%Y-%m-%d').date()
+        entries = payload['entries']
+        if not isinstance(entries, list):
+            raise TypeError(entries)
+    except (ValueError, KeyError, TypeError):
+        return JsonResponse({'error': 'Expected {"date": "YYYY-MM-DD", "entries": [...]}'}, status=400)
+
+    if is_past(selected_date):
+        return JsonResponse({'error': 'Cannot modify logs for previous days.'}, status=403)
+
+    day_view = cached_day(request.user.username, selected_date, load_day_view)
+    if not day_view:
+        return JsonResponse({'error': 'User profile not found. Please contact administrator.'}, status=404)
+
+    results, valid = [], []
+    for entry in entries:
+        error = _entry_error(selected_date, entry)
+        result = {'time_interval': entry.get('time_interval') if isinstance(entry, dict) else None, 'saved': not error}
+        results.append(result)
+        if error:
+            result['error'] = error
+            continue
+        valid.append((result, {
+            'time_interval': entry['time_interval'],
+            'description': entry['description'].strip(),
+            'status': entry.get('status', 'Ongoing'),
+        }))
+
+    if valid:
+        created = save_logs(
+            ObjectId(day_view['user']['id']),
+            day_key(selected_date),
+            datetime.combine(selected_date, datetime.min.time()),
+            [entry for _, entry in valid],
+        )
+        for (result, _), was_created in zip(valid, created):
+            result['created'] = was_created
+        invalidate_day(request.user.username, selected_date)
+        day_view = cached_day(request.user.username, selected_date, load_day_view)
+
+    return JsonResponse({'date': selected_date.isoformat(), 'results': results, 'logs': day_view['logs']})
+
+def load_day_view(username, date):
+    """The Mongo user and their logs for one day, as plain data that can be cached."""
+    # Read as raw dicts; nothing here is saved back through the documents
+    mongo_user = MongoUser.objects(username=username).only('username', 'first_name', 'last_name').as_pymongo().first()
+    if not mongo_user:
+        return None
+
+    day = day_key(date)
+    docs = list(DailyLog.objects(employee=mongo_user['_id'], day=day).order_by('slot').only(
+        'time_interval', 'description', 'status', 'updated_at'
+    ).exclude('id').as_pymongo())
+    if is_cold(day):
+        # Archived rows are already in slot order and older than any hot one
+        docs = list(archived_rows(day, day, mongo_user['_id'])) + docs
+    return day_view(mongo_user, docs)
 
 @login_required
-def export_logs_excel(request):
-    logs = DailyLog.objects()
+def day_cache_stats_view(request):
+    if not request.user.is_staff:
+        raise PermissionDenied
+    return JsonResponse(day_cache_stats())
+
+def metrics_view(request):
+    """Request timings of this worker process in the Prometheus text format."""
+    token = settings.METRICS_TOKEN
+    scraper = token and constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {token}')
+    if not (scraper or request.user.is_staff):
+        raise PermissionDenied
+    return HttpResponse(REGISTRY.exposition(), content_type='text/plain; version=0.0.4; charset=utf-8')
 
-    id_card = request.GET.get('id_card', '')
-    date = request.GET.get('date', '')
+@login_required
+def daily_summary_view(request):
+    """Per-staff counts for a day or a date range, read from the daily rollups."""
+    if not request.user.is_staff:
+        raise PermissionDenied
 
-    staff_name_for_filename = ""
-    
-    if id_card:
-        try:
-            profile = EmployeeProfile.objects.get(id_card_number=id_card)
-            mongo_user = profile.user
-            logs = logs.filter(employee=mongo_user)
-            staff_name_for_filename = f"{mongo_user.first_name}_{mongo_user.last_name}" if mongo_user.first_name and mongo_user.last_name else mongo_user.username
-        except EmployeeProfile.DoesNotExist:
-            logs = DailyLog.objects.none()
+    today = timezone.now().date().isoformat()
+    try:
+        first_day = day_key(request.GET.get('start_date') or request.GET.get('date') or today)
+        last_day = day_key(request.GET.get('end_date') or request.GET.get('date') or today)
+    except ValueError:
+        return JsonResponse({'error': 'Dates must be in YYYY-MM-DD format'}, status=400)
+
+    summaries = list(day_summaries(first_day, last_day))
+    employees = load_employees(summary['employee'] for summary in summaries)
+    totals = dict.fromkeys(COUNTERS + ('empty',), 0)
+    rows = []
+    for summary in summaries:
+        row = {counter: summary.get(counter, 0) for counter in COUNTERS}
+        row['empty'] = empty_slots(summary)
+        for counter, value in row.items():
+            totals[counter] += value
+        row.update({
+            'date': day_from_key(summary['day']).isoformat(),
+            'employee_id': str(summary['employee']),
+            'staff_name': staff_name(employees.get(summary['employee'])),
+        })
+        rows.append(row)
+    return JsonResponse({'rows': rows, 'totals': totals})
+
+@login_required
+def search_view(request):
+    """Logs whose description matches ``q``, best matches first, as JSON."""
+    if not request.user.is_staff:
+        raise PermissionDenied
+
+    text = request.GET.get('q', '').strip()
+    if not text:
+        return JsonResponse({'error': 'Missing search text'}, status=400)
+
+    start_date = request.GET.get('start_date') or request.GET.get('date', '')
+    end_date = request.GET.get('end_date') or request.GET.get('date', '')
+    try:
+        first_day = day_key(start_date) if start_date else None
+        last_day = day_key(end_date) if end_date else None
+    except ValueError:
+        return JsonResponse({'error': 'Dates must be in YYYY-MM-DD format'}, status=400)
 
-    if date:
-        logs = logs.filter(date=date)
+    # Narrow to one staff member, by id card or username
+    employee = None
+    id_card = request.GET.get('id_card', '')
+    username = request.GET.get('username', '')
+    if id_card:
+        profile = EmployeeProfile.objects(id_card_number=id_card).only('user').as_pymongo().first()
+        employee = profile['user'] if profile else ObjectId()
+    elif username:
+        user = MongoUser.objects(username=username).only('id').as_pymongo().first()
+        employee = user['_id'] if user else ObjectId()
 
-    wb = openpyxl.Workbook()
-    ws = wb.active
-    ws.title = "Staff Logs"
-    ws.append(['Staff Name', 'Date', 'Time Interval', 'Description', 'Status'])
+    page_size = dashboard_page_size(request, DEFAULT_SEARCH_PAGE_SIZE)
 
-    for log in logs:
-        staff_name_val = (
-            f"{log.employee.first_name} {log.employee.last_name}".strip()
-            if log.employee else "Unknown"
+    try:
+        results, next_cursor = search_logs(
+            text, employee, first_day, last_day, after=request.GET.get('after'), page_size=page_size
         )
-        ws.append([
-            staff_name_val or log.employee.username,
-            log.date.strftime('%Y-%m-%d') if hasattr(log, 'date') and log.date else '',
-            log.time_interval,
-            log.description,
-            log.status
-        ])
-
-    output = io.BytesIO()
-    wb.save(output)
-    output.seek(0)
-
-    # Generate filename based on whether it's for a specific staff or for the day
-    if staff_name_for_filename and date:
-        filename = f"logs_{staff_name_for_filename}_{date}.xlsx"
-    elif staff_name_for_filename:
-        filename = f"logs_{staff_name_for_filename}_{timezone.now().date().isoformat()}.xlsx"
-    elif date:
-        filename = f"all_staff_logs_{date}.xlsx"
-    else:
-        filename = f"all_staff_logs_{timezone.now().date().isoformat()}.xlsx"
+    except ValueError:
+        return JsonResponse({'error': 'Invalid cursor'}, status=400)
+
+    employees = load_employees(result['employee'] for result in results)
+    terms = search_terms(text)
+    return JsonResponse({
+        'results': [
+            {
+                'id': str(result['_id']),
+                'staff_name': staff_name(employees.get(result['employee'])),
+                'date': day_from_key(result['day']).isoformat() if result.get('day') else None,
+                'time_interval': result.get('time_interval'),
+                'status': result.get('status'),
+                'snippet': snippet(result.get('description'), terms),
+                'score': result['score'],
+            }
+            for result in results
+        ],
+        'next_cursor': next_cursor,
+    })
 
-    response = HttpResponse(
-        output.read(),
-        content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-    )
-    response['Content-Disposition'] = f'attachment; filename={filename}'
+def generate_time_intervals(date):
+    # Precomputed once per weekday type; see logs.schedule
+    return intervals_for(date)
+
+def _export_response(request, export, fmt):
+    """export_response() that answers 304 for a past-day export the client already has."""
+    etag = last_modified = None
+    if export.version:
+        last_modified, version = export.version()
+        etag = etag_for(request.user.username, request.get_full_path(), version)
+        response = not_modified(request, etag, last_modified)
+        if response:
+            return response
+    response = export_response(export, fmt, gzip=request.GET.get('gzip') == '1')
+    if etag:
+        mark_immutable(response, etag, last_modified)
     return response
 
+@login_required
+def export_logs_excel(request):
+    id_card = request.GET.get('id_card', '')
+    date = request.GET.get('date', '')
+    fmt = request.GET.get('format', 'xlsx')
+
+    if fmt not in EXPORT_FORMATS:
+        messages.error(request, f'Unknown export format: {fmt}')
+        return redirect('admin_dashboard')
+
+    try:
+        export = admin_export(id_card, date)
+    except ValueError:
+        messages.error(request, f'Invalid date: {date}')
+        return redirect('admin_dashboard')
+    return _export_response(request, export, fmt)
+
 @login_required
 def export_staff_logs(request):
     # Get the current logged-in user's Mongo user
@@ -293,75 +493,98 @@ def export_staff_logs(request):
     start_date = request.GET.get('start_date', '')
     end_date = request.GET.get('end_date', '')
     date = request.GET.get('date', '') 
+    fmt = request.GET.get('format', 'xlsx')
+
+    if fmt not in EXPORT_FORMATS:
+        messages.error(request, f'Unknown export format: {fmt}')
+        return redirect('daily_log')
     
     # Get the current logged-in user's first name
     current_user = request.user
     user_first_name = current_user.first_name if current_user.first_name else current_user.username
     
-    # Start with logs only for the current user
-    logs = DailyLog.objects(employee=mongo_user).order_by('-date', 'time_interval')
-    
-    # Apply date filters
-    if date:
-        logs = logs.filter(date=date)
-    elif start_date and end_date:
-        logs = logs.filter(date__gte=start_date, date__lte=end_date)
-    
-    # Create Excel workbook
-    wb = openpyxl.Workbook()
-    ws = wb.active
-    ws.title = "My Daily Logs"
-    
-    headers = ['Staff Name', 'ID Card Number', 'Date', 'Time Interval', 'Description', 'Status']
-    ws.append(headers)
-    
-    # Add data rows
-    for log in logs:
-        staff_name_val = f"{mongo_user.first_name} {mongo_user.last_name}".strip()
-        if not staff_name_val:
-            staff_name_val = mongo_user.username
-            
-        ws.append([
-            staff_name_val,
-            id_card_number,
-            log.date.strftime('%Y-%m-%d') if hasattr(log, 'date') and log.date else '',
-            log.time_interval,
-            log.description,
-            log.status,           
-        ])
-    
-    # Auto-adjust column widths
-    for column in ws.columns:
-        max_length = 0
-        column_letter = column[0].column_letter
-        for cell in column:
-            try:
-                if len(str(cell.value)) > max_length:
-                    max_length = len(str(cell.value))
-            except:
-                pass
-        adjusted_width = (max_length + 2)
-        ws.column_dimensions[column_letter].width = adjusted_width
-    
-    # Create response
-    output = io.BytesIO()
-    wb.save(output)
-    output.seek(0)
-    
-    # Generate filename with current user's first name and ID card number
-    if date:
-        filename = f"my_logs_{user_first_name}_{date}.xlsx"
-    elif start_date and end_date:
-        filename = f"my_logs_{user_first_name}_{start_date}_to_{end_date}.xlsx"
+    try:
+        export = staff_export(mongo_user, id_card_number, user_first_name, date, start_date, end_date)
+    except ValueError:
+        messages.error(request, 'Dates must be in YYYY-MM-DD format')
+        return redirect('daily_log')
+    return _export_response(request, export, fmt)
+
+@login_required
+@require_POST
+def submit_export_job(request):
+    kind = request.POST.get('kind', 'admin')
+
+    if kind == 'staff':
+        current_user = request.user
+        params = {
+            'username': current_user.username,
+            'first_name': current_user.first_name if current_user.first_name else current_user.username,
+            'date': request.POST.get('date', ''),
+            'start_date': request.POST.get('start_date', ''),
+            'end_date': request.POST.get('end_date', ''),
+        }
+        owner = current_user.username
+    elif kind == 'admin':
+        if not request.user.is_staff:
+            raise PermissionDenied
+        params = {
+            'id_card': request.POST.get('id_card', ''),
+            'date': request.POST.get('date', ''),
+        }
+        # Shared by every admin asking for the same export; _get_job keeps it to staff
+        owner = None
     else:
-        filename = f"my_logs_{user_first_name}_{timezone.now().date().isoformat()}.xlsx"
-    
-    response = HttpResponse(
-        output.read(),
-        content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-    )
-    response['Content-Disposition'] = f'attachment; filename={filename}'
-    return response
+        return JsonResponse({'error': f'Unknown export kind: {kind}'}, status=400)
+
+    for name in ('date', 'start_date', 'end_date'):
+        if params.get(name):
+            try:
+                day_key(params[name])
+            except ValueError:
+                return JsonResponse({'error': f'Invalid {name}: {params[name]}'}, status=400)
+
+    job = jobs.submit(kind, params, owner=owner)
+    return JsonResponse(_job_status(job), status=202)
+
+def _get_job(request, job_id):
+    job = jobs.read_job(job_id)
+    # Staff exports are only visible to the staff member who asked for them,
+    # and all-staff exports to admins
+    if not job or (job['owner'] and job['owner'] != request.user.username):
+        raise Http404('Export job not found')
+    if job['kind'] == 'admin' and not request.user.is_staff:
+        raise Http404('Export job not found')
+    return job
+
+def _job_status(job):
+    status = {
+        'job_id': job['id'],
+        'status': job['status'],
+        'progress': job['progress'],
+        'total': job['total'],
+        'filename': job['filename'],
+        'error': job['error'],
+        'status_url': reverse('export_job_status', args=[job['id']]),
+    }
+    if job['status'] == jobs.DONE:
+        status['download_url'] = reverse('download_export_job', args=[job['id']])
+    return status
+
+@login_required
+def export_job_status(request, job_id):
+    return JsonResponse(_job_status(_get_job(request, job_id)))
+
+@login_required
+def download_export_job(request, job_id):
+    job = _get_job(request, job_id)
+    if job['status'] != jobs.DONE:
+        return JsonResponse(_job_status(job), status=409)
+    try:
+        output = open(jobs.artifact_path(job), 'rb')
+    except FileNotFoundError:
+        raise Http404('Export file has expired')
+    return xlsx_response(output, job['filename'])
 
 @login_required
 def add_staff(request):
@@ -385,7 +608,7 @@ def add_staff(request):
                 user = User(
                     username=form.cleaned_data['username'],
                     email=form.cleaned_data['email'],
-                    password=form.cleaned_data['password'], 
+                    password=make_password(form.cleaned_data['password']),
                     first_name=form.cleaned_data['first_name'],
                     last_name=form.cleaned_data['last_name']
                 )
@@ -402,6 +625,14 @@ def add_staff(request):
     
     return redirect('admin_dashboard')
 
+def readiness(request):
+    # Used by the platform's health check; warming is a no-op once connected
+    try:
+        warm_up()
+    except PyMongoError as e:
+        return JsonResponse({'status': 'unavailable', 'error': str(e)}, status=503)
+    return JsonResponse({'status': 'ready'})
+
 @login_required
 def logout_view(request):
     logout(request)
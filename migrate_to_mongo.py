@@ -1,10 +1,19 @@
 # migrate_to_mongo.py
+import argparse
 import os
 import sys
+import tempfile
+import time
 import django
 import json
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from datetime import datetime
-from bson import ObjectId
+from itertools import islice
+from multiprocessing import get_context
+from statistics import median
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
 
 # Setup Django environment
 project_root = os.path.dirname(os.path.abspath(__file__))
@@ -15,25 +24,124 @@ django.setup()
 
 # Now import your MongoEngine models
 from logs.mongo_models import User, EmployeeProfile, DailyLog
+from logs.days import day_key
+from logs.schedule import slot_for
 from django.contrib.auth.models import User as DjangoUser  # Original Django users
 
+DATADUMP_PATH = os.path.join(project_root, 'datadump.json')
+
+# Number of upserts sent to MongoDB in one bulk_write
+CHUNK_SIZE = 1000
+
+# Write error of an upsert racing another one for the same key; the key is there either way
+DUPLICATE_KEY = 11000
+
+# Finished log partitions are recorded here so a re-run can skip them
+CHECKPOINT_COLLECTION = 'migration_checkpoints'
+
+# Logs per second per worker assumed by --dry-run until a real run has been measured
+DEFAULT_RATE = 2000
+
+def iter_datadump(path=DATADUMP_PATH, read_size=64 * 1024):
+    """Yield the records of a dumpdata JSON array one at a time.
+
+    The file is read in blocks and each object is decoded as soon as it is
+    complete, so memory stays flat however large the dump is.
+    """
+    decoder = json.JSONDecoder()
+    with open(path, 'r', encoding='utf-8-sig') as f:
+        buffer = ''
+        started = False
+        eof = False
+        while True:
+            # Skip the separators between records
+            buffer = buffer.lstrip()
+            if not started and buffer.startswith('['):
+                buffer = buffer[1:].lstrip()
+                started = True
+            if started and buffer.startswith(','):
+                buffer = buffer[1:].lstrip()
+            if started and buffer.startswith(']'):
+                return
+
+            if buffer:
+                try:
+                    item, end = decoder.raw_decode(buffer)
+                except json.JSONDecodeError:
+                    if eof:
+                        raise
+                else:
+                    yield item
+                    buffer = buffer[end:]
+                    continue
+
+            if eof:
+                return
+            block = f.read(read_size)
+            if not block:
+                eof = True
+            buffer += block
+
+
+def has_datadump(path=DATADUMP_PATH):
+    return os.path.exists(path) and os.path.getsize(path) > 0
+
+
+def chunked(iterable, size=CHUNK_SIZE):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def bulk_upsert(collection, operations, label, chunk_size=CHUNK_SIZE):
+    """Send upserts in chunks, printing throughput as it goes.
+
+    Returns the number of documents that were newly inserted and the number
+    of upserts that were rejected, duplicate keys aside.
+    """
+    started = time.monotonic()
+    processed = 0
+    inserted = 0
+    errors = 0
+    for chunk in chunked(operations, chunk_size):
+        try:
+            result = collection.bulk_write(chunk, ordered=False)
+            inserted += result.upserted_count
+        except BulkWriteError as e:
+            inserted += e.details.get('nUpserted', 0)
+            rejected = [error for error in e.details.get('writeErrors', []) if error.get('code') != DUPLICATE_KEY]
+            if rejected:
+                errors += len(rejected)
+                print(f"{label}: {len(rejected)} write errors in chunk, first: {rejected[0].get('errmsg')}")
+        processed += len(chunk)
+        elapsed = time.monotonic() - started
+        print(f"{label}: {processed} processed, {inserted} new ({processed / max(elapsed, 1e-6):.0f}/s)")
+    return inserted, errors
+
+
 def migrate_users():
     """Migrate Django users to MongoEngine User documents"""
     print("Migrating users...")
     
-    django_users = DjangoUser.objects.all()
+    # Load every existing username once instead of checking user by user
+    existing_users = {
+        doc['username']: doc['_id']
+        for doc in User._get_collection().find({}, {'username': 1})
+    }
     user_map = {}  # Store mapping: old_user_id -> new_user_id
     
-    for django_user in django_users:
+    for django_user in DjangoUser.objects.all().iterator():
         if not django_user.email or '@' not in django_user.email:
             print(f"Skipping user {django_user.username}: invalid email")
             continue
 
         # Check if user already exists in MongoDB
-        existing_user = User.objects(username=django_user.username).first()
-        if existing_user:
+        if django_user.username in existing_users:
             print(f"User {django_user.username} already exists in MongoDB")
-            user_map[django_user.id] = existing_user.id
+            user_map[django_user.id] = existing_users[django_user.username]
             continue
             
         # Create new User document
@@ -49,165 +157,243 @@ def migrate_users():
         )
         mongo_user.save()
         user_map[django_user.id] = mongo_user.id
+        existing_users[django_user.username] = mongo_user.id
         print(f"Migrated user: {django_user.username}")
     
     return user_map
 
+def iter_source_records(model):
+    """Yield the fields of every record of a model, from datadump.json or the Django ORM"""
+    if has_datadump():
+        for item in iter_datadump():
+            if item['model'] == model:
+                yield item['fields']
+        return
+
+    print(f"datadump.json is missing or empty, reading {model} through the Django ORM...")
+    if model == 'logs.employeeprofile':
+        from logs.models import EmployeeProfile as DjangoEmployeeProfile
+        for django_profile in DjangoEmployeeProfile.objects.all().iterator():
+            yield {
+                'user': django_profile.user_id,
+                'id_card_number': django_profile.id_card_number,
+            }
+    elif model == 'logs.dailylog':
+        from logs.models import DailyLog as DjangoDailyLog
+        for django_log in DjangoDailyLog.objects.all().iterator():
+            yield {
+                'employee': django_log.employee_id,
+                'date': django_log.date,
+                'time_interval': django_log.time_interval,
+                'description': django_log.description,
+                'status': django_log.status,
+                'created_at': django_log.created_at,
+            }
+
 def migrate_employee_profiles(user_map):
     """Migrate EmployeeProfile data"""
     print("\nMigrating employee profiles...")
-    
+
+    def operations():
+        for fields in iter_source_records('logs.employeeprofile'):
+            if fields['user'] in user_map:
+                # Existing profiles are left untouched
+                yield UpdateOne(
+                    {'id_card_number': fields['id_card_number']},
+                    {'$setOnInsert': {
+                        'user': user_map[fields['user']],
+                        'id_card_number': fields['id_card_number'],
+                    }},
+                    upsert=True,
+                )
+
+    inserted, errors = bulk_upsert(EmployeeProfile._get_collection(), operations(), 'Profiles')
+    if errors:
+        print(f"Profiles: {errors} profile(s) could not be written")
+    return inserted
+
+def parse_log_date(value):
+    if isinstance(value, str):
+        value = datetime.strptime(value, '%Y-%m-%d')
+    return datetime(value.year, value.month, value.day)
+
+def parse_created_at(value):
+    # Parse created_at (handle different formats)
+    if isinstance(value, datetime):
+        return value
+    for fmt in ('%Y-%m-%dT%H:%M:%S.%fZ', '%Y-%m-%d %H:%M:%S.%f'):
+        try:
+            return datetime.strptime(value, fmt)
+        except (TypeError, ValueError):
+            pass
     try:
-        # Try to load from JSON backup first
-        datadump_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'datadump.json')
-        if os.path.exists(datadump_path) and os.path.getsize(datadump_path) > 0:
-            with open('datadump.json', 'r', encoding='utf-8-sig') as f:
-                data = json.load(f)
-        else:
-            print("datadump.json is missing or empty!")
-            data = []
-        
-        profile_count = 0
-        for item in data:
-            if item['model'] == 'logs.employeeprofile':
-                old_user_id = item['fields']['user']
-                if old_user_id in user_map:
-                    # Check if profile already exists
-                    existing_profile = EmployeeProfile.objects(id_card_number=item['fields']['id_card_number']).first()
-                    if existing_profile:
-                        print(f"Profile with card {item['fields']['id_card_number']} already exists")
-                        continue
-                    
-                    # FIX: Get the actual User document, not just the ID
-                    mongo_user = User.objects(id=user_map[old_user_id]).first()
-                    if mongo_user:
-                        profile = EmployeeProfile(
-                            user=mongo_user,  # Pass the document, not the ID
-                            id_card_number=item['fields']['id_card_number']
-                        )
-                        profile.save()
-                        profile_count += 1
-                        print(f"Migrated profile: {item['fields']['id_card_number']}")
-        
-        return profile_count
-        
-    except FileNotFoundError:
-        print("No datadump.json found, trying Django ORM...")
-        from logs.models import EmployeeProfile as DjangoEmployeeProfile
-        
-        profile_count = 0
-        for django_profile in DjangoEmployeeProfile.objects.all():
-            if django_profile.user.id in user_map:
-                # Check if profile already exists
-                existing_profile = EmployeeProfile.objects(id_card_number=django_profile.id_card_number).first()
-                if existing_profile:
-                    print(f"Profile with card {django_profile.id_card_number} already exists")
-                    continue
-                
-                # FIX: Get the actual User document
-                mongo_user = User.objects(id=user_map[django_profile.user.id]).first()
-                if mongo_user:
-                    profile = EmployeeProfile(
-                        user=mongo_user,  # Pass the document, not the ID
-                        id_card_number=django_profile.id_card_number
-                    )
-                    profile.save()
-                    profile_count += 1
-                    print(f"Migrated profile: {django_profile.id_card_number}")
-        
-        return profile_count
-    
-def migrate_daily_logs(user_map):
-    """Migrate DailyLog data"""
-    print("\nMigrating daily logs...")
-    
+        return datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return datetime.now()
+
+def daily_log_operation(fields, user_map):
+    """Upsert keyed on (employee, day, time_interval); existing logs are left untouched"""
+    employee_id = user_map[fields['employee']]
+    log_date = parse_log_date(fields['date'])
+    created_at = parse_created_at(fields.get('created_at'))
+    return UpdateOne(
+        {'employee': employee_id, 'day': day_key(log_date), 'time_interval': fields['time_interval']},
+        {'$setOnInsert': {
+            'date': log_date,
+            'description': fields['description'],
+            'status': fields.get('status') or 'Ongoing',
+            'slot': slot_for(fields['time_interval']),
+            'created_at': created_at,
+            'updated_at': datetime.utcnow(),
+        }},
+        upsert=True,
+    )
+
+def log_partition(fields):
+    """Month a log belongs to, e.g. '2025-09'"""
+    return parse_log_date(fields['date']).strftime('%Y-%m')
+
+def source_fingerprint():
+    """Identifies the data being migrated, so checkpoints from another dump are ignored"""
+    if has_datadump():
+        stat = os.stat(DATADUMP_PATH)
+        return f"datadump:{stat.st_size}:{int(stat.st_mtime)}"
+    return "django-orm"
+
+def checkpoint_collection():
+    return DailyLog._get_db()[CHECKPOINT_COLLECTION]
+
+def finished_partitions(source):
+    return {doc['_id']: doc for doc in checkpoint_collection().find({'source': source})}
+
+def count_partitions():
+    return Counter(log_partition(fields) for fields in iter_source_records('logs.dailylog'))
+
+def spool_partitions(workdir, skip):
+    """Split the logs into one NDJSON file per month, leaving out finished months.
+
+    Returns {partition: (path, record count)}.
+    """
+    files = {}
+    counts = Counter()
     try:
-        # Load from JSON backup
-        with open('datadump.json', 'r') as f:
-            data = json.load(f)
-        
-        log_count = 0
-        for item in data:
-            if item['model'] == 'logs.dailylog':
-                old_employee_id = item['fields']['employee']
-                if old_employee_id in user_map:
-                    # FIX: Get the actual User document for the query
-                    mongo_employee = User.objects(id=user_map[old_employee_id]).first()
-                    if not mongo_employee:
-                        continue
-                    
-                    # Check if log already exists
-                    existing_log = DailyLog.objects(
-                        employee=mongo_employee,  # Use document, not ID
-                        date=datetime.strptime(item['fields']['date'], '%Y-%m-%d').date(),
-                        time_interval=item['fields']['time_interval']
-                    ).first()
-                    
-                    if existing_log:
-                        print(f"Log already exists for {item['fields']['date']} - {item['fields']['time_interval']}")
-                        continue
-                    
-                    # Parse date and time
-                    log_date = datetime.strptime(item['fields']['date'], '%Y-%m-%d').date()                   
-                    # Parse created_at (handle different formats)
+        for fields in iter_source_records('logs.dailylog'):
+            partition = log_partition(fields)
+            if partition in skip:
+                continue
+            if partition not in files:
+                files[partition] = open(os.path.join(workdir, f"{partition}.ndjson"), 'w', encoding='utf-8')
+            files[partition].write(json.dumps(fields, default=str) + '\n')
+            counts[partition] += 1
+    finally:
+        for f in files.values():
+            f.close()
+    return {partition: (files[partition].name, counts[partition]) for partition in files}
+
+def migrate_partition(partition, path, record_count, user_map, source, chunk_size=CHUNK_SIZE):
+    """Migrate one month of logs and record it in the checkpoint collection.
+
+    A month with rejected writes is not recorded, so the next run does it again.
+    """
+    started = time.monotonic()
+
+    def operations():
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                fields = json.loads(line)
+                if fields['employee'] in user_map:
+                    yield daily_log_operation(fields, user_map)
+
+    inserted, errors = bulk_upsert(DailyLog._get_collection(), operations(), f'Daily logs {partition}', chunk_size)
+    if errors:
+        raise RuntimeError(f"{errors} log(s) could not be written")
+
+    elapsed = time.monotonic() - started
+    checkpoint_collection().update_one(
+        {'_id': partition},
+        {'$set': {
+            'source': source,
+            'records': record_count,
+            'inserted': inserted,
+            'seconds': elapsed,
+            'rate': record_count / max(elapsed, 1e-6),
+            'finished_at': datetime.utcnow(),
+        }},
+        upsert=True,
+    )
+    return inserted
+
+def migrate_daily_logs(user_map, workers=1, chunk_size=CHUNK_SIZE):
+    """Migrate DailyLog data, one month per task, skipping months already checkpointed"""
+    print("\nMigrating daily logs...")
+
+    source = source_fingerprint()
+    done = finished_partitions(source)
+    if done:
+        print(f"Skipping {len(done)} partition(s) already migrated: {', '.join(sorted(done))}")
+
+    log_count = 0
+    failed = []
+    with tempfile.TemporaryDirectory() as workdir:
+        partitions = spool_partitions(workdir, skip=done)
+        print(f"{len(partitions)} partition(s) to migrate with {workers} worker(s)")
+        tasks = [
+            (partition, path, record_count, user_map, source, chunk_size)
+            for partition, (path, record_count) in sorted(partitions.items())
+        ]
+
+        if workers <= 1:
+            for task in tasks:
+                try:
+                    log_count += migrate_partition(*task)
+                except Exception as e:
+                    failed.append(task[0])
+                    print(f"Partition {task[0]} failed: {e}")
+        else:
+            # Spawned workers open their own MongoDB connection instead of
+            # inheriting this process's client through fork
+            with ProcessPoolExecutor(max_workers=workers, mp_context=get_context('spawn')) as pool:
+                futures = {pool.submit(migrate_partition, *task): task[0] for task in tasks}
+                for future in as_completed(futures):
                     try:
-                        created_at = datetime.strptime(item['fields']['created_at'], '%Y-%m-%dT%H:%M:%S.%fZ')
-                    except ValueError:
-                        try:
-                            created_at = datetime.strptime(item['fields']['created_at'], '%Y-%m-%d %H:%M:%S.%f')
-                        except ValueError:
-                            created_at = datetime.now()
-                    
-                    log = DailyLog(
-                        employee=mongo_employee,  # Use document, not ID
-                        date=log_date,
-                        time_interval=item['fields']['time_interval'],
-                        description=item['fields']['description'],
-                        status=item['fields']['status'],
-                        created_at=created_at
-                    )
-                    log.save()
-                    log_count += 1
-                    print(f"Migrated log: {item['fields']['date']} - {item['fields']['time_interval']}")
-        
-        return log_count
-        
-    except FileNotFoundError:
-        print("No datadump.json found, trying Django ORM...")
-        from logs.models import DailyLog as DjangoDailyLog
-        
-        log_count = 0
-        for django_log in DjangoDailyLog.objects.all():
-            if django_log.employee.id in user_map:
-                # FIX: Get the actual User document
-                mongo_employee = User.objects(id=user_map[django_log.employee.id]).first()
-                if not mongo_employee:
-                    continue
-                
-                # Check if log already exists
-                existing_log = DailyLog.objects(
-                    employee=mongo_employee,  # Use document, not ID
-                    date=django_log.date,
-                    time_interval=django_log.time_interval
-                ).first()
-                
-                if existing_log:
-                    print(f"Log already exists for {django_log.date} - {django_log.time_interval}")
-                    continue
-                
-                log = DailyLog(
-                    employee=mongo_employee,  # Use document, not ID
-                    date=django_log.date,
-                    time_interval=django_log.time_interval,
-                    description=django_log.description,
-                    status=django_log.status,
-                    created_at=django_log.created_at
-                )
-                log.save()
-                log_count += 1
-                print(f"Migrated log: {django_log.date} - {django_log.time_interval}")
-        
-        return log_count
+                        log_count += future.result()
+                    except Exception as e:
+                        failed.append(futures[future])
+                        print(f"Partition {futures[future]} failed: {e}")
+
+    if failed:
+        raise RuntimeError(
+            f"{len(failed)} partition(s) failed: {', '.join(sorted(failed))}. "
+            "Re-run to resume from the last checkpoint."
+        )
+    return log_count
+
+def dry_run(workers=1):
+    """Report what a migration would do, and roughly how long it would take, without writing"""
+    print("Dry run: nothing will be written")
+
+    existing_usernames = set(User.objects.scalar('username'))
+    django_users = DjangoUser.objects.filter(email__contains='@').values_list('username', flat=True)
+    new_users = sum(1 for username in django_users.iterator() if username not in existing_usernames)
+    print(f"- Users to create: {new_users}")
+
+    profile_total = sum(1 for _ in iter_source_records('logs.employeeprofile'))
+    print(f"- Employee profiles in source: {profile_total}")
+
+    source = source_fingerprint()
+    done = finished_partitions(source)
+    counts = count_partitions()
+    print(f"- Daily logs in source: {sum(counts.values())} in {len(counts)} partition(s)")
+    for partition, count in sorted(counts.items()):
+        print(f"  {partition}: {count} logs ({'done' if partition in done else 'pending'})")
+
+    pending = {partition: count for partition, count in counts.items() if partition not in done}
+    rates = [doc['rate'] for doc in done.values() if doc.get('rate')]
+    rate = median(rates) if rates else DEFAULT_RATE
+    parallel = max(min(workers, len(pending)), 1)
+    estimate = sum(pending.values()) / (rate * parallel)
+    print(f"- Estimated time: {estimate:.0f}s for {sum(pending.values())} logs "
+          f"at {rate:.0f} logs/s per worker with {parallel} worker(s)")
     
 def verify_migration():
     """Verify that migration was successful"""
@@ -276,10 +462,31 @@ def cleanup_duplicates():
         EmployeeProfile.objects(id__in=duplicate_profiles).delete()
         print(f"Removed {len(duplicate_profiles)} duplicate profiles")
 
-def main():
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Migrate users, profiles and daily logs to MongoDB")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help="Processes migrating log partitions in parallel")
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE,
+                        help="Upserts per bulk_write")
+    parser.add_argument('--dry-run', action='store_true',
+                        help="Report counts and estimated time without writing anything")
+    parser.add_argument('--reset-checkpoints', action='store_true',
+                        help="Forget finished partitions and migrate every log again")
+    return parser.parse_args(argv)
+
+def main(argv=None):
     """Main migration function"""
+    args = parse_args(argv)
     print("Starting MongoDB migration...")
     print("=" * 50)
+
+    if args.dry_run:
+        dry_run(args.workers)
+        return
+
+    if args.reset_checkpoints:
+        checkpoint_collection().drop()
+        print("Checkpoints cleared")
     
     try:
         # Step 1: Migrate users
@@ -289,7 +496,7 @@ def main():
         profile_count = migrate_employee_profiles(user_map)
         
         # Step 3: Migrate daily logs
-        log_count = migrate_daily_logs(user_map)
+        log_count = migrate_daily_logs(user_map, workers=args.workers, chunk_size=args.chunk_size)
         
         # Step 4: Clean up duplicates
         cleanup_duplicates()
@@ -308,6 +515,7 @@ def main():
         print(f"Migration failed: {e}")
         import traceback
         traceback.print_exc()
+        sys.exit(1)
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()